@@ -15,7 +15,13 @@ import datetime
 import contextlib as ctx
 import shutil
 import glob
+import fnmatch
+import re
+import hashlib
 import subprocess
+import time
+import traceback
+import concurrent.futures
 import f90nml
 import numpy as np
 
@@ -43,6 +49,194 @@ def mkdir(p):
           pass
        else: raise
 
+#helper scripts shared by every case folder, main() copies the ones a run needs into its run folder
+HELPERS=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),'helpers')
+
+#files that get changed in the run folder (patched, or swapped in the production script) so each run gets its own copy
+tmplmutable=['namelist*','file_def*']
+
+#sha1 of files we've already read, keyed by (path,size,mtime)
+sha1cache={}
+
+def sha1sum(f):
+    """sha1 (hex) of the contents of file f, remembered for as long as f doesn't change"""
+    st=os.stat(f)
+    key=(os.path.realpath(f),st.st_size,st.st_mtime_ns)
+    if key not in sha1cache:
+        h=hashlib.sha1()
+        with ctx.closing(open(f,'rb')) as handle:
+            for blk in iter(lambda: handle.read(1<<20),b''):
+                h.update(blk)
+        sha1cache[key]=h.hexdigest()
+    return sha1cache[key]
+
+def reflink(src,dst):
+    """copy-on-write clone of src to dst (only works on file systems that support it, e.g. xfs/btrfs), raises OSError otherwise"""
+    import fcntl
+    FICLONE=0x40049409
+    with ctx.closing(open(src,'rb')) as s, ctx.closing(open(dst,'wb')) as d:
+        try:
+            fcntl.ioctl(d.fileno(),FICLONE,s.fileno())
+        except OSError:
+            d.close()
+            os.remove(dst)
+            raise
+
+def tmplcopy(f,dst,store):
+    """put template file f into run folder path dst via a content-addressed store
+
+    The store holds one (read-only) copy of each distinct file, named by its sha1, and the run folder gets a hardlink to it
+    (or a copy-on-write clone if hardlinks aren't possible, or a plain copy as the last resort). 
+    Files matching tmplmutable are always plain copies as the run changes them.
+
+    :f: template file
+    :dst: destination path (file, not folder)
+    :store: folder of the template store, should be on the same file system as dst
+    :returns: 'link', 'reflink' or 'copy'
+    """
+    if [p for p in tmplmutable if fnmatch.fnmatch(os.path.basename(dst),p)]:
+        shutil.copy2(f,dst)
+        return 'copy'
+
+    sf=store+sha1sum(f)
+    if not os.path.exists(sf):
+        mkdir(store)
+        #rename is atomic, so members being set up at the same time can't see half a file
+        tmp=sf+'.'+str(os.getpid())
+        shutil.copy2(f,tmp)
+        #read-only: writing through one hardlink would change it for every run
+        os.chmod(tmp,os.stat(tmp).st_mode & ~0o222)
+        os.rename(tmp,sf)
+
+    try:
+        os.link(sf,dst)
+        return 'link'
+    except OSError:
+        pass
+    try:
+        reflink(sf,dst)
+        return 'reflink'
+    except OSError:
+        shutil.copy2(sf,dst)
+        return 'copy'
+
+def tmplfolder(ifolder,ofolder,store):
+    """tmplcopy all files (not folders) in ifolder into ofolder, prints what was done"""
+    ifiles=sorted(glob.glob(ifolder+'*'))
+    assert(ifiles!=[]),"glob didn't find anything!"
+    how=[tmplcopy(f,ofolder+os.path.basename(f),store) for f in ifiles if os.path.isfile(f)]
+    print("template files from "+ifolder+': '+', '.join([str(how.count(h))+' '+h for h in ['link','reflink','copy']]))
+
+#parsed namelists, keyed by sha1 of the file, so each distinct namelist is only parsed once
+nmlcache={}
+
+def nmlread(nmlpath):
+    """parse a namelist (f90nml), ensemble members with the same namelist share the parse"""
+    key=sha1sum(nmlpath)
+    if key not in nmlcache:
+        nmlcache[key]=f90nml.read(nmlpath)
+    return nmlcache[key]
+
+def nmlstack(patches):
+    """merge a list of namelist patches ({group: {variable: value}}) into one, later patches win"""
+    out={}
+    for patch in patches:
+        for group,entries in (patch or {}).items():
+            out.setdefault(group.lower(),{}).update({k.lower():v for k,v in entries.items()})
+    return out
+
+def nmlpatch(nmlpath,patches,outs):
+    """apply a stack of namelist patches to nmlpath in a single pass and write the result to all of outs
+
+    Patched with f90nml.patch, so the layout and comments of nmlpath are kept. Groups and variables that nmlpath doesn't have
+    are reported (f90nml adds them to the end of the group).
+    
+    :nmlpath: namelist to patch
+    :patches: list of patches (see nmlstack), e.g. [physics, forcing, diagnostics]
+    :outs: list of files to write, can include nmlpath itself
+    """
+    assert(os.path.exists(nmlpath)),"can't find namelist "+nmlpath
+    patch=nmlstack(patches)
+    ref=nmlread(nmlpath)
+    for group,entries in patch.items():
+        if group not in ref:
+            print(bcolors.WARNING+"WARNING: "+bcolors.ENDC+"namelist group "+group+" isn't in "+nmlpath)
+            continue
+        for k in entries:
+            if k not in ref[group]:
+                print(bcolors.WARNING+"WARNING: "+bcolors.ENDC+group+"/"+k+" isn't in "+nmlpath+", it will be added")
+
+    tmp=outs[0]+'_new'
+    if patch=={}:
+        shutil.copy2(nmlpath,tmp)
+    else:
+        f90nml.patch(nmlpath, patch, out_path=tmp)
+    shutil.move(tmp,outs[0])
+    for o in outs[1:]:
+        shutil.copy2(outs[0],o)
+
+def mkkillisf(BFILE,store):
+    """kill the ice-shelf in a bathymetry file: drop isf_draft and rename Bathymetry_isf to Bathymetry (used to be done with ncks/ncrename)
+
+    Variables are streamed across one at a time, there are no intermediate files. The result is kept in store named by the sha1 
+    of BFILE, so members that share a BFILE only do this once.
+    
+    :BFILE: bathymetry file with isf_draft and Bathymetry_isf
+    :store: folder to keep the results in
+    :returns: path of the bathymetry without the ice-shelf
+    """
+    import netCDF4
+    import fcntl
+    ofile=store+'bathy_meter_killisf_'+sha1sum(BFILE)+'.nc'
+    mkdir(store)
+
+    #members set up at the same time wait for whoever got here first
+    with ctx.closing(open(ofile+'.lock','w')) as lock:
+        fcntl.flock(lock,fcntl.LOCK_EX)
+        if os.path.exists(ofile):
+            print("We have already killed the ice-shelf of "+BFILE+" (using "+ofile+")")
+            return ofile
+        mkkillisf_nc(BFILE,ofile,netCDF4)
+    print("We have sucessfully killed the ice-shelf! ("+ofile+")") 
+    return ofile
+
+def mkkillisf_nc(BFILE,ofile,netCDF4):
+    """does the actual work of mkkillisf, writing ofile"""
+    #written under a temporary name and renamed, so there's never half a file in the store
+    tmp=ofile+'.'+str(os.getpid())
+    try:
+        with ctx.closing(netCDF4.Dataset(BFILE,'r')) as ifile, ctx.closing(netCDF4.Dataset(tmp,'w',format=ifile.data_model)) as onc:
+            for v in ['isf_draft','Bathymetry_isf']:
+                if v not in ifile.variables:
+                    raise ValueError("can't kill the ice-shelf, "+BFILE+" has no "+v)
+            if 'Bathymetry' in ifile.variables:
+                raise ValueError("can't kill the ice-shelf, "+BFILE+" already has a Bathymetry variable")
+
+            ifile.set_auto_maskandscale(False)
+            onc.setncatts({a:ifile.getncattr(a) for a in ifile.ncattrs()})
+            for d in ifile.dimensions.values():
+                onc.createDimension(d.name,None if d.isunlimited() else len(d))
+            for v in ifile.variables.values():
+                if v.name=='isf_draft':
+                    continue
+                name='Bathymetry' if v.name=='Bathymetry_isf' else v.name
+                atts={a:v.getncattr(a) for a in v.ncattrs()}
+                ovar=onc.createVariable(name,v.dtype,v.dimensions,fill_value=atts.pop('_FillValue',None))
+                ovar.setncatts(atts)
+                ovar.set_auto_maskandscale(False)
+                if v.ndim==0:
+                    ovar.assignValue(v.getValue())
+                elif v.ndim<=2 or v.shape[0]==0:
+                    ovar[:]=v[:]
+                else:
+                    for t in range(v.shape[0]):
+                        ovar[t]=v[t]
+        os.rename(tmp,ofile)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
 def mkdomcfg(rP_WORKDIR,workfol,DOMAINcfg,BFILE,rP_nml_patch,killisf):
     """function to do leg work for making domain_cfg.nc
     """
@@ -50,26 +244,18 @@ def mkdomcfg(rP_WORKDIR,workfol,DOMAINcfg,BFILE,rP_nml_patch,killisf):
     os.chdir(rP_WORKDIR+'/domaincfg/')
     wdir=workfol+'domaincfg/'
 
-    ifiles=sorted(glob.glob(wdir+'*'))
-    assert(ifiles!=[]),"glob didn't find anything!"
-    for f in ifiles:
-        if os.path.isfile(f):
-            shutil.copy2(f,rP_WORKDIR+'/domaincfg/'+os.path.basename(f))
+    tmplfolder(wdir,rP_WORKDIR+'/domaincfg/',os.path.dirname(rP_WORKDIR)+'/.tmplstore/')
 
     os.symlink(DOMAINcfg, 'make_domain_cfg.exe')
     if not killisf:
         os.symlink(BFILE, 'isf_draft_meter.nc')
         os.symlink(BFILE, 'bathy_meter.nc')
     else:
-        shutil.copy2(BFILE,rP_WORKDIR+'/domaincfg/bathy_meter_template.nc')
-        subprocess.call('module load nco;ncks -x -v isf_draft bathy_meter_template.nc bathy_meter_middle.nc;ncrename -v Bathymetry_isf,Bathymetry bathy_meter_middle.nc bathy_meter.nc;',shell=True)
-        if os.path.exists(rP_WORKDIR+'/domaincfg/bathy_meter.nc'):
-            print("We have sucessfully killed the ice-shelf!") 
-        else:
-            print("We have not sucessfully killed the ice-shelf!") 
-            import pdb;pdb.set_trace()
-        os.remove(rP_WORKDIR+'/domaincfg/bathy_meter_middle.nc')
-        os.remove(rP_WORKDIR+'/domaincfg/bathy_meter_template.nc')
+        #shutil.copy2(BFILE,rP_WORKDIR+'/domaincfg/bathy_meter_template.nc')
+        #subprocess.call('module load nco;ncks -x -v isf_draft bathy_meter_template.nc bathy_meter_middle.nc;ncrename -v Bathymetry_isf,Bathymetry bathy_meter_middle.nc bathy_meter.nc;',shell=True)
+        os.symlink(mkkillisf(BFILE,os.path.dirname(rP_WORKDIR)+'/.cache/killisf/'), 'bathy_meter.nc')
+        if not os.path.exists(rP_WORKDIR+'/domaincfg/bathy_meter.nc'):
+            raise RuntimeError("We have not sucessfully killed the ice-shelf! (no "+rP_WORKDIR+"/domaincfg/bathy_meter.nc)")
 
     #need bathymetry and isf file
 
@@ -77,9 +263,472 @@ def mkdomcfg(rP_WORKDIR,workfol,DOMAINcfg,BFILE,rP_nml_patch,killisf):
         nmlpath=rP_WORKDIR+'/domaincfg/namelist_cfg'
         assert(os.path.exists(nmlpath)),"can't find domaincfg/namelist_cfg"
         print(bcolors.HEADER+ "WARNING: "+bcolors.ENDC   +'We are patching the DOMAINCFG namelist '+nmlpath+' with: '+  bcolors.HEADER +str(rP_nml_patch) +bcolors.ENDC)
-        f90nml.patch(nmlpath, rP_nml_patch, out_path=nmlpath+'_new')
-        shutil.move(nmlpath+'_new', nmlpath)
+        nmlpatch(nmlpath,[rP_nml_patch],[nmlpath])
+
 
+def wrdomcfg(handle,rP_WORKDIR,extdomaincfg):
+    """write the bit of the job scripts that makes (and possibly hacks) domain_cfg.nc
+
+    Skipped at run time if domain_cfg.nc is already there (the job is a resubmission). Otherwise it's taken from the domain_cfg 
+    cache (domaincfg/cachedir, see mkmesh) if a member with the same inputs has made it, or made and put there. The lookup and the 
+    build are under a lock on the cache folder, so members of an ensemble that start together make it once: the first one builds 
+    it and the others wait for it and link it in.
+
+    :handle: open job script
+    :extdomaincfg: see mkmesh
+    """
+    if extdomaincfg[0]!='' and extdomaincfg[0]!='hacked':
+        return
+    handle.write("if [ -e domain_cfg.nc ]; then"+"\n")
+    handle.write('   echo "domain_cfg.nc is already here, not making it again."'+"\n")
+    handle.write('else'+"\n")
+    handle.write('#other members with the same bathymetry/namelist/hack use the same one, whoever gets the lock first makes it'+'\n')
+    handle.write('cdir=`cat domaincfg/cachedir`'+"\n")
+    handle.write('mkdir -p $cdir'+"\n")
+    handle.write('('+"\n")
+    handle.write('flock 9'+"\n")
+    handle.write("if [ -f $cdir/domain_cfg.nc ]; then"+"\n")
+    handle.write('   ln -s $cdir/domain_cfg.nc domain_cfg.nc'+"\n")
+    handle.write('   echo "Using cached domain_cfg.nc "$cdir"/domain_cfg.nc (make_domain_cfg.exe skipped)"'+"\n")
+    handle.write('else'+"\n")
+    handle.write('#create domain_cfg.nc'+'\n')
+    handle.write('cd '+'domaincfg'+"\n")
+    handle.write('srun -n 1 ./make_domain_cfg.exe '+"\n")
+    handle.write("if [ -f domain_cfg.nc ]; then"+"\n")
+    handle.write('   mv domain_cfg.nc ../'+"\n")
+    handle.write('else'+"\n")
+    handle.write('   echo "ERROR: domain_cfg NOT created, stopping."'+"\n")
+    handle.write('   exit 1'+"\n")
+    handle.write("fi"+"\n")
+    handle.write('cd '+'..'+"\n")
+    handle.write(''+'\n')
+    if extdomaincfg[0]=='hacked':
+        handle.write('echo "Current Date and Time is (for domaincfg hacking timer): " '+'`date`'+"\n")
+        handle.write('python ' +extdomaincfg[1] +' '+rP_WORKDIR+'/domain_cfg.nc '+rP_WORKDIR+'/domain_cfg_hckd.nc '+'\n')
+        handle.write("if [ -f domain_cfg_hckd.nc ]; then"+"\n")
+        handle.write('   echo "YAY: hacked domain_cfg created."'+"\n")
+        handle.write('   rm domain_cfg.nc'+"\n")
+        handle.write('   mv domain_cfg_hckd.nc domain_cfg.nc'+"\n")
+        handle.write('else'+"\n")
+        handle.write('   echo "ERROR: hacked domain_cfg NOT created, stopping."'+"\n")
+        handle.write('   exit 1'+"\n")
+        handle.write("fi"+"\n")
+        handle.write('echo "Current Date and Time is (for domaincfg hacking timer): " '+'`date`'+"\n")
+        handle.write(''+"\n")
+    handle.write('cp domain_cfg.nc $cdir/domain_cfg.nc.$$ && mv $cdir/domain_cfg.nc.$$ $cdir/domain_cfg.nc'+"\n")
+    handle.write("fi"+"\n")
+    handle.write(') 9>$cdir/lock || exit 1'+"\n")
+    handle.write("fi"+"\n")
+    handle.write(''+"\n")
+
+def wrdecomp(handle,decomp,maxranks,nmls=['namelist_ref','namelist_cfg','namelist_ref_prod'],exe='decompNEMO.py'):
+    """write the bit of the job scripts that decomposes the domain (after wrdomcfg) and sets $ranks
+
+    The all-land subdomains that are dropped are those of the domain_cfg.nc nemo.exe will read (hacked or not), see decompNEMO.py fix.
+    The layout goes in the namelists nmls, the number of ranks srun should start in $ranks.
+
+    :decomp: 'auto' or 'NIxNJ' (see main)
+    :maxranks: most ranks the job has room for
+    """
+    handle.write('#jpni x jpnj and the ranks from the land of domain_cfg.nc, which can differ from the bathymetry we set up from'+"\n")
+    handle.write('python '+exe+' fix domain_cfg.nc '+str(maxranks)+' '+decomp+' '+' '.join(nmls)+' || exit 1'+"\n")
+    handle.write('ranks=`cat decomp.ranks`'+"\n")
+
+def wryears(handle,rP_WORKDIR,rP_OCEANCORES,yend,ypack,pipeline=False,resubmit=None,phase='long',timing=[],stream=False,zarr='',equil=False,decomp=False):
+    """write the year loop of the long/production job scripts (runs up to, not including, year yend)
+
+    With ypack>1 up to ypack years go into a single nemo.exe launch (packNEMO.py stretch sets nn_itend and a restart every year,
+    main gives the file_defs a yearly split_freq), then postNEMO.py is run for each of them in turn (packNEMO.py year puts that 
+    year's files in place). A stretch never goes past yend, so the production phases still switch on the right year, and a year 
+    without a restart stops the job.
+
+    With pipeline the postNEMO.py's of a launch run in the background while the next launch runs. nemo.exe then runs in .packrun/ 
+    (packNEMO.py launch, what it reads is linked in from the run folder) and starts from the restart tiles the last launch left 
+    behind rather than the rebuilt restart, so it doesn't wait for any post. The run folder is the posts' alone: preNEMO.py and 
+    packNEMO.py launch are done before the last launch's posts start, and packNEMO.py hand only moves what nemo.exe wrote back for 
+    its own posts once they're done. nemo.exe leaves a core of the last node free (main takes a rank off) and the posts are bound
+    to it. Only one launch's posts run at a time, the job stops if they fail, and the loop waits for the last ones before it ends.
+
+    With resubmit every launch appends its time per year to time.year.log. Before a launch the slowest of the last 5 is compared 
+    with what's left of the job ($tstart, $twall and $tspare, set by the job script): a stretch is cut down to what fits, and if not 
+    even one year fits the job waits for its posts, sbatch's resubmit to start once it's gone and stops (time.year.step carries on).
+    The first launch of a job always goes ahead.
+
+    The start and end of preNEMO.py (and packNEMO.py stretch), nemo.exe, each postNEMO.py and the waits for them are appended to 
+    telemetry.log as "time job nodes phase year years step start/end" records, see telemetry.py.
+
+    Once a year's postNEMO.py is done restarts.py tidy indexes its restart and deflates the older ones (in the background).
+    With stream streamNEMO.py fold then adds the year to the spin up series and production sums (in the background too).
+    With zarr zarrNEMO.py append writes the year's selected fields to the ensemble's Zarr store (in the background too).
+    With equil equilNEMO.py check works out how settled the spin up is (in the background too) and the loop stops before yend once
+    it has written spinup.done (a launch later with pipeline, the posts of a launch are done during the next one).
+
+    Launches with a year of timing in them run with ln_timing on and their timing.output is kept in timing/NNNN_<phase>/, see profileNEMO.py.
+
+    With decomp ($ranks from wrdecomp) each launch's ocean.output is checked against the ranks it ran on (decompNEMO.py check).
+
+    :handle: open job script
+    :rP_OCEANCORES: ranks of nemo.exe (or '$ranks')
+    :yend: year to stop at (or a shell variable, e.g. '$yend', set by the job script before the loop)
+    :ypack: number of years per nemo.exe launch
+    :pipeline: overlap postNEMO.py with the next nemo.exe launch
+    :resubmit: job script to resubmit when the next year won't fit in the job (None to not check)
+    :phase: what to call this part of the run in telemetry.log (and timing/), e.g. spinup or production
+    :timing: years to run with ln_timing on (production for the first production year, see profileNEMO.py switch)
+    :stream: fold each year into the spin up series and production means as it lands (see streamNEMO.py)
+    :zarr: ensemble Zarr store to append each year to ('' for none, see zarrNEMO.py)
+    :equil: check the spin up's drift after each year and stop at the next launch once it's settled (see equilNEMO.py)
+    :decomp: check the number of ocean subdomains nemo.exe found after each launch
+    """
+    handle.write('#timing records for telemetry.py: time job nodes phase year years step start/end'+"\n")
+    handle.write('phase='+phase+"\n")
+    handle.write('tm() { echo `date +%s` ${SLURM_JOB_ID:-0} ${SLURM_JOB_NUM_NODES:-0} $phase $year ${3:-$npack} $1 $2 >> '+rP_WORKDIR+'/telemetry.log; }'+"\n")
+
+    def wrposts(ind,srun):
+        """the posts of a launch (of $npack years from $year)"""
+        if ypack>1 or pipeline:
+            handle.write(ind+'for k in `seq 0 $[$npack-1]`'+"\n")
+            handle.write(ind+'do'+"\n")
+            ind=ind+'    '
+            handle.write(ind+'python packNEMO.py year $k || exit 1'+"\n")
+        handle.write(ind+'echo "Clean up NEMO"'+"\n")
+        handle.write(ind+'tm post start 1'+"\n")
+        handle.write(ind+srun+"\n")
+        handle.write(ind+'tm post end 1'+"\n")
+        #( ... & ) so the waits for the posts don't wait for it too
+        handle.write(ind+'( python restarts.py tidy >> restarts.log 2>&1 & )'+"\n")
+        if stream:
+            handle.write(ind+'( python streamNEMO.py fold $year >> stream.log 2>&1 & )'+"\n")
+        if zarr!='':
+            handle.write(ind+'( python zarrNEMO.py append $year '+zarr+' >> zarr.log 2>&1 & )'+"\n")
+        if equil:
+            handle.write(ind+'( python equilNEMO.py check $year >> equilNEMO.log 2>&1 & )'+"\n")
+
+        if not pipeline:
+            handle.write(ind+'wait'+"\n")
+        handle.write(ind+'echo "Current Date and Time is ("$year" end): " '+'`date`'+"\n")
+
+        handle.write(ind+''+"\n")
+
+        if ypack==1 and not pipeline:
+            handle.write('    echo "And repeat."'+"\n")
+        handle.write(ind+"year=$[$year+1]"+"\n")
+        handle.write(ind+'cd $cwd'+"\n")
+        handle.write(ind+"echo 'year='$year > time.year.step"+"\n")
+        if ypack>1 or pipeline:
+            handle.write(ind[:-4]+'done'+"\n")
+
+    if pipeline:
+        handle.write('#the posts of the launch handed back last ($pnpack years from $pyear), in the background of the next launch'+"\n")
+        handle.write('pnpack=0'+"\n")
+        handle.write('postpid='+"\n")
+        handle.write('posts() {'+"\n")
+        handle.write('    if [ $pnpack -gt 0 ]; then'+"\n")
+        handle.write('    ('+"\n")
+        handle.write('    year=$pyear'+"\n")
+        handle.write('    npack=$pnpack'+"\n")
+        #nemo.exe's ranks fill the nodes in order, so the core it leaves free is the last one of the last node (128 cores a node)
+        wrposts('    ','srun --overlap --relative=$[${SLURM_JOB_NUM_NODES:-1}-1] --nodes=1 --ntasks=1 --cpus-per-task=1 --cpu-bind=map_cpu:127 python postNEMO.py ')
+        handle.write('    ) &'+"\n")
+        handle.write('    postpid=$!'+"\n")
+        handle.write('    pnpack=0'+"\n")
+        handle.write('    fi'+"\n")
+        handle.write('}'+"\n")
+        handle.write('#wait for them, stop if they failed'+"\n")
+        handle.write('postwait() {'+"\n")
+        handle.write('    if [ -n "$postpid" ]; then'+"\n")
+        handle.write('       tm wait start'+"\n")
+        handle.write('       wait $postpid || { echo "ERROR: the posts of the years from "$pyear" failed, stopping."; exit 1; }'+"\n")
+        handle.write('       tm wait end'+"\n")
+        handle.write('       postpid='+"\n")
+        handle.write('    fi'+"\n")
+        handle.write('}'+"\n")
+    if equil:
+        handle.write("while [ $year -lt "+str(yend)+" ] && [ ! -f spinup.done ]"+"\n")
+    else:
+        handle.write("while [ $year -lt "+str(yend)+" ]"+"\n")
+    handle.write('do'+"\n")
+
+    handle.write('    echo "Current Date and Time is ("$year" start): " '+'`date`'+"\n")
+    handle.write('    echo "Run NEMO"'+"\n")
+
+    handle.write('    cd '+rP_WORKDIR+"\n")
+    handle.write('    echo "Current directory is:"'+"\n")
+    handle.write('    pwd'+"\n")
+    if ypack>1:
+        handle.write('    npack=$['+str(yend)+'-$year]'+"\n")
+        handle.write('    if [ $npack -gt '+str(ypack)+' ]; then npack='+str(ypack)+'; fi'+"\n")
+    else:
+        handle.write('    npack=1'+"\n")
+    if resubmit is not None:
+        handle.write('    #does the next launch fit in what is left of the job?'+"\n")
+        handle.write("    if [ -f time.year.log ]; then"+"\n")
+        handle.write("       tyear=`tail -n 5 time.year.log | awk 'BEGIN{m=1}{if($3>m)m=$3}END{print m}'`"+"\n")
+        handle.write('       tleft=$[$twall-$tspare-(`date +%s`-$tstart)]'+"\n")
+        handle.write('       nfit=$[$tleft/$tyear]'+"\n")
+        #(a job always does at least one launch, otherwise a year that never fits would be resubmitted for ever)
+        handle.write('       if [ $nfit -lt 1 ] && [ -n "$tlaunch" ]; then'+"\n")
+        handle.write('          echo "Year "$year" takes about "$tyear"s and there is only "$tleft"s left, resubmitting"'+"\n")
+        if pipeline:
+            handle.write('          posts'+"\n")
+            handle.write('          postwait'+"\n")
+        else:
+            handle.write('          wait'+"\n")
+        handle.write('          sbatch --dependency=afterany:$SLURM_JOB_ID '+resubmit+"\n")
+        handle.write('          exit 0'+"\n")
+        handle.write("       fi"+"\n")
+        if ypack>1:
+            handle.write("       if [ $nfit -lt 1 ]; then nfit=1; fi"+"\n")
+            handle.write("       if [ $npack -gt $nfit ]; then npack=$nfit; fi"+"\n")
+        handle.write("    fi"+"\n")
+        handle.write('    tlaunch=`date +%s`'+"\n")
+    handle.write('    tm pre start'+"\n")
+    handle.write('    python preNEMO.py'+"\n")
+    if pipeline:
+        #ln_timing goes in namelist_cfg before packNEMO.py launch takes its copy
+        if timing!=[]:
+            handle.write('    python profileNEMO.py switch $year $npack '+' '.join([str(y) for y in timing])+"\n")
+        handle.write('    echo "Running "$npack" years in this launch"'+"\n")
+        handle.write('    python packNEMO.py launch $npack $year || { posts; postwait; exit 1; }'+"\n")
+        handle.write('    tm pre end'+"\n")
+        handle.write('    #the last launch\'s posts have the run folder to themselves from here'+"\n")
+        handle.write('    posts'+"\n")
+        handle.write('    tm nemo start'+"\n")
+        handle.write('    cd .packrun'+"\n")
+        handle.write('    srun --ntasks='+str(rP_OCEANCORES)+' ./nemo.exe'+'\n')
+        if decomp:
+            handle.write('    python decompNEMO.py check || { cd '+rP_WORKDIR+'; posts; postwait; exit 1; }'+"\n")
+        handle.write('    cd '+rP_WORKDIR+"\n")
+        handle.write('    tm nemo end'+"\n")
+        handle.write('    postwait'+"\n")
+        handle.write('    python packNEMO.py hand'+"\n")
+        if timing!=[]:
+            handle.write('    if [ -f timing.output ]; then python profileNEMO.py keep $year $npack $phase; fi'+"\n")
+        handle.write('    pyear=$year'+"\n")
+        handle.write('    pnpack=$npack'+"\n")
+        handle.write('    year=$[$year+$npack]'+"\n")
+    else:
+        if ypack>1:
+            handle.write('    echo "Running "$npack" years in this launch"'+"\n")
+            handle.write('    python packNEMO.py stretch $npack || exit 1'+"\n")
+        if timing!=[]:
+            handle.write('    python profileNEMO.py switch $year $npack '+' '.join([str(y) for y in timing])+"\n")
+        handle.write('    tm pre end'+"\n")
+        handle.write('    tm nemo start'+"\n")
+        handle.write('    srun --ntasks='+str(rP_OCEANCORES)+' ./nemo.exe'+'\n')
+        if decomp:
+            handle.write('    python decompNEMO.py check || exit 1'+"\n")
+        handle.write('    tm nemo end'+"\n")
+        if timing!=[]:
+            handle.write('    if [ -f timing.output ]; then python profileNEMO.py keep $year $npack $phase; fi'+"\n")
+        handle.write(' '+"\n")
+        #the nodes are idle while postNEMO.py runs, so the rebuilds (rebuild_tiles.py) can have a few cores
+        wrposts('    ','srun --ntasks='+'1'+' --tasks-per-node='+'1'+' --cpus-per-task=16 python postNEMO.py ')
+    if resubmit is not None:
+        handle.write('    #first year, number of years and seconds per year of this launch'+"\n")
+        handle.write('    echo $[$year-$npack] $npack $[(`date +%s`-$tlaunch)/$npack] >> '+rP_WORKDIR+'/time.year.log'+"\n")
+    if ypack>1 or pipeline:
+        handle.write('    echo "And repeat."'+"\n")
+    handle.write('done'+"\n")
+    if pipeline:
+        handle.write('posts'+"\n")
+        handle.write('echo "Waiting for the last postNEMO.py"'+"\n")
+        handle.write('postwait'+"\n")
+        handle.write('cd $cwd'+"\n")
+        handle.write('source time.year.step'+"\n")
+
+def mkscaling(rP_WORKDIR,rP_CONFIG,rP_CASE,BFILE,extdomaincfg,scaling,nsteps=300):
+    """set up a strong scaling suite in rP_WORKDIR/scaling/: the run as it starts (namelist_cfg) for nsteps at each core count of scaling
+
+    Each rung gets the jpni x jpnj decompNEMO.py picks for its cores (so ranks can be a few less, the job picks again from the land of
+    domain_cfg.nc and scaling/NNNN/decomp.ranks is what it ran on), its own namelist_cfg and a short qos job
+    (scaling/goNEMOscale_NNNN.sh) that runs in scaling/NNNN/ (everything else linked from the run folder) and logs time.step against the 
+    clock. goNEMOscaling.sh submits them one after the other (the first one makes domain_cfg.nc if need be), then scaleNEMO.py reads them.
+
+    :scaling: list of core counts, e.g. [128,256,512,1024,2048]
+    :nsteps: time steps per rung (nn_itend), they have to fit in the 20 minutes of the short qos at the lowest core count
+    """
+    sys.path.insert(0,HELPERS)
+    import decompNEMO
+    mkdir(rP_WORKDIR+'/scaling/')
+    shutil.copy2(os.path.join(HELPERS,'scaleNEMO.py'),rP_WORKDIR+'/scaleNEMO.py')
+    shutil.copy2(os.path.join(HELPERS,'decompNEMO.py'),rP_WORKDIR+'/decompNEMO.py')
+    ladder=[]
+    for cores in sorted(scaling):
+        jpni,jpnj,ranks=decompNEMO.decomp(BFILE,cores)
+        nodes=-(-ranks//decompNEMO.CORES)
+        ladder.append((cores,ranks,nodes,jpni,jpnj))
+        rung=str(cores).zfill(4)
+        nmlpatch(rP_WORKDIR+'/namelist_cfg',[{'namrun':{'nn_it000':1,'nn_itend':nsteps,'nn_stock':nsteps,'ln_rstart':False},\
+                'nammpp':{'jpni':jpni,'jpnj':jpnj}}],[rP_WORKDIR+'/scaling/namelist_cfg_'+rung])
+
+        with ctx.closing(open(rP_WORKDIR+'/scaling/goNEMOscale_'+rung+'.sh','w')) as handle:
+            handle.write('#!/bin/bash'+'\n')
+            handle.write('#SBATCH --qos=short'+'\n')
+            handle.write('#SBATCH --job-name='+rP_CONFIG+'_sc'+rung+'\n')
+            handle.write('#SBATCH --time=00:20:00'+'\n')
+            handle.write('#SBATCH --nodes='+str(nodes)+'\n')
+            handle.write('#SBATCH --ntasks='+str(ranks)+'\n')
+            handle.write('#SBATCH --account=n02-PROPHET'+'\n')
+            handle.write('#SBATCH --partition=standard'+'\n')
+            handle.write('module restore'+"\n")
+            handle.write('module load cray-hdf5-parallel'+"\n")
+            handle.write('module load cray-netcdf-hdf5parallel'+"\n")
+            handle.write('module load xpmem'+"\n")
+            handle.write('module load perftools-base'+"\n")
+            handle.write('export OMP_NUM_THREADS=1'+'\n')
+            handle.write('#'+'\n')
+            handle.write("#This is one rung ("+str(cores)+" cores, "+str(jpni)+"x"+str(jpnj)+" subdomains) of the scaling suite, see scaleNEMO.py"+"\n")
+            handle.write('cwd='+rP_WORKDIR+"\n")
+            handle.write('cd $cwd'+"\n")
+            wrdomcfg(handle,rP_WORKDIR,extdomaincfg)
+            handle.write('rm -rf scaling/'+rung+"\n")
+            handle.write('mkdir scaling/'+rung+"\n")
+            handle.write('cd scaling/'+rung+"\n")
+            handle.write('for f in $cwd/*'+"\n")
+            handle.write('do'+"\n")
+            handle.write('    case `basename $f` in'+"\n")
+            handle.write('        scaling|OUTNEMO_*|domaincfg|namelist_cfg|ocean.output|time.*|*.sh) ;;'+"\n")
+            handle.write('        *) ln -s $f . ;;'+"\n")
+            handle.write('    esac'+"\n")
+            handle.write('done'+"\n")
+            handle.write('cp $cwd/scaling/namelist_cfg_'+rung+' namelist_cfg'+"\n")
+            wrdecomp(handle,'auto',min(cores,nodes*decompNEMO.CORES),['namelist_cfg'],'$cwd/decompNEMO.py')
+            handle.write('date +%s > t.start'+"\n")
+            handle.write('#where nemo.exe has got to (time.step), every few seconds'+"\n")
+            handle.write('( while true; do [ -f time.step ] && echo `date +%s.%N` `cat time.step` >> steps.log; sleep 5; done ) &'+"\n")
+            handle.write('mon=$!'+"\n")
+            handle.write('srun --ntasks=$ranks ./nemo.exe'+'\n')
+            handle.write('kill $mon'+"\n")
+            handle.write('python $cwd/decompNEMO.py check || exit 1'+"\n")
+            handle.write('date +%s > t.end'+"\n")
+            handle.write('#only the timings are wanted (links to the inputs are left alone)'+"\n")
+            handle.write('find . -maxdepth 1 -type f -name "*.nc" -delete'+"\n")
+
+    with ctx.closing(open(rP_WORKDIR+'/scaling/ladder','w')) as handle:
+        handle.write('#cores ranks nodes jpni jpnj'+'\n')
+        for rung in ladder:
+            handle.write(' '.join([str(v) for v in rung])+'\n')
+
+    #one at a time (the short qos only runs one job at a time anyway)
+    with ctx.closing(open(rP_WORKDIR+'/goNEMOscaling.sh','w')) as handle:
+        handle.write('#!/bin/bash'+'\n')
+        handle.write("#submits the scaling suite (bash goNEMOscaling.sh, not sbatch), when it's done: python scaleNEMO.py"+"\n")
+        handle.write('cd '+rP_WORKDIR+"\n")
+        handle.write('dep='+"\n")
+        for rung in ladder:
+            handle.write('dep=`sbatch --parsable $dep scaling/goNEMOscale_'+str(rung[0]).zfill(4)+'.sh`'+"\n")
+            handle.write('echo "submitted '+str(rung[0])+' cores: "$dep'+"\n")
+            handle.write('dep=--dependency=afterany:$dep'+"\n")
+    subprocess.call('chmod u+x '+rP_WORKDIR+'/goNEMOscaling.sh '+rP_WORKDIR+'/scaling/goNEMOscale_*.sh',shell=True)
+    print(bcolors.HEADER+ "WARNING: "+bcolors.ENDC+"scaling suite of "+str(nsteps)+" steps at "+', '.join([str(r[0]) for r in ladder])+" cores (bash goNEMOscaling.sh to submit it)")
+
+def mkcfl(rP_WORKDIR,rP_CONFIG,rP_OCEANCORES,rP_NODES,extdomaincfg,decomp='',maxranks=None,nsteps=2400):
+    """set up a short run with the CFL diagnostics on (ln_diacfl) in rP_WORKDIR/cfl/ to see how big a time step the run can take
+
+    goNEMOcfl.sh is a short qos job that runs in cfl/ (everything else linked from the run folder), from the run's latest restart if
+    it has one (cflNEMO.py prep) or from rest, keeps cfl_diagnostics.ascii and then python cflNEMO.py says what rn_rdt to use.
+
+    :decomp: decomposition of the run (see main), picked again at run time from domain_cfg.nc as the run's job scripts do
+    :maxranks: most ranks the job has room for (with decomp)
+    :nsteps: time steps to run, they have to fit in the 20 minutes of the short qos
+    """
+    mkdir(rP_WORKDIR+'/cfl/')
+    shutil.copy2(os.path.join(HELPERS,'cflNEMO.py'),rP_WORKDIR+'/cflNEMO.py')
+    nmlpatch(rP_WORKDIR+'/namelist_cfg',[{'namrun':{'nn_it000':1,'nn_itend':nsteps,'nn_stock':nsteps,'ln_rstart':False},\
+            'namctl':{'ln_diacfl':True}}],[rP_WORKDIR+'/cfl/namelist_cfg_cfl'])
+
+    with ctx.closing(open(rP_WORKDIR+'/goNEMOcfl.sh','w')) as handle:
+        handle.write('#!/bin/bash'+'\n')
+        handle.write('#SBATCH --qos=short'+'\n')
+        handle.write('#SBATCH --job-name='+rP_CONFIG+'_cfl'+'\n')
+        handle.write('#SBATCH --time=00:20:00'+'\n')
+        handle.write('#SBATCH --nodes='+str(rP_NODES)+'\n')
+        handle.write('#SBATCH --ntasks='+str(rP_OCEANCORES)+'\n')
+        handle.write('#SBATCH --account=n02-PROPHET'+'\n')
+        handle.write('#SBATCH --partition=standard'+'\n')
+        handle.write('module restore'+"\n")
+        handle.write('module load cray-hdf5-parallel'+"\n")
+        handle.write('module load cray-netcdf-hdf5parallel'+"\n")
+        handle.write('module load xpmem'+"\n")
+        handle.write('module load perftools-base'+"\n")
+        handle.write('export OMP_NUM_THREADS=1'+'\n')
+        handle.write('export PYTHONPATH=/work/n02/n02/chbull/anaconda3/pkgs;export PATH=/work/n02/n02/chbull/anaconda3/bin:$PATH;source activate root'+'\n')
+        handle.write('#'+'\n')
+        handle.write("#This is a short run with the CFL diagnostics on, when it's done: python cflNEMO.py"+"\n")
+        handle.write('cwd='+rP_WORKDIR+"\n")
+        handle.write('cd $cwd'+"\n")
+        wrdomcfg(handle,rP_WORKDIR,extdomaincfg)
+        handle.write('rm -rf cfl/run'+"\n")
+        handle.write('mkdir cfl/run'+"\n")
+        handle.write('cd cfl/run'+"\n")
+        handle.write('for f in $cwd/*'+"\n")
+        handle.write('do'+"\n")
+        handle.write('    case `basename $f` in'+"\n")
+        handle.write('        cfl|scaling|timing|OUTNEMO_*|domaincfg|namelist_cfg|ocean.output|time.*|*.sh) ;;'+"\n")
+        handle.write('        *) ln -s $f . ;;'+"\n")
+        handle.write('    esac'+"\n")
+        handle.write('done'+"\n")
+        handle.write('cp $cwd/cfl/namelist_cfg_cfl namelist_cfg'+"\n")
+        handle.write('python $cwd/cflNEMO.py prep '+str(nsteps)+' $cwd'+"\n")
+        if decomp!='':
+            wrdecomp(handle,decomp,maxranks,['namelist_cfg'],'$cwd/decompNEMO.py')
+            handle.write('srun --ntasks=$ranks ./nemo.exe'+'\n')
+            handle.write('python $cwd/decompNEMO.py check || exit 1'+"\n")
+        else:
+            handle.write('srun --ntasks='+str(rP_OCEANCORES)+' ./nemo.exe'+'\n')
+        handle.write('mv cfl_diagnostics.ascii start ocean.output ..'+"\n")
+        handle.write('cd $cwd'+"\n")
+        handle.write('rm -rf cfl/run'+"\n")
+        handle.write('python cflNEMO.py'+"\n")
+    subprocess.call('chmod u+x '+rP_WORKDIR+'/goNEMOcfl.sh',shell=True)
+
+def mkflxfce(rP_WORKDIR,FLXFCE,flxlayout,years):
+    """lay the flux forcing out in rP_WORKDIR/flxfce/ for namsbc_flx (see flxlayout of main)
+
+    :FLXFCE: flux forcing, <path>_grid_.nc for the three files <path>_grid_T.nc, <path>_grid_U.nc and <path>_grid_V.nc
+    :years: the years to link (yearly)
+    :returns: the namelist patch the layout needs ({} for none)
+    """
+    assert(os.path.exists(FLXFCE[:-3]+'T.nc')),"can't find flux forcing grid_T file: "+FLXFCE[:-3]+'T.nc'
+    assert(os.path.exists(FLXFCE[:-3]+'U.nc')),"can't find flux forcing grid_T file: "+FLXFCE[:-3]+'U.nc'
+    assert(os.path.exists(FLXFCE[:-3]+'V.nc')),"can't find flux forcing grid_T file: "+FLXFCE[:-3]+'V.nc'
+
+    if flxlayout=='yearly':
+        for yy in years:
+            yy=str(yy).zfill(4)+'.nc'
+            os.symlink(FLXFCE[:-3]+'T.nc', rP_WORKDIR+'/flxfce/flxforce_grid_T_y'+yy)
+            os.symlink(FLXFCE[:-3]+'U.nc', rP_WORKDIR+'/flxfce/flxforce_grid_U_y'+yy)
+            os.symlink(FLXFCE[:-3]+'V.nc', rP_WORKDIR+'/flxfce/flxforce_grid_V_y'+yy)
+    elif flxlayout=='clim':
+        #same forcing every year, so let NEMO treat it as a climatology: with clim=T the file name has no _yNNNN
+        for g in ['T','U','V']:
+            os.symlink(FLXFCE[:-3]+g+'.nc', rP_WORKDIR+'/flxfce/flxforce_grid_'+g+'.nc')
+
+        flxnml=nmlread(rP_WORKDIR+'/namelist_ref')['namsbc_flx']
+        flxpatch={'namsbc_flx':{}}
+        for sn in [k for k in flxnml if k.startswith('sn_')]:
+            assert(flxnml[sn][0] in ['flxforce_grid_T','flxforce_grid_U','flxforce_grid_V']),"clim flxlayout doesn't know "+sn+" file "+str(flxnml[sn][0])
+            flxpatch['namsbc_flx'][sn]=flxnml[sn][:4]+[True]+flxnml[sn][5:]
+        print(bcolors.WARNING + "WARNING: flux forcing treated as a climatology (namsbc_flx clim=T)" + bcolors.ENDC)
+        return flxpatch
+    else:
+        raise ValueError("flxlayout should be 'yearly' or 'clim', not "+str(flxlayout))
+    return {}
+
+def domcfgkey(rP_WORKDIR,extdomaincfg):
+    """key (sha1) for the domain_cfg.nc that the run folder's domaincfg/ would make 
+    
+    It covers everything that goes into it: bathymetry (and ice-shelf draft), the patched namelist_cfg, namelist_ref, 
+    make_domain_cfg.exe and, if we're hacking it, the hack script.
+    """
+    h=hashlib.sha1()
+    for f in ['bathy_meter.nc','isf_draft_meter.nc','namelist_cfg','namelist_ref','make_domain_cfg.exe']:
+        f=rP_WORKDIR+'/domaincfg/'+f
+        h.update((os.path.basename(f)+':'+(sha1sum(f) if os.path.exists(f) else 'none')+'\n').encode())
+    if extdomaincfg[0]=='hacked':
+        h.update(('hack:'+sha1sum(extdomaincfg[1])+'\n').encode())
+    return h.hexdigest()
 
 def mkmesh(workfol,rP_WORKDIR,DOMAINcfg,BFILE,rP_nml_patch=None,killisf=False,extdomaincfg=['','']):
     """NEMO 4 in some cases, needs you to make a domain_cfg.nc file
@@ -96,13 +745,23 @@ def mkmesh(workfol,rP_WORKDIR,DOMAINcfg,BFILE,rP_nml_patch=None,killisf=False,ex
         ['',''] - default, we will use parameters provided or modified via namelist (alone)
         ['hacked','/PATH/TO/pythonscripttohack_domain_cfg.nc'] - uses default but will additionally hack the domain_cfg.nc output using passed file
         ['rogue','/PATH/TO/domain_cfg.nc'] - total rogue, i.e., if you'd rather use an externally provided domaincfg (made elsewhere).
+    Made domain_cfg.nc files are cached (RDIR/.cache/domaincfg/<key>/, see domcfgkey), the job scripts link in the one for the same
+    inputs if it's there when they start (or once the member making it is done) rather than make it again, see wrdomcfg.
+
     :returns: @todo
     """
-    if extdomaincfg[0]=='':
+    if extdomaincfg[0]=='' or extdomaincfg[0]=='hacked':
         mkdomcfg(rP_WORKDIR,workfol,DOMAINcfg,BFILE,rP_nml_patch,killisf)
-    elif extdomaincfg[0]=='hacked':
-        mkdomcfg(rP_WORKDIR,workfol,DOMAINcfg,BFILE,rP_nml_patch,killisf)
-        print(bcolors.HEADER+ "WARNING: "+bcolors.ENDC   +'We are going to hack the domaincfg, using '+os.path.dirname(extdomaincfg[1])+'/'+bcolors.HEADER+os.path.basename(extdomaincfg[1])+ bcolors.ENDC)
+        if extdomaincfg[0]=='hacked':
+            assert(os.path.exists(extdomaincfg[1])),"domain_cfg hack script passed does not exist!" + extdomaincfg[1]
+            print(bcolors.HEADER+ "WARNING: "+bcolors.ENDC   +'We are going to hack the domaincfg, using '+os.path.dirname(extdomaincfg[1])+'/'+bcolors.HEADER+os.path.basename(extdomaincfg[1])+ bcolors.ENDC)
+
+        #the job scripts look in there (and put it there once it's made), see wrdomcfg
+        cdir=os.path.dirname(rP_WORKDIR)+'/.cache/domaincfg/'+domcfgkey(rP_WORKDIR,extdomaincfg)+'/'
+        with ctx.closing(open(rP_WORKDIR+'/domaincfg/cachedir','w')) as handle:
+            handle.write(cdir+'\n')
+        if os.path.exists(cdir+'domain_cfg.nc'):
+            print(bcolors.OKGREEN+ "Cached domain_cfg.nc "+bcolors.ENDC+cdir+'domain_cfg.nc (the job scripts will use it rather than make it)')
     elif extdomaincfg[0]=='rogue':
         assert(os.path.exists(extdomaincfg[1])),"domain_cfg passed does not exist!" + extdomaincfg[1]
         #shutil.copy2(extdomaincfg[1],rP_WORKDIR+'/domain_cfg.nc')
@@ -117,10 +776,31 @@ def mkmesh(workfol,rP_WORKDIR,DOMAINcfg,BFILE,rP_nml_patch=None,killisf=False,ex
 
 
 
-def main(workfol,rP_CONFIG,rP_CONFIG_TYPE,rP_CASE,NEMOexe,WCONFIG,BFILE,TSFILE,rP_nml_patch=None,FLXFCE='',extdomaincfg=['','']):
+def main(workfol,rP_CONFIG,rP_CONFIG_TYPE,rP_CASE,NEMOexe,WCONFIG,BFILE,TSFILE,rP_nml_patch=None,FLXFCE='',extdomaincfg=['',''],flxlayout='yearly',ypack=1,pipeline=False,decomp='',scaling=[],timing=[],cfl=False,stream=False,zarr={},equil=False):
     """@todo: Docstring for main
     
     :DOMAINcfg: executable to use
+    :flxlayout: how the flux forcing (FLXFCE, ASF only) is laid out in flxfce/, 2 options
+        'yearly' - one symlink per year and grid (flxforce_grid_T_y0001.nc ...) all pointing at the same three files
+        'clim' - three symlinks (flxforce_grid_T.nc ...) and namsbc_flx switched to climatological forcing, which is what the forcing is anyway
+    :ypack: number of model years per nemo.exe launch in goNEMOlong.sh/goNEMOproduction.sh (see wryears), 1 is a launch a year
+    :pipeline: run postNEMO.py in the background of the next nemo.exe launch in goNEMOlong.sh/goNEMOproduction.sh,
+        on a core of the nodes nemo.exe is left without (see wryears)
+    :decomp: MPI decomposition, 3 options
+        '' - default, NEMO picks jpni x jpnj for rP_OCEANCORES ranks
+        'auto' - decompNEMO.py picks jpni x jpnj from BFILE (all-land subdomains dropped) to fit in rP_OCEANCORES ranks
+        'NIxNJ' - e.g. '32x36', that layout (with its all-land subdomains dropped)
+        BFILE only sizes the job, the job scripts pick again from the domain_cfg.nc nemo.exe reads (see wrdecomp)
+    :scaling: core counts for a strong scaling suite (see mkscaling), [] for none
+    :timing: years to run with NEMO's routine timing on (ln_timing, see profileNEMO.py), [] for none, 'spinup'/'production' are the first
+        year of that phase of goNEMOproduction.sh, e.g. ['spinup','production']
+    :cfl: set up goNEMOcfl.sh, a short run with the CFL diagnostics on to find the biggest time step the run can take (see mkcfl)
+    :stream: keep the spin up series and production means up to date a year at a time (streamNEMO.py) rather than running
+        mk_nemo_spinup.py at the end of goNEMOproduction.sh
+    :zarr: {'store': path, 'fields': {key: [variables]}} to append each year's selected fields to the ensemble's Zarr store
+        (zarrNEMO.py, mkensemble makes the store), {} for none
+    :equil: end the spin up of goNEMOproduction.sh as soon as it has settled (equilNEMO.py) rather than always at rP_YEAR_MAX-9,
+        the production phase is then the 10 years after that
     :extdomaincfg: 3 options
         ['',''] - default, we will use parameters provided or modified via namelist (alone)
         ['hacked','/PATH/TO/pythonscripttohack_domain_cfg.nc'] - uses default but will additionally hack the domain_cfg.nc output using passed file
@@ -161,8 +841,28 @@ def main(workfol,rP_CONFIG,rP_CONFIG_TYPE,rP_CASE,NEMOexe,WCONFIG,BFILE,TSFILE,r
     rP_PROJ='n02-PROPHET'
 
     rP_OCEANCORES=20
+    rP_NODES=1
     if rP_CONFIG_TYPE=="ASF":
         rP_OCEANCORES=1024
+        rP_NODES=8
+
+    #the pipelined posts (see wryears) get a core of the nodes to themselves
+    spare=1 if pipeline else 0
+    #jpni x jpnj go in the namelist and the ranks left once the land is dropped in the scripts, see decompNEMO.py
+    rP_nml_mpppatch={}
+    #srun's ranks, with decomp what the job works out from domain_cfg.nc (wrdecomp) in as many ranks as the nodes have room for
+    nranks=str(rP_OCEANCORES)
+    if decomp!='':
+        sys.path.insert(0,HELPERS)
+        import decompNEMO
+        jpni,jpnj,rP_OCEANCORES=decompNEMO.decomp(BFILE,rP_NODES*decompNEMO.CORES-spare,decomp)
+        rP_NODES=-(-rP_OCEANCORES//decompNEMO.CORES)
+        rP_nml_mpppatch={'nammpp':{'jpni':jpni,'jpnj':jpnj}}
+        maxranks=rP_NODES*decompNEMO.CORES-spare
+        nranks='$ranks'
+    elif spare>0 and rP_OCEANCORES==rP_NODES*128:
+        rP_OCEANCORES-=spare
+        print(bcolors.HEADER+ "WARNING: "+bcolors.ENDC+"running nemo.exe on "+str(rP_OCEANCORES)+" ranks so the pipelined postNEMO.py has a core")
 
     #avoid weird char'
     ## dodgy hack for desc
@@ -212,6 +912,9 @@ def main(workfol,rP_CONFIG,rP_CONFIG_TYPE,rP_CASE,NEMOexe,WCONFIG,BFILE,TSFILE,r
 
     FORCING='/work/n01/shared/core2'
 
+    #namelist changes for the production phase (Phase 2 of goNEMOproduction.sh), on top of rP_nml_patch
+    rP_nml_prodpatch={'namtrd':{'ln_dyn_trd':True}}
+
     #if rP_nml_patch!={}:
         #print("")
         #print(bcolors.HEADER+ "WARNING: "  +'We are patching the namelist with: '+  bcolors.ENDC +str(rP_nml_patch) )
@@ -219,7 +922,9 @@ def main(workfol,rP_CONFIG,rP_CONFIG_TYPE,rP_CASE,NEMOexe,WCONFIG,BFILE,TSFILE,r
 
     #make sure you've compiled this!
     #rP_RBUILD_NEMO=NEMOdir+'/TOOLS/REBUILD_NEMO/rebuild_nemo'
-    rP_RBUILD_NEMO='/mnt/lustre/a2fs-work2/work/n02/n02/chbull/nemo/models/NEMO4/tools/REBUILD_NEMO/rebuild_nemo'
+    #rP_RBUILD_NEMO='/mnt/lustre/a2fs-work2/work/n02/n02/chbull/nemo/models/NEMO4/tools/REBUILD_NEMO/rebuild_nemo'
+    #parallel python version (same arguments), put in the run folder below
+    rP_RBUILD_NEMO=rP_WORKDIR+'/rebuild_tiles.py'
     rP_MKPSI='/work/n02/n02/chbull/nemo/bld_configs/input_ajtoy/ncj_psi/post_grid_UV'
 
     DATE=str(datetime.datetime.now())
@@ -274,10 +979,22 @@ def main(workfol,rP_CONFIG,rP_CONFIG_TYPE,rP_CASE,NEMOexe,WCONFIG,BFILE,TSFILE,r
             handle.write('*   TSFILE      '+TSFILE      + '                      *'+'\n')
             if FLXFCE!='':
                 handle.write('*   FLXFILE      '+FLXFCE      + '                      *'+'\n')
+                handle.write('*   FLXLAYOUT    '+flxlayout   + '                      *'+'\n')
                 #handle.write('*   ENAME      '+ifile.attrs['ename']      + '                      *'+'\n')
             handle.write('*   rP_CASE        '+rP_CASE        + '                      *'+'\n')
             handle.write('*   rP_YEAR0       '+str(rP_YEAR0)      + '                      *'+'\n')
             handle.write('*   rP_YEAR_MAX    '+str(rP_YEAR_MAX)   + '                      *'+'\n')
+            handle.write('*   YPACK          '+str(ypack)   + '                      *'+'\n')
+            handle.write('*   PIPELINE       '+str(pipeline)   + '                      *'+'\n')
+            if timing!=[]:
+                handle.write('*   TIMING         '+str(timing)   + '                      *'+'\n')
+            if stream:
+                handle.write('*   STREAM         '+str(stream)   + '                      *'+'\n')
+            if zarr!={}:
+                handle.write('*   ZARR           '+zarr['store']   + '                      *'+'\n')
+            if equil:
+                handle.write('*   EQUIL          '+str(equil)   + '                      *'+'\n')
+            handle.write('*   DECOMP         '+str(decomp)+' '+str(rP_nml_mpppatch.get('nammpp',''))+' '+str(rP_OCEANCORES)+' ranks on '+str(rP_NODES)+' nodes  *'+'\n')
             handle.write('*   RDIR        '+RDIR        + '                      *'+'\n')
             handle.write('*   rP_WORKDIR     '+rP_WORKDIR     + '                      *'+'\n')
             handle.write('*   rP_STOCKDIR    '+rP_STOCKDIR    + '                      *'+'\n')
@@ -310,11 +1027,13 @@ def main(workfol,rP_CONFIG,rP_CONFIG_TYPE,rP_CASE,NEMOexe,WCONFIG,BFILE,TSFILE,r
         # see pro/cons at 
         # https://stackoverflow.com/questions/123198/how-do-i-copy-a-file-in-python
         #ifiles=sorted(glob.glob('/home/chris/VBoxSHARED/repos/nemo_wed_analysis/ajtoy/configs/rnemoARCHER/*'))
-        ifiles=sorted(glob.glob(workfol+'*'))
-        assert(ifiles!=[]),"glob didn't find anything!"
-        for f in ifiles:
-            if os.path.isfile(f):
-                shutil.copy2(f,rP_WORKDIR+'/')
+        #ifiles=sorted(glob.glob(workfol+'*'))
+        #assert(ifiles!=[]),"glob didn't find anything!"
+        #for f in ifiles:
+            #if os.path.isfile(f):
+                #shutil.copy2(f,rP_WORKDIR+'/')
+        #one copy of each template file shared by all runs (hardlinked), see tmplcopy
+        tmplfolder(workfol,rP_WORKDIR+'/',RDIR+'/.tmplstore/')
 
         if rP_CONFIG_TYPE=="AJTOY":
             shutil.move(rP_WORKDIR+'/'+'namelist_ref_ajtoy',rP_WORKDIR+'/'+'namelist_ref')
@@ -331,35 +1050,82 @@ def main(workfol,rP_CONFIG,rP_CONFIG_TYPE,rP_CASE,NEMOexe,WCONFIG,BFILE,TSFILE,r
             shutil.move(rP_WORKDIR+'/'+'file_def_nemo-oce_spin.xml',rP_WORKDIR+'/'+'file_def_nemo-oce.xml')
 
             os.mkdir(rP_WORKDIR+'/flxfce/')
+            #namelist patches, applied in this order
+            nmlstk=[rP_nml_patch]
             if FLXFCE!='':
                 print()
                 print(bcolors.WARNING + "WARNING: Using flxfce " +  FLXFCE + bcolors.ENDC)
                 print()
-                assert(os.path.exists(FLXFCE[:-3]+'T.nc')),"can't find flux forcing grid_T file: "+FLXFCE[:-3]+'T.nc'
-                assert(os.path.exists(FLXFCE[:-3]+'U.nc')),"can't find flux forcing grid_T file: "+FLXFCE[:-3]+'U.nc'
-                assert(os.path.exists(FLXFCE[:-3]+'V.nc')),"can't find flux forcing grid_T file: "+FLXFCE[:-3]+'V.nc'
-
-                for yy in np.arange(rP_YEAR0,rP_YEAR_MAX+52):
-                    yy=str(yy).zfill(4)+'.nc'
-                    os.symlink(FLXFCE[:-3]+'T.nc', rP_WORKDIR+'/flxfce/flxforce_grid_T_y'+yy)
-                    os.symlink(FLXFCE[:-3]+'U.nc', rP_WORKDIR+'/flxfce/flxforce_grid_U_y'+yy)
-                    os.symlink(FLXFCE[:-3]+'V.nc', rP_WORKDIR+'/flxfce/flxforce_grid_V_y'+yy)
+                nmlstk.append(mkflxfce(rP_WORKDIR,FLXFCE,flxlayout,np.arange(rP_YEAR0,rP_YEAR_MAX+52)))
         else:
             os.remove(rP_WORKDIR+'/'+'namelist_ref_ajtoy')
+        if rP_CONFIG_TYPE!="ASF":
+            nmlstk=[rP_nml_patch]
+        if rP_nml_mpppatch!={}:
+            nmlstk.append(rP_nml_mpppatch)
 
+        nmlpath=rP_WORKDIR+'/namelist_ref'
         if rP_nml_patch is not None:
-            nmlpath=rP_WORKDIR+'/namelist_ref'
-            assert(os.path.exists(nmlpath)),"can't find namelist_ref"
             print(bcolors.HEADER+ "WARNING: "+bcolors.ENDC   +'We are patching the main NEMO namelist '+nmlpath+' with: '+  bcolors.HEADER +str(rP_nml_patch) +bcolors.ENDC + " (this shortly gets copied to be namelist_cfg, which then gets patched by preNEMO.py ...)")
-            f90nml.patch(nmlpath, rP_nml_patch, out_path=nmlpath+'_new')
-            shutil.move(nmlpath+'_new', nmlpath)
 
         #os.symlink('namelist_ref', 'namelist_cfg')
         #NEMO4 doesn't seem to like this! (symlink)
          #STOP
            #===>>>> : bad opening file: namelist_cfg
 
-        shutil.copy2(rP_WORKDIR+'/'+'namelist_ref',rP_WORKDIR+'/'+'namelist_cfg')
+        #the whole stack of patches goes on in one pass, namelist_ref_prod (what goNEMOproduction.sh swaps in for Phase 2) is that
+        #with just the production patch on top
+        nmlpatch(nmlpath,nmlstk,[nmlpath,rP_WORKDIR+'/namelist_cfg'])
+        nmlpatch(nmlpath,[rP_nml_prodpatch],[rP_WORKDIR+'/namelist_ref_prod'])
+
+        #time steps per model year, year N's restart is written at step N*nstep
+        rdt=nmlread(nmlpath)['namdom']['rn_rdt']
+        nstep=int(int(rP_NDAYS)*86400//rdt)
+        if ypack>1 or pipeline:
+            #packNEMO.py gives nemo.exe a restart at the end of every year, so a year has to be a whole number of time steps
+            assert((int(rP_NDAYS)*86400)%rdt==0),"can't pack years, a year ("+str(rP_NDAYS)+" days) isn't a whole number of time steps of "+str(rdt)+"s"
+            shutil.copy2(os.path.join(HELPERS,'packNEMO.py'),rP_WORKDIR+'/packNEMO.py')
+        if ypack>1:
+            #and xios to start a new file every year, so the years can be handed to postNEMO.py one at a time
+            sys.path.insert(0,HELPERS)
+            import packNEMO
+            for f in sorted(glob.glob(rP_WORKDIR+'/file_def*.xml')):
+                packNEMO.yearly(f)
+            print(bcolors.HEADER+ "WARNING: "+bcolors.ENDC+"packing "+str(ypack)+" years ("+str(nstep)+" time steps each) per nemo.exe launch")
+        if pipeline:
+            print(bcolors.HEADER+ "WARNING: "+bcolors.ENDC+"postNEMO.py will overlap with the next nemo.exe launch (which runs in .packrun/, see packNEMO.py)")
+        #years with ln_timing on, the first production year is worked out as the job goes (production.start, see profileNEMO.py switch)
+        tyears=sorted(set([1 if y=='spinup' else y for y in timing if y!='production']))+(['production'] if 'production' in timing else [])
+        if tyears!=[]:
+            shutil.copy2(os.path.join(HELPERS,'profileNEMO.py'),rP_WORKDIR+'/profileNEMO.py')
+            print(bcolors.HEADER+ "WARNING: "+bcolors.ENDC+"routine timing (ln_timing) on for years "+' '.join([str(y) for y in tyears])+", see profileNEMO.py")
+
+        shutil.copy2(os.path.join(HELPERS,'rebuild_tiles.py'),rP_RBUILD_NEMO)
+        os.chmod(rP_RBUILD_NEMO,os.stat(rP_RBUILD_NEMO).st_mode | 0o111)
+        #reads the tiles without rebuilding them, for quick looks in the run folder
+        shutil.copy2(os.path.join(HELPERS,'nemotiles.py'),rP_WORKDIR+'/nemotiles.py')
+        #index of the ocean.output.NNNN (python ocean_output.py index .)
+        shutil.copy2(os.path.join(HELPERS,'ocean_output.py'),rP_WORKDIR+'/ocean_output.py')
+        #throughput from the job scripts' telemetry.log (python telemetry.py .)
+        shutil.copy2(os.path.join(HELPERS,'telemetry.py'),rP_WORKDIR+'/telemetry.py')
+        #index of the restarts, keeps all but the newest few deflated (python restarts.py status)
+        shutil.copy2(os.path.join(HELPERS,'restarts.py'),rP_WORKDIR+'/restarts.py')
+        #chunk shape of the outputs from how the diagnostics read them (python chunkNEMO.py record/bench)
+        shutil.copy2(os.path.join(HELPERS,'chunkNEMO.py'),rP_WORKDIR+'/chunkNEMO.py')
+        #momentum budget of the production years from the ln_dyn_trd trends (python budgetNEMO.py .)
+        shutil.copy2(os.path.join(HELPERS,'budgetNEMO.py'),rP_WORKDIR+'/budgetNEMO.py')
+        if stream:
+            #spin up series and production means a year at a time (python streamNEMO.py status)
+            shutil.copy2(os.path.join(HELPERS,'streamNEMO.py'),rP_WORKDIR+'/streamNEMO.py')
+        if zarr!={}:
+            #each year's selected fields into the ensemble's Zarr store (python zarrNEMO.py status STORE)
+            shutil.copy2(os.path.join(HELPERS,'zarrNEMO.py'),rP_WORKDIR+'/zarrNEMO.py')
+        if equil:
+            #drift of the spin up and the early switch to the production phase (python equilNEMO.py status)
+            shutil.copy2(os.path.join(HELPERS,'equilNEMO.py'),rP_WORKDIR+'/equilNEMO.py')
+        if decomp!='':
+            #jpni x jpnj from domain_cfg.nc at run time (python decompNEMO.py fix)
+            shutil.copy2(os.path.join(HELPERS,'decompNEMO.py'),rP_WORKDIR+'/decompNEMO.py')
 
         print(bcolors.WARNING + "WARNING: Using bathymetry and ice-shelf draft" + bcolors.ENDC+" from: "+BFILE)
         print("WARNING: ")
@@ -410,10 +1176,7 @@ def main(workfol,rP_CONFIG,rP_CONFIG_TYPE,rP_CASE,NEMOexe,WCONFIG,BFILE,TSFILE,r
         handle.write('#SBATCH --qos=short'+'\n')
         handle.write('#SBATCH --job-name=nemo_test'+'\n')
         handle.write('#SBATCH --time=00:20:00'+'\n')
-        if rP_CONFIG_TYPE=="ASF":
-            handle.write('#SBATCH --nodes=8'+'\n')
-        else:
-            handle.write('#SBATCH --nodes=1'+'\n')
+        handle.write('#SBATCH --nodes='+str(rP_NODES)+'\n')
 
         handle.write('#SBATCH --ntasks='+str(rP_OCEANCORES)+'\n')
         handle.write('#SBATCH --account=n02-PROPHET'+'\n')
@@ -429,43 +1192,26 @@ def main(workfol,rP_CONFIG,rP_CONFIG_TYPE,rP_CASE,NEMOexe,WCONFIG,BFILE,TSFILE,r
         handle.write("#This is the script allows you to run NEMO real quick..."+"\n")
         handle.write(''+'\n')
 
-        if extdomaincfg[0]=='' or extdomaincfg[0]=='hacked':
-            handle.write('#create domain_cfg.nc'+'\n')
-            handle.write('cd '+'domaincfg'+"\n")
-            handle.write('srun -n 1 ./make_domain_cfg.exe '+"\n")
-            handle.write("if [ -f domain_cfg.nc ]; then"+"\n")
-            handle.write('   mv domain_cfg.nc ../'+"\n")
-            handle.write('else'+"\n")
-            handle.write('   echo "ERROR: domain_cfg NOT created, stopping."'+"\n")
-            handle.write('   exit 1'+"\n")
-            handle.write("fi"+"\n")
-            handle.write('cd '+'..'+"\n")
-            handle.write(''+'\n')
-            if extdomaincfg[0]=='hacked':
-                handle.write('echo "Current Date and Time is (for domaincfg hacking timer): " '+'`date`'+"\n")
-                handle.write('python ' +extdomaincfg[1] +' '+rP_WORKDIR+'/domain_cfg.nc '+rP_WORKDIR+'/domain_cfg_hckd.nc '+'\n')
-                handle.write("if [ -f domain_cfg_hckd.nc ]; then"+"\n")
-                handle.write('   echo "YAY: hacked domain_cfg created."'+"\n")
-                handle.write('   rm domain_cfg.nc'+"\n")
-                handle.write('   mv domain_cfg_hckd.nc domain_cfg.nc'+"\n")
-                handle.write('else'+"\n")
-                handle.write('   echo "ERROR: hacked domain_cfg NOT created, stopping."'+"\n")
-                handle.write('   exit 1'+"\n")
-                handle.write("fi"+"\n")
-                handle.write('echo "Current Date and Time is (for domaincfg hacking timer): " '+'`date`'+"\n")
-                handle.write(''+"\n")
+        wrdomcfg(handle,rP_WORKDIR,extdomaincfg)
+        if decomp!='':
+            wrdecomp(handle,decomp,maxranks)
 
         handle.write('python preNEMO.py'+'\n')
         if rP_CONFIG_TYPE=="ASF":
-            handle.write('srun --ntasks='+str(rP_OCEANCORES)+' ./nemo.exe'+'\n')
+            handle.write('srun --ntasks='+nranks+' ./nemo.exe'+'\n')
         else:
-            handle.write('srun --ntasks='+str(rP_OCEANCORES)+' --mem-bind=local --cpu-bind=v,map_cpu:00,0x1,0x2,0x3,0x4,0x5,0x6,0x7,0x8,0x9,0x10,0x11,0x12,0x13,0x14,0x15,0x16,0x17,0x18,0x19,0x20,0x21,0x22,0x23, ./nemo.exe'+'\n')
+            handle.write('srun --ntasks='+nranks+' --mem-bind=local --cpu-bind=v,map_cpu:00,0x1,0x2,0x3,0x4,0x5,0x6,0x7,0x8,0x9,0x10,0x11,0x12,0x13,0x14,0x15,0x16,0x17,0x18,0x19,0x20,0x21,0x22,0x23, ./nemo.exe'+'\n')
+        if decomp!='':
+            handle.write('python decompNEMO.py check || exit 1'+"\n")
         handle.write('python postNEMO.py'+'\n')
         handle.write('#or more simply'+'\n')
         handle.write('#srun --distribution=block:block --hint=nomultithread -n 4 ./nemo.exe'+'\n')
 
         handle.write('#rebuild outputs '+'\n')
         handle.write('#/mnt/lustre/a2fs-work2/work/n02/n02/chbull/nemo/models/NEMO4/tools/REBUILD_NEMO/rebuild_nemo mesh_mask '+str(rP_OCEANCORES)+'\n')
+        handle.write("if [ -f mesh_mask_0000.nc ]; then"+"\n")
+        handle.write('   python rebuild_tiles.py mesh_mask '+nranks+'\n')
+        handle.write("fi"+"\n")
 
 
     subprocess.call('chmod u+x '+rP_WORKDIR+'/goNEMOquick.sh',shell=True)
@@ -475,10 +1221,7 @@ def main(workfol,rP_CONFIG,rP_CONFIG_TYPE,rP_CASE,NEMOexe,WCONFIG,BFILE,TSFILE,r
         handle.write('#SBATCH --job-name='+rP_CONFIG+'_'+rP_CASE+'\n')
         #handle.write('#SBATCH --time=23:57:02'+'\n')
         handle.write('#SBATCH --time=47:57:02'+'\n')
-        if rP_CONFIG_TYPE=="ASF":
-            handle.write('#SBATCH --nodes=8'+'\n')
-        else:
-            handle.write('#SBATCH --nodes=1'+'\n')
+        handle.write('#SBATCH --nodes='+str(rP_NODES)+'\n')
 
         handle.write('#SBATCH --ntasks='+str(rP_OCEANCORES)+'\n')
         handle.write('#SBATCH --account=n02-PROPHET'+'\n')
@@ -497,33 +1240,12 @@ def main(workfol,rP_CONFIG,rP_CONFIG_TYPE,rP_CASE,NEMOexe,WCONFIG,BFILE,TSFILE,r
         handle.write('echo "Current Date and Time is (start): " '+'`date`'+"\n")
         handle.write(''+'\n')
 
-        if extdomaincfg[0]=='' or extdomaincfg[0]=='hacked':
-            handle.write('#create domain_cfg.nc'+'\n')
-            handle.write('cd '+'domaincfg'+"\n")
-            handle.write('srun -n 1 ./make_domain_cfg.exe '+"\n")
-            handle.write("if [ -f domain_cfg.nc ]; then"+"\n")
-            handle.write('   mv domain_cfg.nc ../'+"\n")
-            handle.write('else'+"\n")
-            handle.write('   echo "ERROR: domain_cfg NOT created, stopping."'+"\n")
-            handle.write('   exit 1'+"\n")
-            handle.write("fi"+"\n")
-            handle.write('cd '+'..'+"\n")
-            handle.write(''+'\n')
-            if extdomaincfg[0]=='hacked':
-                handle.write('echo "Current Date and Time is (for domaincfg hacking timer): " '+'`date`'+"\n")
-                handle.write('python ' +extdomaincfg[1] +' '+rP_WORKDIR+'/domain_cfg.nc '+rP_WORKDIR+'/domain_cfg_hckd.nc '+'\n')
-                handle.write("if [ -f domain_cfg_hckd.nc ]; then"+"\n")
-                handle.write('   echo "YAY: hacked domain_cfg created."'+"\n")
-                handle.write('   rm domain_cfg.nc'+"\n")
-                handle.write('   mv domain_cfg_hckd.nc domain_cfg.nc'+"\n")
-                handle.write('else'+"\n")
-                handle.write('   echo "ERROR: hacked domain_cfg NOT created, stopping."'+"\n")
-                handle.write('   exit 1'+"\n")
-                handle.write("fi"+"\n")
-                handle.write('echo "Current Date and Time is (for domaincfg hacking timer): " '+'`date`'+"\n")
-                handle.write(''+"\n")
+        wrdomcfg(handle,rP_WORKDIR,extdomaincfg)
+        if decomp!='':
+            wrdecomp(handle,decomp,maxranks)
 
         handle.write(' '+"\n")
+        handle.write('cwd='+rP_WORKDIR+"\n")
         handle.write('cd $cwd'+"\n")
         handle.write("if [ -f time.year.step ]; then"+"\n")
         handle.write("   source time.year.step"+"\n")
@@ -535,35 +1257,7 @@ def main(workfol,rP_CONFIG,rP_CONFIG_TYPE,rP_CASE,NEMOexe,WCONFIG,BFILE,TSFILE,r
         handle.write('echo "Running year: "'+"\n")
         handle.write('echo "Running year: "$year" out of '+str(rP_YEAR_MAX)+'"'+"\n")
         handle.write('echo " "'+"\n")
-        handle.write("while [ $year -lt "+str(int(rP_YEAR_MAX)+1)+" ]"+"\n")
-        #handle.write('for i in {1..'+rP_YEAR_MAX+'}'+"\n")
-        #handle.write('for i in {1..'+rP_YEAR_MAX+'}'+"\n")
-        handle.write('do'+"\n")
-
-        handle.write('    echo "Current Date and Time is ("$year" start): " '+'`date`'+"\n")
-        handle.write('    echo "Run NEMO"'+"\n")
-
-        handle.write('    cd '+rP_WORKDIR+"\n")
-        handle.write('    echo "Current directory is:"'+"\n")
-        handle.write('    pwd'+"\n")
-        handle.write('    python preNEMO.py'+"\n")
-        handle.write('    srun --ntasks='+str(rP_OCEANCORES)+' ./nemo.exe'+'\n')
-        handle.write(' '+"\n")
-
-        handle.write('    echo "Clean up NEMO"'+"\n")
-        handle.write('    srun --ntasks='+'1'+' --tasks-per-node='+'1'+' --cpus-per-task=1 python postNEMO.py '+"\n")
-
-        handle.write('    wait'+"\n")
-        handle.write('    echo "Current Date and Time is ("$year" end): " '+'`date`'+"\n")
-
-        handle.write('    '+"\n")
-
-        handle.write('    echo "And repeat."'+"\n")
-
-        handle.write("    year=$[$year+1]"+"\n")
-        handle.write('    cd $cwd'+"\n")
-        handle.write("    echo 'year='$year > time.year.step"+"\n")
-        handle.write('done'+"\n")
+        wryears(handle,rP_WORKDIR,nranks,int(rP_YEAR_MAX)+1,ypack,pipeline,timing=tyears,stream=stream,zarr=zarr.get('store',''),decomp=decomp!='')
 
         handle.write('echo "Current Date and Time is (end): " '+'`date`'+"\n")
         handle.write('echo "Its over..."'+"\n")
@@ -571,15 +1265,14 @@ def main(workfol,rP_CONFIG,rP_CONFIG_TYPE,rP_CASE,NEMOexe,WCONFIG,BFILE,TSFILE,r
     subprocess.call('chmod u+x '+rP_WORKDIR+'/goNEMOlong.sh',shell=True)
 
 
+    #the job resubmits itself when the next year won't fit in this (see wryears)
+    walltime='23:57:02'
     with ctx.closing(open(rP_WORKDIR+'/goNEMOproduction.sh','w')) as handle:
         handle.write('#!/bin/bash'+'\n')
         handle.write('#SBATCH --job-name='+rP_CONFIG+'_'+rP_CASE+'\n')
-        handle.write('#SBATCH --time=23:57:02'+'\n')
+        handle.write('#SBATCH --time='+walltime+'\n')
         #handle.write('#SBATCH --time=47:57:02'+'\n')
-        if rP_CONFIG_TYPE=="ASF":
-            handle.write('#SBATCH --nodes=8'+'\n')
-        else:
-            handle.write('#SBATCH --nodes=1'+'\n')
+        handle.write('#SBATCH --nodes='+str(rP_NODES)+'\n')
 
         handle.write('#SBATCH --ntasks='+str(rP_OCEANCORES)+'\n')
         handle.write('#SBATCH --account=n02-PROPHET'+'\n')
@@ -596,35 +1289,18 @@ def main(workfol,rP_CONFIG,rP_CONFIG_TYPE,rP_CASE,NEMOexe,WCONFIG,BFILE,TSFILE,r
         handle.write('#'+'\n')
         handle.write("#This is the script allows you to run NEMO one job at a time..."+"\n")
         handle.write('echo "Current Date and Time is (start): " '+'`date`'+"\n")
+        handle.write('#for the wall-clock scheduler: start of the job, length of the job and what to leave spare at the end (s)'+"\n")
+        handle.write('tstart=`date +%s`'+"\n")
+        handle.write('twall='+str(sum([int(t)*60**i for i,t in enumerate(walltime.split(':')[::-1])]))+"\n")
+        handle.write('tspare=900'+"\n")
         handle.write(''+'\n')
 
-        if extdomaincfg[0]=='' or extdomaincfg[0]=='hacked':
-            handle.write('#create domain_cfg.nc'+'\n')
-            handle.write('cd '+'domaincfg'+"\n")
-            handle.write('srun -n 1 ./make_domain_cfg.exe '+"\n")
-            handle.write("if [ -f domain_cfg.nc ]; then"+"\n")
-            handle.write('   mv domain_cfg.nc ../'+"\n")
-            handle.write('else'+"\n")
-            handle.write('   echo "ERROR: domain_cfg NOT created, stopping."'+"\n")
-            handle.write('   exit 1'+"\n")
-            handle.write("fi"+"\n")
-            handle.write('cd '+'..'+"\n")
-            handle.write(''+'\n')
-            if extdomaincfg[0]=='hacked':
-                handle.write('echo "Current Date and Time is (for domaincfg hacking timer): " '+'`date`'+"\n")
-                handle.write('python ' +extdomaincfg[1] +' '+rP_WORKDIR+'/domain_cfg.nc '+rP_WORKDIR+'/domain_cfg_hckd.nc '+'\n')
-                handle.write("if [ -f domain_cfg_hckd.nc ]; then"+"\n")
-                handle.write('   echo "YAY: hacked domain_cfg created."'+"\n")
-                handle.write('   rm domain_cfg.nc'+"\n")
-                handle.write('   mv domain_cfg_hckd.nc domain_cfg.nc'+"\n")
-                handle.write('else'+"\n")
-                handle.write('   echo "ERROR: hacked domain_cfg NOT created, stopping."'+"\n")
-                handle.write('   exit 1'+"\n")
-                handle.write("fi"+"\n")
-                handle.write('echo "Current Date and Time is (for domaincfg hacking timer): " '+'`date`'+"\n")
-                handle.write(''+"\n")
+        wrdomcfg(handle,rP_WORKDIR,extdomaincfg)
+        if decomp!='':
+            wrdecomp(handle,decomp,maxranks)
 
         handle.write(' '+"\n")
+        handle.write('cwd='+rP_WORKDIR+"\n")
         handle.write('cd $cwd'+"\n")
         handle.write("if [ -f time.year.step ]; then"+"\n")
         handle.write("   source time.year.step"+"\n")
@@ -646,47 +1322,36 @@ def main(workfol,rP_CONFIG,rP_CONFIG_TYPE,rP_CASE,NEMOexe,WCONFIG,BFILE,TSFILE,r
         #SYEARS=int(rP_YEAR_MAX)-4
         #SYEARS=int(rP_YEAR_MAX)-19
         SYEARS=int(rP_YEAR_MAX)-9
-        handle.write("while [ $year -lt "+str(SYEARS)+" ]"+"\n")
-        handle.write('do'+"\n")
-
-        handle.write('    echo "Current Date and Time is ("$year" start): " '+'`date`'+"\n")
-        handle.write('    echo "Run NEMO"'+"\n")
-
-        handle.write('    cd '+rP_WORKDIR+"\n")
-        handle.write('    echo "Current directory is:"'+"\n")
-        handle.write('    pwd'+"\n")
-        handle.write('    python preNEMO.py'+"\n")
-        handle.write('    srun --ntasks='+str(rP_OCEANCORES)+' ./nemo.exe'+'\n')
-        handle.write(' '+"\n")
-
-        handle.write('    echo "Clean up NEMO"'+"\n")
-        handle.write('    srun --ntasks='+'1'+' --tasks-per-node='+'1'+' --cpus-per-task=1 python postNEMO.py '+"\n")
-
-        handle.write('    wait'+"\n")
-        handle.write('    echo "Current Date and Time is ("$year" end): " '+'`date`'+"\n")
-
-        handle.write('    '+"\n")
-
-        handle.write('    echo "And repeat."'+"\n")
-
-        handle.write("    year=$[$year+1]"+"\n")
-        handle.write('    cd $cwd'+"\n")
-        handle.write("    echo 'year='$year > time.year.step"+"\n")
-        handle.write('done'+"\n")
+        wryears(handle,rP_WORKDIR,nranks,SYEARS,ypack,pipeline,resubmit=rP_WORKDIR+'/goNEMOproduction.sh',phase='spinup',timing=tyears,stream=stream,zarr=zarr.get('store',''),equil=equil,decomp=decomp!='')
 
         handle.write('echo "---              ---"'+"\n")
         handle.write('echo "---  Phase 1 end ---"'+"\n")
         handle.write('echo "---              ---"'+"\n")
         handle.write('echo ""'+"\n")
+        #the last year is 10 years after the switch, however early it was
+        yend=str(int(rP_YEAR_MAX)+1)
+        if equil:
+            yend='$yend'
+            handle.write("if [ ! -f production.start ]; then"+"\n")
+            handle.write('   if [ -f spinup.done ]; then echo "Spin up settled after year "`cut -d" " -f1 spinup.done`" (equilNEMO.py)"; fi'+"\n")
+            handle.write('   echo $year > production.start'+"\n")
+            handle.write("fi"+"\n")
+            handle.write('yend=$[`cat production.start`+'+str(int(rP_YEAR_MAX)+1-SYEARS)+']'+"\n")
+            handle.write('echo "Production phase: years "`cat production.start`" to "$[$yend-1]'+"\n")
 
+        #a resubmitted job gets here again, so only swap once
+        handle.write("if [ -f phase2.swapped ]; then"+"\n")
+        handle.write('echo "Production xml files and namelist already swapped in"'+"\n")
+        handle.write('else'+"\n")
         handle.write('echo "Swapping in production xml files"'+"\n")
         handle.write('#change outputs from spin up to ones with full output and momentum diagnostics'+'\n')
         handle.write('mv file_def_nemo-oce_asfmo.xml file_def_nemo-oce.xml'+"\n")
         handle.write('mv field_def_nemo-oce_asfmo.xml field_def_nemo-oce.xml'+"\n")
         handle.write('echo "Turning on momentum diagnostics"'+"\n")
         handle.write('#thanks Marshall!'+'\n')
-        handle.write('f90nml -g namtrd -v ln_dyn_trd=True --patch '+rP_WORKDIR+'/'+'namelist_cfg '+rP_WORKDIR+'/'+'namelist_meh'+"\n")
-        handle.write("if [ -f namelist_meh ]; then"+"\n")
+        #handle.write('f90nml -g namtrd -v ln_dyn_trd=True --patch '+rP_WORKDIR+'/'+'namelist_cfg '+rP_WORKDIR+'/'+'namelist_meh'+"\n")
+        #namelist_ref_prod was made (with rP_nml_prodpatch) when we set up
+        handle.write("if [ -f namelist_ref_prod ]; then"+"\n")
         handle.write('   echo "YAY: namelist succesfully hacked."'+"\n")
         handle.write('else'+"\n")
         handle.write('   echo "ERROR: hacked namelist NOT created, stopping."'+"\n")
@@ -694,7 +1359,9 @@ def main(workfol,rP_CONFIG,rP_CONFIG_TYPE,rP_CASE,NEMOexe,WCONFIG,BFILE,TSFILE,r
         handle.write(' '+"\n")
         handle.write("fi"+"\n")
         #we have to do namelist_ref b/c preNEMO copies over the cfg
-        handle.write('mv '+rP_WORKDIR+'/'+'namelist_meh '+rP_WORKDIR+'/'+'namelist_ref '+"\n")
+        handle.write('mv '+rP_WORKDIR+'/'+'namelist_ref_prod '+rP_WORKDIR+'/'+'namelist_ref '+"\n")
+        handle.write('touch phase2.swapped'+"\n")
+        handle.write("fi"+"\n")
         
 
         handle.write('echo ""'+"\n")
@@ -703,33 +1370,7 @@ def main(workfol,rP_CONFIG,rP_CONFIG_TYPE,rP_CASE,NEMOexe,WCONFIG,BFILE,TSFILE,r
         handle.write('echo "---  Phase 2 start ---"'+"\n")
         handle.write('echo "---  USEFUL OUTPUT ---"'+"\n")
 
-        handle.write("while [ $year -lt "+str(int(rP_YEAR_MAX)+1)+" ]"+"\n")
-        handle.write('do'+"\n")
-
-        handle.write('    echo "Current Date and Time is ("$year" start): " '+'`date`'+"\n")
-        handle.write('    echo "Run NEMO"'+"\n")
-
-        handle.write('    cd '+rP_WORKDIR+"\n")
-        handle.write('    echo "Current directory is:"'+"\n")
-        handle.write('    pwd'+"\n")
-        handle.write('    python preNEMO.py'+"\n")
-        handle.write('    srun --ntasks='+str(rP_OCEANCORES)+' ./nemo.exe'+'\n')
-        handle.write(' '+"\n")
-
-        handle.write('    echo "Clean up NEMO"'+"\n")
-        handle.write('    srun --ntasks='+'1'+' --tasks-per-node='+'1'+' --cpus-per-task=1 python postNEMO.py '+"\n")
-
-        handle.write('    wait'+"\n")
-        handle.write('    echo "Current Date and Time is ("$year" end): " '+'`date`'+"\n")
-
-        handle.write('    '+"\n")
-
-        handle.write('    echo "And repeat."'+"\n")
-
-        handle.write("    year=$[$year+1]"+"\n")
-        handle.write('    cd $cwd'+"\n")
-        handle.write("    echo 'year='$year > time.year.step"+"\n")
-        handle.write('done'+"\n")
+        wryears(handle,rP_WORKDIR,nranks,yend,ypack,pipeline,resubmit=rP_WORKDIR+'/goNEMOproduction.sh',phase='production',timing=tyears,stream=stream,zarr=zarr.get('store',''),decomp=decomp!='')
 
         handle.write('echo "---                ---"'+"\n")
         handle.write('echo "---  Phase 2 end   ---"'+"\n")
@@ -737,26 +1378,35 @@ def main(workfol,rP_CONFIG,rP_CONFIG_TYPE,rP_CASE,NEMOexe,WCONFIG,BFILE,TSFILE,r
 
         #add if statement here!
         #if [ $Server_Name -eq 1 ];then
-        handle.write("if [ $year -eq "+str(int(rP_YEAR_MAX)+1)+" ]; then"+"\n")
+        handle.write("if [ $year -eq "+yend+" ]; then"+"\n")
         handle.write("   echo 'Sweet, we have finished the run side of things now to do post proc'"+"\n")
 
         handle.write('   echo "---                      ---"'+"\n")
         handle.write('   echo "---  Post-proc start     ---"'+"\n")
         handle.write('   echo "Current Date and Time is (end): " '+'`date`'+"\n")
         handle.write('   echo ""'+"\n")
-        handle.write('   echo "#activate anaconda (this needs python2)"'+"\n")
-        handle.write('   export PYTHONPATH=/work/n02/n02/chbull/anaconda2/pkgs;export PATH=/work/n02/n02/chbull/anaconda2/bin:$PATH;source activate root'+"\n")
-
-        #need to find mk_nemo_spinup.py
         #output folder - this doesn't exist yet!
         odir=rP_STOCKDIR+'/'+rP_CONFIG+'_'+rP_CASE+'/'
-        supf=os.path.dirname(os.path.dirname(os.path.dirname(workfol)))+'/diagnostics/mk_nemo_spinup.py'
-        assert(os.path.exists(supf)),"cannot find mk_nemo_spinup.py file"
+        if stream:
+            #the years were folded in as they finished, so all that's left is to write the files out
+            handle.write('   echo "finalize the spin up series and production means (streamNEMO.py)"'+"\n")
+            handle.write('   cd '+rP_WORKDIR+"\n")
+            handle.write('   python streamNEMO.py fold $[$year-1] >> stream.log 2>&1'+"\n")
+            handle.write('   python streamNEMO.py finalize || exit 1'+"\n")
+            handle.write('   mkdir -p '+odir+"\n")
+            handle.write('   cp stream/*_series_*.nc stream/*_prodmean_*.nc '+odir+"\n")
+        else:
+            handle.write('   echo "#activate anaconda (this needs python2)"'+"\n")
+            handle.write('   export PYTHONPATH=/work/n02/n02/chbull/anaconda2/pkgs;export PATH=/work/n02/n02/chbull/anaconda2/bin:$PATH;source activate root'+"\n")
+
+            #need to find mk_nemo_spinup.py
+            supf=os.path.dirname(os.path.dirname(os.path.dirname(workfol)))+'/diagnostics/mk_nemo_spinup.py'
+            assert(os.path.exists(supf)),"cannot find mk_nemo_spinup.py file"
         
-        handle.write('   echo "run wrappers for spin up and ncra post proc"'+"\n")
-        #crucial so that the wrappers are found in the 'right' place - does mean the pbs files will be here tho
-        handle.write('   cd '+os.path.dirname(os.path.dirname(os.path.dirname(workfol)))+'/diagnostics/'+"\n")
-        handle.write('   python ' + supf + ' ' + odir + ' ' + odir+"\n")
+            handle.write('   echo "run wrappers for spin up and ncra post proc"'+"\n")
+            #crucial so that the wrappers are found in the 'right' place - does mean the pbs files will be here tho
+            handle.write('   cd '+os.path.dirname(os.path.dirname(os.path.dirname(workfol)))+'/diagnostics/'+"\n")
+            handle.write('   python ' + supf + ' ' + odir + ' ' + odir+"\n")
 
         handle.write('   echo "---  Post-proc end     ---"'+"\n")
         handle.write('   echo "---                    ---"'+"\n")
@@ -772,19 +1422,271 @@ def main(workfol,rP_CONFIG,rP_CONFIG_TYPE,rP_CASE,NEMOexe,WCONFIG,BFILE,TSFILE,r
 
     subprocess.call('chmod u+x '+rP_WORKDIR+'/goNEMOproduction.sh',shell=True)
 
+    if scaling!=[]:
+        mkscaling(rP_WORKDIR,rP_CONFIG,rP_CASE,BFILE,extdomaincfg,scaling)
+    if cfl:
+        mkcfl(rP_WORKDIR,rP_CONFIG,rP_OCEANCORES,rP_NODES,extdomaincfg,decomp,maxranks if decomp!='' else None)
+
     #so we can run lots at once
     mkdir(workfol+'rfiles/')
-    if not os.path.exists(workfol+'rfiles/runme'):
-        with ctx.closing(open(workfol+'rfiles/runme','w')) as handle:
+    #'x' so that when members are set up concurrently only one of them writes the header
+    try:
+        with ctx.closing(open(workfol+'rfiles/runme','x')) as handle:
             handle.write(str(rP_YEAR_MAX)+''+'\n')
+    except FileExistsError:
+        pass
 
     with ctx.closing(open(workfol+'rfiles/runme','a')) as handle:
         handle.write(rP_WORKDIR+'/ '+'\n')
+    #watches all the members in runme (python rfiles/monitorNEMO.py rfiles/runme)
+    shutil.copy2(os.path.join(HELPERS,'monitorNEMO.py'),workfol+'rfiles/monitorNEMO.py')
+    #where the production phase starts and how long it is (monitorNEMO.py imports them)
+    shutil.copy2(os.path.join(HELPERS,'restarts.py'),workfol+'rfiles/restarts.py')
 
     return rP_WORKDIR
 
+def setupmember(m):
+    """set up a single ensemble member: main(), then mkmesh(), then (optionally) submit it
+
+    This is what each worker of mkensemble runs. Everything main/mkmesh print goes to a per-member log in workfol/rfiles/ so the members don't talk over each other.
+    
+    :m: dictionary of member settings (see mkensemble)
+    :returns: (name, rP_WORKDIR, error, seconds) where rP_WORKDIR is None and error is the traceback if the member failed
+    """
+    #main() picks these up as globals (as it does when called from __main__)
+    global rP_NDAYS,NEMOdir
+    rP_NDAYS=m['rP_NDAYS']
+    NEMOdir=m['NEMOdir']
+
+    name=m['rP_CONFIG']+'_'+m['rP_CASE']
+    t0=time.time()
+    mkdir(m['workfol']+'rfiles/')
+    with ctx.closing(open(m['workfol']+'rfiles/'+name+'.log','w')) as handle:
+        try:
+            with ctx.redirect_stdout(handle):
+                rP_WORKDIR=main(m['workfol'],m['rP_CONFIG'],m['rP_CONFIG_TYPE'],m['rP_CASE'],m['NEMOexe'],m['WCONFIG'],m['BFILE'],m['TSFILE'],FLXFCE=m['FLXFCE'],rP_nml_patch=m['rP_nml_patch'],extdomaincfg=m['extdomaincfg'],flxlayout=m.get('flxlayout','yearly'),ypack=m.get('ypack',1),pipeline=m.get('pipeline',False),decomp=m.get('decomp',''),scaling=m.get('scaling',[]),timing=m.get('timing',[]),cfl=m.get('cfl',False),stream=m.get('stream',False),zarr=m.get('zarr',{}),equil=m.get('equil',False))
+                mkmesh(m['workfol'],rP_WORKDIR,m['DOMAINcfg'],m['BFILE'],rP_nml_patch=m['rP_nml_domcfgpatch'],killisf=m['killisf'],extdomaincfg=m['extdomaincfg'])
+                if m['submit']=='goNEMOscaling.sh':
+                    #not a job itself, it submits the ladder
+                    handle.flush()
+                    subprocess.check_call('bash '+rP_WORKDIR+'/goNEMOscaling.sh',shell=True,stdout=handle,stderr=subprocess.STDOUT)
+                elif m['submit']!='':
+                    handle.flush()
+                    subprocess.check_call('cd '+rP_WORKDIR+'; sbatch '+rP_WORKDIR+'/'+m['submit'],shell=True,stdout=handle,stderr=subprocess.STDOUT)
+        except BaseException:
+            #BaseException as main() sys.exit's if the run folder is already there
+            err=traceback.format_exc()
+            handle.write(err)
+            return name,None,err,time.time()-t0
+    return name,rP_WORKDIR,None,time.time()-t0
+
+def mkensemble(members,nproc=None):
+    """set up a whole ensemble of run directories concurrently on a pool of worker processes
+
+    Each member is set up in its own process (main() and mkmesh() chdir about, so threads are no good), 
+    a failing member (missing BFILE, run folder already there etc.) is reported and the others carry on.
+    
+    :members: list of dictionaries, one per member, with keys:
+        workfol,rP_CONFIG,rP_CONFIG_TYPE,rP_CASE,NEMOexe,NEMOdir,WCONFIG,BFILE,TSFILE,FLXFCE,rP_NDAYS,
+        rP_nml_patch,rP_nml_domcfgpatch,DOMAINcfg,killisf,extdomaincfg,submit ('' to not submit, otherwise the script to sbatch, e.g. 'goNEMOproduction.sh', 
+        or goNEMOscaling.sh to submit the scaling suite)
+        and optionally flxlayout, ypack, pipeline, decomp, scaling, timing, cfl, stream, zarr and equil (see main)
+    :nproc: number of worker processes (default: one per member up to 16, it's file system rather than cpu bound work)
+    :returns: list of (name, rP_WORKDIR, error, seconds), in the order of members
+    """
+    if members==[]:
+        print(bcolors.WARNING + "WARNING: no ensemble members to set up!" + bcolors.ENDC)
+        return []
+    if nproc is None:
+        nproc=min(len(members),16)
+
+    print("****************************************************")
+    print("*   setting up "+str(len(members))+" ensemble members on "+str(nproc)+" workers")
+    print("****************************************************")
+    t0=time.time()
+    status={}
+    #the Zarr stores are made (or get the new members) before anything runs, so each member's place in them is fixed
+    stores={}
+    for m in members:
+        if m.get('zarr',{})!={}:
+            stores.setdefault(m['zarr']['store'],(m['zarr']['fields'],[]))[1].append(m['rP_CONFIG']+'_'+m['rP_CASE'])
+    if stores!={}:
+        import zarrNEMO
+        for store,(fields,names) in stores.items():
+            new=zarrNEMO.init(store,fields,names)
+            print("*   Zarr store "+store+": "+str(len(new))+" new members")
+    #hash (and parse the namelists of) the template files once here, the workers inherit sha1cache/nmlcache
+    for wfol in set([m['workfol'] for m in members]):
+        for f in glob.glob(wfol+'*')+glob.glob(wfol+'domaincfg/*'):
+            if os.path.isfile(f):
+                sha1sum(f)
+                if os.path.basename(f).startswith('namelist'):
+                    nmlread(f)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=nproc) as pool:
+        jobs={pool.submit(setupmember,m):m for m in members}
+        for cnt,job in enumerate(concurrent.futures.as_completed(jobs)):
+            m=jobs[job]
+            try:
+                name,rP_WORKDIR,err,secs=job.result()
+            except Exception:
+                #worker died (rather than the member failing)
+                name,rP_WORKDIR,err,secs=m['rP_CONFIG']+'_'+m['rP_CASE'],None,traceback.format_exc(),np.nan
+            status[name]=(name,rP_WORKDIR,err,secs)
+            prog='['+str(cnt+1).rjust(len(str(len(members))))+'/'+str(len(members))+'] '
+            if err is None:
+                print(prog+bcolors.OKGREEN+'OK   '+bcolors.ENDC+name+' ('+str(round(secs,1))+'s) '+rP_WORKDIR)
+            else:
+                print(prog+bcolors.FAIL+'FAIL '+bcolors.ENDC+name+': '+err.strip().splitlines()[-1]+' (see '+m['workfol']+'rfiles/'+name+'.log)')
+
+    status=[status[m['rP_CONFIG']+'_'+m['rP_CASE']] for m in members]
+    nfail=len([s for s in status if s[2] is not None])
+    print("****************************************************")
+    print("*   "+str(len(members)-nfail)+" members set up, "+str(nfail)+" failed, in "+str(round(time.time()-t0,1))+'s')
+    print("****************************************************")
+    return status
+
+def readmanifest(mfile):
+    """read and validate an experiment manifest (yaml) and expand it into the list of members for mkensemble
+
+    The manifest has three parts:
+        workfol: the template folder (namelists, xml files etc.)
+        defaults: settings shared by all members, same keys as the member dictionaries of mkensemble
+        members: list of members, each entry overrides the defaults. rP_nml_patch/rP_nml_domcfgpatch are merged 
+                 namelist group by group. Any other (scalar) keys of a member, e.g. NUM or flx, are template variables, 
+                 so strings can be written as '{WCONFIG}/flxforce_case{flx}_grid_.nc'
+    Everything is checked before anything gets made, and all the problems found are reported together.
+
+    :mfile: path to the manifest
+    :returns: list of member dictionaries
+    """
+    import yaml
+    with ctx.closing(open(mfile,'r')) as handle:
+        mani=yaml.safe_load(handle)
+
+    keys=['rP_CONFIG','rP_CONFIG_TYPE','rP_CASE','NEMOexe','NEMOdir','WCONFIG','BFILE','TSFILE','FLXFCE','rP_NDAYS',\
+          'rP_nml_patch','rP_nml_domcfgpatch','DOMAINcfg','killisf','extdomaincfg','submit','flxlayout','ypack','pipeline','decomp','scaling','timing','cfl','stream','zarr','equil']
+    optional={'FLXFCE':'','rP_nml_patch':{},'rP_nml_domcfgpatch':{},'killisf':False,'extdomaincfg':['',''],'submit':'','flxlayout':'yearly','ypack':1,'pipeline':False,'decomp':'','scaling':[],'timing':[],'cfl':False,'stream':False,'zarr':{},'equil':False}
+    errs=[]
+
+    if not isinstance(mani,dict) or not isinstance(mani.get('members'),list) or mani['members']==[]:
+        raise ValueError(mfile+': manifest needs a (non-empty) list of members')
+    for k in mani:
+        if k not in ['workfol','defaults','members']:
+            errs.append('unknown top level entry: '+str(k))
+    if not isinstance(mani.get('workfol'),str):
+        errs.append('workfol (template folder) missing')
+    elif not mani['workfol'].endswith('/'):
+        mani['workfol']+='/'
+    defaults=mani.get('defaults') or {}
+    for k in defaults:
+        if k not in keys:
+            errs.append('defaults: unknown setting '+str(k))
+
+    members=[]
+    for cnt,mem in enumerate(mani['members']):
+        if not isinstance(mem,dict):
+            errs.append('member '+str(cnt)+': should be a dictionary, got '+str(mem))
+            continue
+        m=dict(optional)
+        m.update({k:v for k,v in defaults.items() if k not in ['rP_nml_patch','rP_nml_domcfgpatch']})
+        m.update({k:v for k,v in mem.items() if k not in ['rP_nml_patch','rP_nml_domcfgpatch']})
+        for nml in ['rP_nml_patch','rP_nml_domcfgpatch']:
+            m[nml]={}
+            for patch in [defaults.get(nml) or {},mem.get(nml) or {}]:
+                if not isinstance(patch,dict) or [g for g in patch.values() if not isinstance(g,dict)]:
+                    errs.append('member '+str(cnt)+': '+nml+' should be {group: {variable: value}}')
+                    continue
+                for group,entries in patch.items():
+                    m[nml].setdefault(group,{}).update(entries)
+
+        #fill in the templates
+        tvars={k:v for k,v in m.items() if not isinstance(v,(dict,list))}
+        try:
+            for k in keys:
+                if isinstance(m.get(k),str):
+                    m[k]=m[k].format(**tvars)
+            m['extdomaincfg']=[str(e).format(**tvars) for e in m['extdomaincfg']]
+        except (KeyError,IndexError) as e:
+            errs.append('member '+str(cnt)+': unknown template variable '+str(e))
+            continue
+        name='member '+str(cnt)+' ('+str(m.get('rP_CONFIG'))+')'
+
+        for k in keys:
+            if k not in m:
+                errs.append(name+': '+k+' not set (neither in defaults nor the member)')
+        for k,v in mem.items():
+            if k not in keys and isinstance(v,(dict,list)):
+                errs.append(name+': unknown setting '+str(k))
+        if m.get('rP_CONFIG_TYPE') not in ['SVM','AJTOY','ASF','SR_ML']:
+            errs.append(name+': do not know rP_CONFIG_TYPE '+str(m.get('rP_CONFIG_TYPE')))
+        if not isinstance(m['extdomaincfg'],list) or len(m['extdomaincfg'])!=2 or m['extdomaincfg'][0] not in ['','hacked','rogue']:
+            errs.append(name+': extdomaincfg should be [\'\',\'\'], [hacked, script] or [rogue, domain_cfg.nc]')
+        if m['submit'] not in ['','goNEMOquick.sh','goNEMOlong.sh','goNEMOproduction.sh','goNEMOscaling.sh','goNEMOcfl.sh']:
+            errs.append(name+': do not know how to submit '+str(m['submit']))
+        if not isinstance(m['killisf'],bool):
+            errs.append(name+': killisf should be true/false')
+        if not isinstance(m.get('rP_NDAYS'),int):
+            errs.append(name+': rP_NDAYS should be an integer')
+        if not isinstance(m.get('rP_CASE'),str):
+            errs.append(name+': rP_CASE should be a string (quote it, e.g. \'00008\')')
+        if m.get('rP_CONFIG_TYPE')=='ASF' and m['FLXFCE']=='':
+            errs.append(name+': ASF runs need FLXFCE')
+        if m['flxlayout'] not in ['yearly','clim']:
+            errs.append(name+': flxlayout should be yearly or clim')
+        if not isinstance(m['ypack'],int) or isinstance(m['ypack'],bool) or m['ypack']<1:
+            errs.append(name+': ypack should be a whole number of years (>=1)')
+        if not isinstance(m['pipeline'],bool):
+            errs.append(name+': pipeline should be true/false')
+        if not isinstance(m['decomp'],str) or not (m['decomp'] in ['','auto'] or re.match(r'^\d+x\d+$',m['decomp'])):
+            errs.append(name+': decomp should be \'\', auto or NIxNJ (e.g. 32x36)')
+        if not isinstance(m['scaling'],list) or [c for c in m['scaling'] if not isinstance(c,int) or isinstance(c,bool) or c<1]:
+            errs.append(name+': scaling should be a list of core counts, e.g. [128, 256, 512, 1024, 2048]')
+        if m['submit']=='goNEMOscaling.sh' and m['scaling']==[]:
+            errs.append(name+': can only submit goNEMOscaling.sh with a scaling ladder')
+        if not isinstance(m['timing'],list) or [y for y in m['timing'] if y not in ['spinup','production'] and (not isinstance(y,int) or isinstance(y,bool) or y<1)]:
+            errs.append(name+': timing should be a list of years and/or spinup/production, e.g. [spinup, production]')
+        if not isinstance(m['cfl'],bool):
+            errs.append(name+': cfl should be true/false')
+        if m['submit']=='goNEMOcfl.sh' and not m['cfl']:
+            errs.append(name+': can only submit goNEMOcfl.sh with cfl: true')
+        if not isinstance(m['stream'],bool):
+            errs.append(name+': stream should be true/false')
+        if not isinstance(m['equil'],bool):
+            errs.append(name+': equil should be true/false')
+        if not isinstance(m['zarr'],dict) or (m['zarr']!={} and (sorted(m['zarr'])!=['fields','store'] or not isinstance(m['zarr']['store'],str)\
+            or not isinstance(m['zarr']['fields'],dict) or [f for f in m['zarr']['fields'].values() if not isinstance(f,list)])):
+            errs.append(name+': zarr should be {store: PATH, fields: {1m_grid_T: [toce, soce], ...}} ([] for all the fields of a file)')
+
+        m['workfol']=mani.get('workfol')
+        members.append({k:m[k] for k in keys+['workfol'] if k in m})
+
+    names=[str(m.get('rP_CONFIG'))+'_'+str(m.get('rP_CASE')) for m in members]
+    for n in sorted(set(names)):
+        if names.count(n)>1:
+            errs.append(n+' appears '+str(names.count(n))+' times')
+
+    if errs:
+        print(bcolors.FAIL + "E R R O R: problems with manifest "+mfile + bcolors.ENDC)
+        for e in errs:
+            print(bcolors.FAIL+'    '+e+bcolors.ENDC)
+        raise ValueError(mfile+': '+str(len(errs))+' problem(s) with the manifest, see above')
+
+    print(bcolors.OKGREEN+"manifest "+mfile+" is fine: "+str(len(members))+" members"+bcolors.ENDC)
+    return members
+
 
 if __name__ == "__main__":
+    #python setupNEMO_ARC2.py manifest.yaml [--check]
+    #the manifest drives the whole ensemble (see readmanifest); --check only validates it
+    if len(sys.argv)>1:
+        members=readmanifest(sys.argv[1])
+        if '--check' in sys.argv[2:]:
+            for m in members:
+                print('    '+m['rP_CONFIG']+'_'+m['rP_CASE']+': '+m['BFILE']+' '+m['FLXFCE'])
+            sys.exit(0)
+        status=mkensemble(members)
+        sys.exit(int(bool([st for st in status if st[2] is not None])))
+
     workfol='/work/n02/n02/chbull/repos/nemo_wed_analysis/ajtoy/configs/rnemoARCHER2/'
     
     IFX='-30'
@@ -804,12 +1706,15 @@ if __name__ == "__main__":
     #rP_CONFIG_TYPE="SR_ML"
     mkillisf=False
     rP_nml_patch={}
+    members=[]
 
     #for NUM,flx in zip([73,74,75,76,77],['18','19','01','20','21']):
-    for NUM,flx in zip([78,79,80,81,82],['18','19','01','20','21']):
+    #for NUM,flx in zip([78,79,80,81,82],['18','19','01','20','21']):
     #for NUM,flx in zip([83,84,85,86,87],['18','19','01','20','21']):
     #for NUM,flx in zip([88,89,90,91,92],['18','19','01','20','21']):
     #for NUM,flx in zip([93,94,95,96,97],['18','19','01','20','21']):
+    #whole 2024 paper revision matrix (asf_c73-c92) in one go, five flux cases per bathymetry
+    for NUM,flx in zip(range(73,93),['18','19','01','20','21']*4):
 
     #for NUM,flx in zip([93,94,95,96,97],['18','19','01','20','21']):
     #for NUM,flx in zip([98,99,100,101,102],['18','19','01','20','21']):
@@ -981,6 +1886,9 @@ if __name__ == "__main__":
             #new world ocean at last restoring and initial conditions
             TSFILE=WCONFIG+'/TS_init_c02_woa2018.nc'
             TSFILE=WCONFIG+'/TS_init_c03_woa2018.nc'
+
+            #the bathymetry follows from the case number (c73-77 full wall, c78-82 shelf wall, c83-87 wall with opening, c88-92 no wall)
+            BFILE=WCONFIG+'/'+{73:'new_bathy_ASF_c40_deeprid_fullwall.nc',78:'new_bathy_ASF_c38_deeprid_shelfwall.nc',83:'new_bathy_ASF_c39_deeprid_oowall.nc',88:'new_bathy_ASF_c37_deeprid.nc'}[NUM-(NUM-73)%5]
             flxfce='/mnt/lustre/a2fs-work2/work/n02/n02/chbull/nemo/bld_configs/input_ASF/flxforce_grid_.nc'
             flxfce='/mnt/lustre/a2fs-work2/work/n02/n02/chbull/nemo/bld_configs/input_ASF/flxforce_ujet020isfonly_grid_.nc'
             #flxfce='/mnt/lustre/a2fs-work2/work/n02/n02/chbull/nemo/bld_configs/input_ASF/flxforce_case'+NUM+'_grid_.nc'
@@ -1045,10 +1953,21 @@ if __name__ == "__main__":
 
         print(bcolors.WARNING + "WARNING: "  +'Hard overwriting'+  bcolors.ENDC + ' of NEMO version')
 
-        rP_WORKDIR=main(workfol,rP_CONFIG,rP_CONFIG_TYPE,rP_CASE,NEMOexe,WCONFIG,BFILE,TSFILE,FLXFCE=flxfce,rP_nml_patch=rP_nml_patch,extdomaincfg=customdomcfg)
+        #rP_WORKDIR=main(workfol,rP_CONFIG,rP_CONFIG_TYPE,rP_CASE,NEMOexe,WCONFIG,BFILE,TSFILE,FLXFCE=flxfce,rP_nml_patch=rP_nml_patch,extdomaincfg=customdomcfg)
 
         domaincfg='/mnt/lustre/a2fs-work2/work/n02/n02/chbull/nemo/models/NEMO4/tools/DOMAINcfg/BLD/bin/make_domain_cfg.exe'
-        mkmesh(workfol,rP_WORKDIR,domaincfg,BFILE,rP_nml_patch=rP_nml_domcfgpatch,killisf=mkillisf,extdomaincfg=customdomcfg)
+        #mkmesh(workfol,rP_WORKDIR,domaincfg,BFILE,rP_nml_patch=rP_nml_domcfgpatch,killisf=mkillisf,extdomaincfg=customdomcfg)
         #subprocess.call('cd '+rP_WORKDIR+' ; sbatch '+rP_WORKDIR+'/goNEMOquick.sh',shell=True)
         #subprocess.call('cd '+rP_WORKDIR+'; sbatch '+rP_WORKDIR+'/goNEMOlong.sh',shell=True)
-        subprocess.call('cd '+rP_WORKDIR+'; sbatch '+rP_WORKDIR+'/goNEMOproduction.sh',shell=True)
+        #subprocess.call('cd '+rP_WORKDIR+'; sbatch '+rP_WORKDIR+'/goNEMOproduction.sh',shell=True)
+
+        #main/mkmesh/sbatch now happen per member in mkensemble (below)
+        members.append({'workfol':workfol,'rP_CONFIG':rP_CONFIG,'rP_CONFIG_TYPE':rP_CONFIG_TYPE,'rP_CASE':rP_CASE,'NEMOexe':NEMOexe,'NEMOdir':NEMOdir,\
+                'WCONFIG':WCONFIG,'BFILE':BFILE,'TSFILE':TSFILE,'FLXFCE':flxfce,'rP_NDAYS':rP_NDAYS,\
+                'rP_nml_patch':rP_nml_patch,'rP_nml_domcfgpatch':rP_nml_domcfgpatch,'DOMAINcfg':domaincfg,'killisf':mkillisf,'extdomaincfg':customdomcfg,\
+                'submit':'goNEMOproduction.sh','flxlayout':'clim'})
+
+    #one bad member (e.g. a missing BFILE) doesn't stop the others
+    status=mkensemble(members)
+    if [s for s in status if s[2] is not None]:
+        sys.exit(1)
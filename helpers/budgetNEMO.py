@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+"""
+ Momentum budget of the production years from the 3D trends nemo.exe writes with namtrd ln_dyn_trd (file_def_nemo-oce_asfmo.xml)
+
+ python budgetNEMO.py [-j N] RUNDIR [YEAR ...]       - budget of each year (default: the production years) of RUNDIR, N at a time
+ python budgetNEMO.py [-j N] rfiles/runme [YEAR ...] - the same for all the members in runme
+ python budgetNEMO.py summary RUNDIR|rfiles/runme   - domain mean of each term and how well the budget closes, a line a member
+
+ For u and v (the utrd_* and vtrd_* of a year's outputs in OUTNEMO_NNNN/) each year gets budget/NNNN.nc in the run folder with
+    <c>_vol  (time_counter, term)    volume integral of each term (the term times e1 e2 e3, over the ocean)
+    <c>_ms   (time_counter, term)    volume integral of its square (the rms is sqrt(ms/volume))
+    <c>_dep  (term, y, x)            depth integral (term times e3), mean over the year
+    <c>_zon  (term, depth, y)        zonal integral (term times e1 e3), mean over the year
+ and the last term, res, is the sum of the terms less utrd_tot if nemo wrote it (so it should be ~0), the sum itself if not
+ (the tendency the terms add up to). Thickness weighted trends (e3 times the trend, units m2 s-2) are divided by e3 first, so
+ it's the same whichever file_def wrote them. DIAG terms are parts of others (the wind stress is in zdf, implicit bottom friction too)
+ and aren't added. e3 is the file's e3u/e3v when it has them (vvl), e3u_0/e3v_0 of mesh_mask.nc otherwise.
+
+ A year is read a record and a slab of levels at a time, all the terms of the slab at once, and everything is an einsum over the
+ slab, so a worker never holds more than about MEM bytes whatever the grid and the number of years and members. Years that already
+ have a budget/NNNN.nc are skipped (delete it to do it again), each one is written to a temporary file and renamed.
+"""
+import sys,os
+import re
+import glob
+import concurrent.futures
+import contextlib as ctx
+import numpy as np
+from restarts import rparams,prodstart,OUT,NPROD
+
+#bytes of trends a worker reads at once (the slab, its square and the weights are about 3 times that)
+MEM=2**29
+#parts of other terms (not added into res)
+DIAG=['tau','bfri','tfr','tfri','tot']
+BDIR='budget'
+
+def runs(arg):
+    """run folders of arg, a run folder or rfiles/runme (rP_YEAR_MAX then a run folder a line)"""
+    if os.path.isfile(arg):
+        with ctx.closing(open(arg,'r')) as handle:
+            return [l.strip().rstrip('/') for l in handle if l.strip()!=''][1:]
+    return [arg.rstrip('/')]
+
+def trendfiles(run,year):
+    """{'u'/'v': the output of year with the utrd_*/vtrd_* in it}"""
+    import netCDF4
+    out={}
+    for f in sorted(glob.glob(run+'/OUTNEMO_'+str(year).zfill(4)+'/*_[0-9]*_[0-9]*_*.nc')):
+        if OUT.match(os.path.basename(f)) is None:
+            continue
+        with ctx.closing(netCDF4.Dataset(f)) as nc:
+            for c in 'uv':
+                if c not in out and [v for v in nc.variables if v.startswith(c+'trd_') and nc.variables[v].ndim==4]:
+                    out[c]=f
+    return out
+
+def mesh(run,c):
+    """(e1, e2, e3_0, mask) of the u or v points of run's mesh_mask.nc, as float64 (z,y,x)/(y,x)"""
+    import netCDF4
+    with ctx.closing(netCDF4.Dataset(run+'/mesh_mask.nc')) as nc:
+        return [np.squeeze(np.ma.filled(nc.variables[n][...],0)).astype(np.float64) for n in ['e1'+c,'e2'+c,'e3'+c+'_0',c+'mask']]
+
+def thick(v):
+    """True if trend variable v is thickness weighted (units of m2 s-2 rather than m s-2)"""
+    return re.match(r'^m2(/|\s|s|$)',getattr(v,'units','').strip()) is not None
+
+def budget(nc,c,e1,e2,e30,msk):
+    """budget of component c ('u'/'v') of an open output nc, returns (terms, vol, ms, dep, zon, volume, thickness weighted)"""
+    names=sorted([v[5:] for v in nc.variables if v.startswith(c+'trd_') and nc.variables[v].ndim==4])
+    add=[i for i,n in enumerate(names) if n not in DIAG]
+    tot=names.index('tot') if 'tot' in names else None
+    nt,nz,ny,nx=nc.variables[c+'trd_'+names[0]].shape
+    #thickness weighted trends (e3 times the trend, m2 s-2) go back to m s-2 first
+    tw=thick(nc.variables[c+'trd_'+names[0]])
+    nterm=len(names)+1
+    kz=int(max(1,min(nz,MEM//(8*nterm*ny*nx))))
+    area=e1*e2
+    vol=np.zeros((nt,nterm))
+    ms=np.zeros((nt,nterm))
+    dep=np.zeros((nterm,ny,nx))
+    zon=np.zeros((nterm,nz,ny))
+    slab=np.empty((nterm,kz,ny,nx))
+    for k in range(nt):
+        for z0 in range(0,nz,kz):
+            z1=min(nz,z0+kz)
+            s=slab[:,:z1-z0]
+            for i,n in enumerate(names):
+                s[i]=np.ma.filled(nc.variables[c+'trd_'+n][k,z0:z1],0)
+            e3=np.ma.filled(nc.variables['e3'+c][k,z0:z1],0) if 'e3'+c in nc.variables else e30[z0:z1]
+            if tw:
+                s[:-1]/=np.where(e3>0,e3,1)
+            s[-1]=s[add].sum(0)-(s[tot] if tot is not None else 0)
+            w=e3*msk[z0:z1]
+            dep+=np.einsum('tkyx,kyx->tyx',s,w,optimize=True)
+            zon[:,z0:z1]+=np.einsum('tkyx,kyx->tky',s,w*e1,optimize=True)
+            vol[k]+=np.einsum('tkyx,kyx->t',s,w*area,optimize=True)
+            ms[k]+=np.einsum('tkyx,tkyx,kyx->t',s,s,w*area,optimize=True)
+    volume=float(np.sum(e30*msk*area))
+    return names+['res'],vol,ms,dep/nt,zon/nt,volume,tw
+
+def year(run,y):
+    """write run's budget/NNNN.nc for year y, returns what it did"""
+    import netCDF4
+    f=run+'/'+BDIR+'/'+str(y).zfill(4)+'.nc'
+    if os.path.exists(f):
+        return run+' '+str(y)+' already done'
+    files=trendfiles(run,y)
+    if files=={}:
+        return run+' '+str(y)+' no trends (ln_dyn_trd) in OUTNEMO_'+str(y).zfill(4)
+    if not os.path.exists(run+'/'+BDIR):
+        os.makedirs(run+'/'+BDIR,exist_ok=True)
+    with ctx.closing(netCDF4.Dataset(f[:-3]+'.tmp.nc','w',format='NETCDF4')) as out:
+        out.setncatts({'title':os.path.basename(os.path.abspath(run))+' momentum budget, year '+str(y),'year':y,
+                       'diag_terms':' '.join(DIAG)})
+        for c,src in sorted(files.items()):
+            with ctx.closing(netCDF4.Dataset(src)) as nc:
+                terms,vol,ms,dep,zon,volume,tw=budget(nc,c,*mesh(run,c))
+                tunits=getattr(nc.variables['time_counter'],'units','') if 'time_counter' in nc.variables else ''
+                tval=nc.variables['time_counter'][:] if 'time_counter' in nc.variables else np.arange(vol.shape[0])
+                res='sum less tot' if 'tot' in terms else 'sum (no tot to close against)'
+            if 'time_counter' not in out.dimensions:
+                out.createDimension('time_counter',vol.shape[0])
+                out.createDimension('depth',zon.shape[1])
+                out.createDimension('y',dep.shape[1])
+                out.createDimension('x',dep.shape[2])
+                t=out.createVariable('time_counter',np.float64,('time_counter',))
+                t.units=tunits
+                t[:]=tval
+            out.createDimension('term_'+c,len(terms))
+            out.setncatts({'terms_'+c:' '.join(terms),'volume_'+c:volume,'thickness_weighted_'+c:int(tw),'res_'+c:res,'source_'+c:os.path.basename(src)})
+            for n,a,d,u in [('vol',vol,('time_counter','term_'+c),'m4 s-2'),('ms',ms,('time_counter','term_'+c),'m5 s-4'),
+                            ('dep',dep,('term_'+c,'y','x'),'m2 s-2'),('zon',zon,('term_'+c,'depth','y'),'m3 s-2')]:
+                o=out.createVariable(c+'_'+n,np.float64 if n in ['vol','ms'] else np.float32,d,zlib=True,complevel=1)
+                o.units=u
+                o[...]=a
+    os.rename(f[:-3]+'.tmp.nc',f)
+    return run+' '+str(y)+' '+' '.join([c+': '+os.path.basename(s) for c,s in sorted(files.items())])
+
+def summary(run):
+    """print the domain mean of each term over the years done and the rms residual as a fraction of the biggest term's rms"""
+    import netCDF4
+    fs=sorted(glob.glob(run+'/'+BDIR+'/[0-9][0-9][0-9][0-9].nc'))
+    name=os.path.basename(os.path.abspath(run))
+    if fs==[]:
+        print(name.ljust(24)+' no budget yet (python budgetNEMO.py '+run+')')
+        return
+    for c in 'uv':
+        vol,ms,terms,volume=[],[],None,None
+        for f in fs:
+            with ctx.closing(netCDF4.Dataset(f)) as nc:
+                if c+'_vol' in nc.variables:
+                    vol.append(np.ma.filled(nc.variables[c+'_vol'][...],np.nan))
+                    ms.append(np.ma.filled(nc.variables[c+'_ms'][...],np.nan))
+                    terms=nc.getncattr('terms_'+c).split()
+                    volume=float(nc.getncattr('volume_'+c))
+        if vol==[]:
+            continue
+        vol=np.concatenate(vol)
+        rms=np.sqrt(np.concatenate(ms)/volume)
+        close=np.median(rms[:,-1]/rms[:,[i for i,n in enumerate(terms[:-1]) if n not in DIAG]].max(1))
+        print(name.ljust(24)+' '+c+' '+str(len(fs))+' years, res/largest rms '+str(round(100*close,2))+'%')
+        print('    '+'  '.join([n+' '+'%.2e'%(m/volume) for n,m in zip(terms,vol.mean(0))])+' m s-2')
+
+if __name__ == "__main__":
+    args=sys.argv[1:]
+    nproc=None
+    if args[:1]==['-j']:
+        nproc=int(args[1])
+        args=args[2:]
+    if args==[]:
+        sys.exit(__doc__)
+    if args[0]=='summary':
+        for r in runs(args[1] if len(args)>1 else '.'):
+            summary(r)
+        sys.exit(0)
+    todo=[]
+    for r in runs(args[0]):
+        ymax=int(rparams(r)['rP_YEAR_MAX'])
+        todo+=[(r,y) for y in ([int(a) for a in args[1:]] or range(prodstart(r,ymax),prodstart(r,ymax)+NPROD))]
+    #each worker holds at most about MEM (x3) of trends, so the members and years stream through N at a time
+    with concurrent.futures.ProcessPoolExecutor(max_workers=nproc or min(len(todo),8)) as pool:
+        for msg in pool.map(year,[t[0] for t in todo],[t[1] for t in todo]):
+            print('budgetNEMO.py: '+msg)
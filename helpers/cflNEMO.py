@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+"""
+ How big a time step (namdom rn_rdt) a run can take, from the CFL diagnostics (namctl ln_diacfl) of a short run
+
+ python cflNEMO.py [RUNDIR]            - Courant numbers in RUNDIR/cfl/cfl_diagnostics.ascii (goNEMOcfl.sh, see mkcfl in setupNEMO_ARC2.py),
+                                         the largest stable rn_rdt and the one to use, with the time step bookkeeping that goes with it
+ python cflNEMO.py rfiles/runme        - the same for all the members in runme, a line each
+ python cflNEMO.py steps RDT [RUNDIR]  - time step bookkeeping (nn_it000/nn_itend and restart time steps by year) for a time step of RDT s
+ python cflNEMO.py prep NSTEPS RUNDIR  - (goNEMOcfl.sh, in its folder) start the short run from RUNDIR's latest restart if it has one
+
+ C goes as rn_rdt, so the largest step is rn_rdt*CMAX/C with C the largest Courant number (u, v or w) the short run saw. The step to use
+ is the largest that divides a day (so days, and years, are whole numbers of steps) and is under SAFETY of that, and at most MAXUP times
+ the step now. A short run from rest hasn't got going, so then only a smaller step is ever suggested; start it from a restart of the
+ run (prep does when there is one) to find out if the step can go up.
+
+ A new rn_rdt goes in the member's rP_nml_patch (namdom: {rn_rdt: ...}) and the member is set up again, setupNEMO_ARC2.py, packNEMO.py
+ and the restarts a pipelined launch starts from work the steps a year out from rn_rdt and rP_NDAYS (steps shows what they'll be). Only change it
+ between runs, a run's restarts are named by time step so a new step part way through throws the count out.
+"""
+import sys,os
+import re
+import contextlib as ctx
+import f90nml
+from restarts import rparams,newest,NPROD
+
+#largest Courant number we run at (diacfl works C out with the leapfrog 2 rn_rdt, the limit is 1)
+CMAX=0.6
+#headroom for faster flow than the short run saw
+SAFETY=0.8
+#never suggest more than this times the step now without a look at a longer run
+MAXUP=2.
+CFLFILE='cfl_diagnostics.ascii'
+VAL=re.compile(r'Max C([uvw])\s*[=:]?\s*([-+]?\d*\.?\d+(?:[eEdD][-+]?\d+)?)(.*)$')
+
+def parse(f):
+    """{'u'/'v'/'w': (largest C, time step, rest of the line, i.e. where)} of a cfl_diagnostics.ascii"""
+    out={}
+    kt=0
+    with ctx.closing(open(f,'r',errors='replace')) as handle:
+        for l in handle:
+            w=l.split()
+            if w!=[] and w[0].isdigit():
+                kt=int(w[0])
+            m=VAL.search(l)
+            if m is not None:
+                c=float(m.group(2).replace('D','E').replace('d','e'))
+                if c>out.get(m.group(1),(-1,))[0]:
+                    out[m.group(1)]=(c,kt,m.group(3).strip())
+    return out
+
+def pick(rdt,cmax,fromrest):
+    """(largest stable step, step to use) for a run at rdt that got to Courant number cmax"""
+    top=rdt*CMAX/cmax
+    cap=rdt if fromrest else MAXUP*rdt
+    ok=[d for d in range(1,86401) if 86400%d==0 and d<=SAFETY*top and d<=cap]
+    return top,(max(ok) if ok!=[] else None)
+
+def steps(rdt,ndays,ymax):
+    """lines of time step bookkeeping for a time step of rdt s"""
+    assert((ndays*86400)%rdt==0),"a year ("+str(ndays)+" days) isn't a whole number of time steps of "+str(rdt)+"s"
+    ns=int(ndays*86400//rdt)
+    out=['rn_rdt '+str(rdt)+'s: '+str(ns)+' time steps a year, '+str(ns*ymax)+' for the '+str(ymax)+' years',
+         '    year    nn_it000    nn_itend  restart written']
+    for y in sorted(set([1,2,3,ymax-NPROD+1,ymax])):
+        if y>=1:
+            out.append(str(y).rjust(8)+str((y-1)*ns+1).rjust(12)+str(y*ns).rjust(12)+'  _'+str(y*ns).zfill(8)+'_restart.nc')
+    return out
+
+def prep(nsteps,run):
+    """start namelist_cfg (here) from the newest restart of run folder run, if there is one (writes 'start')"""
+    rst=newest(run)
+    start='rest'
+    if rst is not None:
+        kt=int(os.path.basename(rst[1]).split('_')[-2])
+        f90nml.patch('namelist_cfg',{'namrun':{'ln_rstart':True,'nn_rstctl':2,'nn_it000':kt+1,'nn_itend':kt+nsteps,'nn_stock':kt+nsteps,\
+                'cn_ocerst_in':os.path.basename(rst[1])[:-3],'cn_ocerst_indir':os.path.dirname(rst[1])+'/'}},out_path='namelist_cfg_new')
+        os.rename('namelist_cfg_new','namelist_cfg')
+        start=rst[1]
+    with ctx.closing(open('start','w')) as handle:
+        handle.write(start+'\n')
+    print('cflNEMO: '+str(nsteps)+' steps from '+start)
+
+def report(run,verbose=True):
+    """what the cfl run of run folder run says, returns (rn_rdt now, largest C, step to use) (None's if it hasn't run)"""
+    prm=rparams(run)
+    rdt,ndays,ymax=f90nml.read(run+'/namelist_cfg')['namdom']['rn_rdt'],int(prm['rP_NDAYS']),int(prm['rP_YEAR_MAX'])
+    name=os.path.basename(os.path.abspath(run))
+    if not os.path.exists(run+'/cfl/'+CFLFILE):
+        print(name.ljust(24)+' rn_rdt '+str(rdt)+'s, no cfl/'+CFLFILE+' yet (sbatch goNEMOcfl.sh)')
+        return rdt,None,None
+    start='rest'
+    if os.path.exists(run+'/cfl/start'):
+        with ctx.closing(open(run+'/cfl/start','r')) as handle:
+            start=handle.read().strip()
+    cfl=parse(run+'/cfl/'+CFLFILE)
+    assert(cfl!={}),"no Courant numbers in "+run+'/cfl/'+CFLFILE
+    d=max(cfl,key=lambda k:cfl[k][0])
+    top,use=pick(rdt,cfl[d][0],start=='rest')
+    print(name.ljust(24)+' rn_rdt '+str(rdt)+'s, max C'+d+' '+str(round(cfl[d][0],4))+' (step '+str(cfl[d][1])+'), stable to '+\
+          str(round(top))+'s, use '+(str(use)+'s' if use else 'nothing that divides a day!')+(' (from rest)' if start=='rest' else '')+\
+          (', '+str(round(100*(1-rdt/float(use))))+'% fewer steps' if use and use>rdt else ''))
+    if verbose:
+        for k in sorted(cfl):
+            print('    C'+k+' '+str(round(cfl[k][0],4)).ljust(8)+' at step '+str(cfl[k][1])+' '+cfl[k][2])
+        print('    short run from '+start)
+        if use:
+            print('')
+            print("\n".join(steps(use,ndays,ymax)))
+            if use!=rdt:
+                print('')
+                print('    rP_nml_patch:')
+                print('      namdom: {rn_rdt: '+str(float(use))+'}')
+    return rdt,cfl[d][0],use
+
+if __name__ == "__main__":
+    arg=sys.argv[1] if len(sys.argv)>1 else '.'
+    if arg=='prep':
+        prep(int(sys.argv[2]),sys.argv[3].rstrip('/'))
+    elif arg=='steps':
+        rdt=float(sys.argv[2])
+        prm=rparams(sys.argv[3].rstrip('/') if len(sys.argv)>3 else '.')
+        ndays,ymax=int(prm['rP_NDAYS']),int(prm['rP_YEAR_MAX'])
+        print("\n".join(steps(rdt,ndays,ymax)))
+    elif os.path.isfile(arg):
+        #rfiles/runme: rP_YEAR_MAX then a run folder a line
+        with ctx.closing(open(arg,'r')) as handle:
+            runs=[l.strip().rstrip('/') for l in handle if l.strip()!=''][1:]
+        for run in runs:
+            report(run,verbose=False)
+    else:
+        report(arg.rstrip('/'))
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+"""
+ Pick the netCDF4 chunk shape of the outputs from how our diagnostics actually read them
+
+ python chunkNEMO.py record LOG script.py [args]   - run a diagnostics script as usual, noting every read it makes (file kind, variable,
+                                                     the part of each dimension) in LOG (appended to, so run all of them)
+ python chunkNEMO.py bench LOG SAMPLE [SAMPLE ...] - (in the run folder) replay the reads in LOG on copies of a sample year's outputs
+                                                     chunked a few ways, and use the fastest: rebuild_tiles.chunks for the rebuilds
+                                                     and namnc4 in the production namelist
+
+ A chunk is read whole, so a zonal mean (all of x) of level-by-level chunks is cheap and a section across the slope (all of y and
+ z at one x) of them reads every level's whole slab. Candidates are chunk shapes of (x, y, z) of 1, 1/2, 1/4 and 1/8 of x and y and
+ 1, a quarter or all of z (time is always a record a chunk, as NEMO writes it); they're ranked by the bytes the reads in LOG would pull
+ in, the best BENCH of them (and the layout we have now) are then timed for real with the copy dropped from the page cache first.
+
+ What post-processing reads is the rebuilt output, which rebuild_tiles.py chunks (rebuild_tiles.chunks next to it); namnc4
+ (nn_nchunks_i/j/k, chunks per tile) is what nemo.exe itself writes (the tiles nemotiles.py reads, restarts), set to match.
+"""
+import sys,os
+import re
+import json
+import time
+import shutil
+import atexit
+import runpy
+import collections
+import contextlib as ctx
+import numpy as np
+import netCDF4
+import f90nml
+
+#candidate shapes that get timed (the rest are only ranked)
+BENCH=6
+#most reads replayed per candidate (spread evenly over the log)
+REPLAY=200
+#replay times this close (fraction) count as a tie
+TIE=0.1
+CHUNKFILE='rebuild_tiles.chunks'
+
+def kind(f):
+    """what sort of file f is without the experiment and dates, e.g. grid_T for asf_c73_00008_1m_00940101_00941231_grid_T.nc"""
+    b=os.path.basename(f)
+    b=b[:-3] if b.endswith('.nc') else b
+    m=re.match(r'^.*_\d{8}_\d{8}_(.*)$',b)
+    return m.group(1) if m is not None else re.sub(r'_?\d+','',b)
+
+def axis(d):
+    """x, y, z or t for a NEMO dimension name"""
+    if d.startswith('depth') or d in ['nav_lev','z']:
+        return 'z'
+    if d.startswith('time'):
+        return 't'
+    return {'x':'x','y':'y'}.get(d,d)
+
+def extents(key,shape):
+    """[start,stop) of each dimension a netCDF4 style key reads"""
+    if not isinstance(key,tuple):
+        key=(key,)
+    if [k for k in key if k is Ellipsis]:
+        i=[n for n,k in enumerate(key) if k is Ellipsis][0]
+        key=key[:i]+(slice(None),)*(len(shape)-len(key)+1)+key[i+1:]
+    key=key+(slice(None),)*(len(shape)-len(key))
+    out=[]
+    for k,n in zip(key,shape):
+        if isinstance(k,slice):
+            a,b,s=k.indices(n)
+            out.append([a,b] if s>0 else [b+1,a+1])
+        elif np.ndim(k)>0:
+            k=np.asarray(k)
+            k=np.flatnonzero(k) if k.dtype==bool else np.where(k<0,k+n,k)
+            out.append([int(k.min()),int(k.max())+1] if k.size else [0,0])
+        else:
+            k=int(k)
+            out.append([k+n,k+n+1] if k<0 else [k,k+1])
+    return out
+
+class Recorded(object):
+    """a netCDF4 variable that notes what's read of it"""
+    def __init__(self,v,fkind,log):
+        self.__dict__.update(_v=v,_kind=fkind,_log=log)
+    def __getattr__(self,a):
+        return getattr(self._v,a)
+    def __getitem__(self,key):
+        self._log[json.dumps([self._kind,self._v.name,list(self._v.dimensions),list(self._v.shape),extents(key,self._v.shape)])]+=1
+        return self._v[key]
+    def __setitem__(self,key,val):
+        self._v[key]=val
+    def __len__(self):
+        return len(self._v)
+
+class RecordedDataset(object):
+    """netCDF4.Dataset whose variables note what's read of them"""
+    def __init__(self,*args,**kw):
+        self.__dict__.update(_nc=REAL(*args,**kw),_log=LOG)
+        self.__dict__['_kind']=kind(self._nc.filepath())
+        self.__dict__['variables']=collections.OrderedDict([(n,Recorded(v,self._kind,self._log)) for n,v in self._nc.variables.items()])
+    def __getattr__(self,a):
+        return getattr(self._nc,a)
+    def __getitem__(self,name):
+        return self.variables[name] if name in self.variables else self._nc[name]
+    def __enter__(self):
+        return self
+    def __exit__(self,*args):
+        self._nc.close()
+
+REAL=netCDF4.Dataset
+LOG=collections.Counter()
+
+def record(log,script,args):
+    """run script (with args) with its netCDF4 reads noted in log"""
+    def dump():
+        with ctx.closing(open(log,'a')) as handle:
+            for k,n in LOG.items():
+                handle.write(json.dumps([n]+json.loads(k))+'\n')
+        print('chunkNEMO: '+str(sum(LOG.values()))+' reads ('+str(len(LOG))+' different) noted in '+log)
+    atexit.register(dump)
+    netCDF4.Dataset=RecordedDataset
+    sys.argv=[script]+args
+    runpy.run_path(script,run_name='__main__')
+
+def readlog(log):
+    """[(count, kind, variable, dimensions, shape, extents)] of a log"""
+    with ctx.closing(open(log,'r')) as handle:
+        return [json.loads(l) for l in handle if l.strip()!='']
+
+def touched(ext,chunks,itemsize):
+    """bytes of the chunks a read of extents ext pulls in"""
+    n=1
+    for (a,b),c in zip(ext,chunks):
+        n*=((b-1)//c-a//c+1) if b>a else 0
+    return n*int(np.prod(chunks))*itemsize
+
+def candidates(size):
+    """chunk shapes {x,y,z: size} to try for dimensions of size {x,y,z: n}"""
+    out=[]
+    for fi in [1,2,4,8]:
+        for fj in [1,2,4,8]:
+            for fk in ['1','4','all']:
+                c={'x':-(-size['x']//fi),'y':-(-size['y']//fj)}
+                if 'z' in size:
+                    c['z']={'1':1,'4':-(-size['z']//4),'all':size['z']}[fk]
+                elif fk!='1':
+                    continue
+                if c not in out:
+                    out.append(c)
+    return out
+
+def chunksof(v,c):
+    """chunk sizes of netCDF4 variable v for shape c (dimensions not in c get 1, untiled variables aren't chunked)"""
+    return [min(c.get(axis(d),1),n) if axis(d)!='t' else 1 for d,n in zip(v.dimensions,v.shape)]
+
+def copyas(sample,names,c,odir):
+    """copy variables names of sample into odir chunked as c, dropped from the page cache, returns the copy"""
+    ofile=odir+os.path.basename(sample)
+    with ctx.closing(netCDF4.Dataset(sample)) as src, ctx.closing(netCDF4.Dataset(ofile,'w',format='NETCDF4')) as dst:
+        src.set_auto_maskandscale(False)
+        for d in src.dimensions.values():
+            dst.createDimension(d.name,None if d.isunlimited() else len(d))
+        for n in names:
+            v=src.variables[n]
+            f=v.filters() or {}
+            o=dst.createVariable(n,v.dtype,v.dimensions,chunksizes=chunksof(v,c) if v.ndim>1 else None,zlib=f.get('zlib',False),\
+                    complevel=f.get('complevel',4),shuffle=f.get('shuffle',False),fill_value=v.getncattr('_FillValue') if '_FillValue' in v.ncattrs() else None)
+            o.set_auto_maskandscale(False)
+            #a time record at a time keeps the memory down
+            for t in range(v.shape[0] if v.ndim>2 else 1):
+                o[(t,) if v.ndim>2 else Ellipsis]=v[(t,) if v.ndim>2 else Ellipsis]
+    fd=os.open(ofile,os.O_RDONLY)
+    os.fsync(fd)
+    os.posix_fadvise(fd,0,0,os.POSIX_FADV_DONTNEED)
+    os.close(fd)
+    return ofile
+
+def replay(f,reads):
+    """seconds to do reads (as from readlog) on file f"""
+    t0=time.time()
+    with ctx.closing(netCDF4.Dataset(f)) as nc:
+        for cnt,k,name,dims,shape,ext in reads:
+            v=nc.variables[name]
+            v[tuple([slice(min(a,n),min(b,n)) for (a,b),n in zip(ext,v.shape)])]
+    return time.time()-t0
+
+def bench(log,samples,odir='.chunkbench/'):
+    """time the reads in log on samples chunked each candidate way, returns the best chunk shape {x,y,z: size}"""
+    reads=readlog(log)
+    kinds=dict([(kind(s),s) for s in samples])
+    used=[r for r in reads if r[1] in kinds]
+    assert(used!=[]),"none of the reads in "+log+" are of "+', '.join(kinds)+" files"
+    names={}
+    size={}
+    for s in kinds.values():
+        with ctx.closing(netCDF4.Dataset(s)) as nc:
+            names[s]=sorted(set([r[2] for r in used if r[1]==kind(s) and r[2] in nc.variables]))
+            for n in names[s]:
+                for d,m in zip(nc.variables[n].dimensions,nc.variables[n].shape):
+                    if axis(d) in ['x','y','z']:
+                        size[axis(d)]=max(size.get(axis(d),0),m)
+    used=[r for r in used if r[2] in names[kinds[r[1]]]]
+    isize=4
+    def cost(c):
+        """bytes the reads in the log pull in with chunk shape c"""
+        return sum([r[0]*touched([e for e,d in zip(r[5],r[3]) if axis(d)!='t'],[c.get(axis(d),1) for d in r[3] if axis(d)!='t'],isize) \
+                    for r in used])
+    #how it is now: rebuild_tiles.py's level by level slabs (no z if only 2D fields are read)
+    now=dict([(a,1 if a=='z' else size[a]) for a in ['x','y','z'] if a in size])
+    cands=candidates(size)
+    rank=sorted([(cost(c),n) for n,c in enumerate(cands)])
+    timed=[cands[n] for b,n in rank[:BENCH]]
+    if now not in timed:
+        timed.append(now)
+    step=max(1,len(used)//REPLAY)
+    sub=used[::step]
+
+    if os.path.exists(odir):
+        shutil.rmtree(odir)
+    os.mkdir(odir)
+    print(str(sum([r[0] for r in used]))+' reads ('+str(len(used))+' different, '+str(len(sub))+' replayed) of '+', '.join(kinds)+', dims '+str(size))
+    print('   x    y    z   GB read (log)   replay (s)')
+    res=[]
+    for c in timed:
+        t=0.
+        for s in kinds.values():
+            copy=copyas(s,names[s],c,odir)
+            t+=replay(copy,[r for r in sub if r[1]==kind(s)])
+            os.remove(copy)
+        b=cost(c)
+        res.append((t,b,c))
+        print(''.join([str(c.get(a,'-')).rjust(5) for a in ['x','y','z']])+str(round(b/2.**30,2)).rjust(14)+str(round(t,2)).rjust(13)+('   (now)' if c==now else ''))
+    shutil.rmtree(odir)
+    #within TIE of the fastest is as fast (timings are noisy), then the fewest bytes
+    fast=min([r[0] for r in res])
+    best=min([r for r in res if r[0]<=(1+TIE)*fast],key=lambda r:r[1])
+    return best[2],size
+
+def apply(run,c,size):
+    """use chunk shape c for the rebuilds (rebuild_tiles.chunks) and for what nemo.exe writes in the production years (namnc4)"""
+    with ctx.closing(open(run+'/'+CHUNKFILE,'w')) as handle:
+        for a in ['x','y','z']:
+            if a in c:
+                handle.write(a+' '+str(c[a])+'\n')
+    #namnc4 counts chunks per tile
+    mpp=f90nml.read(run+'/namelist_cfg').get('nammpp',{})
+    jpni,jpnj=mpp.get('jpni',-1),mpp.get('jpnj',-1)
+    nc4={'ln_nc4zip':True}
+    if jpni>0 and jpnj>0:
+        nc4['nn_nchunks_i']=max(1,int(round(size['x']/float(jpni)/c['x'])))
+        nc4['nn_nchunks_j']=max(1,int(round(size['y']/float(jpnj)/c['y'])))
+    if 'z' in c:
+        nc4['nn_nchunks_k']=max(1,int(round(size['z']/float(c['z']))))
+    for f in ['namelist_ref_prod']+(['namelist_ref'] if os.path.exists(run+'/phase2.swapped') else []):
+        if os.path.exists(run+'/'+f):
+            f90nml.patch(run+'/'+f,{'namnc4':nc4},out_path=run+'/'+f+'_new')
+            shutil.move(run+'/'+f+'_new',run+'/'+f)
+            print('chunkNEMO: namnc4 '+str(nc4)+' in '+f)
+    print('chunkNEMO: rebuilds chunked '+str(c)+' ('+CHUNKFILE+')')
+
+if __name__ == "__main__":
+    if len(sys.argv)<4 or sys.argv[1] not in ['record','bench']:
+        sys.exit(__doc__)
+    if sys.argv[1]=='record':
+        record(sys.argv[2],sys.argv[3],sys.argv[4:])
+    else:
+        c,size=bench(sys.argv[2],sys.argv[3:])
+        apply('.',c,size)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""
+ Plan the MPI domain decomposition (nammpp jpni x jpnj) of a NEMO run from its bathymetry, leaving out the all-land subdomains
+
+ python decompNEMO.py bathy_meter.nc [maxranks]   - table of the best layouts that fit in maxranks (default 1024)
+ python decompNEMO.py fix domain_cfg.nc maxranks how namelist [namelist ...]
+                                                  - (the job scripts, once domain_cfg.nc is there) decompose as decomp does, put 
+                                                    jpni x jpnj in the namelists (those that are there) and the ranks in RANKS
+ python decompNEMO.py check [ocean.output]        - stop if nemo.exe found a different number of ocean subdomains than RANKS says
+
+ NEMO 4.0 only wants a rank for the subdomains with some ocean in them, so on a grid with a lot of land (e.g. our walled shelves) a
+ finer layout fits in the same number of ranks. The cost model is deliberately simple, a rank's time step is its compute (points of
+ the largest subdomain, halos included) plus HALO times the points it swaps with its neighbours. The subdomains are cut the way
+ NEMO 4.0 does it (mpp_basic_decomposition) so the number of ocean subdomains is the number of ranks NEMO will ask for.
+
+ setupNEMO_ARC2.py sizes the job from the bathymetry it sets up with, but the land nemo.exe sees is that of domain_cfg.nc, which is
+ made (and maybe hacked) by the job. So the job scripts decompose again from its bottom_level (fix) before nemo.exe runs, on the
+ ranks the job has, and check that nemo.exe agreed once it has.
+"""
+import sys,os
+import re
+import contextlib as ctx
+import numpy as np
+
+#cores per ARCHER2 node
+CORES=128
+#cost of exchanging a halo point relative to computing a grid point
+HALO=3.0
+#layouts within this fraction of the best (estimated) time are just as good, then the one with the fewest ranks wins
+TOL=0.02
+#smallest subdomain interior we allow (points)
+MINPTS=4
+#halo width (nn_hls)
+HLS=1
+#where fix leaves the number of ranks for the job script (ranks=`cat decomp.ranks`)
+RANKS='decomp.ranks'
+
+def oceanmask(bfile):
+    """True where there's ocean in bfile (bathymetry, or a domain_cfg/mesh_mask with bottom_level), shape (y,x)"""
+    import netCDF4
+    with ctx.closing(netCDF4.Dataset(bfile)) as nc:
+        for v in ['bottom_level','Bathymetry','Bathymetry_isf']:
+            if v in nc.variables:
+                nc.set_auto_mask(False)
+                b=np.squeeze(nc.variables[v][...])
+                return b>0
+    raise ValueError(bfile+" has none of bottom_level/Bathymetry/Bathymetry_isf to tell the land from")
+
+def splits(nglo,nb):
+    """first point (0 based) and size (halos included) of each of nb subdomains along nglo points, as NEMO 4.0 cuts them"""
+    nmax=(nglo-2*HLS+nb-1)//nb+2*HLS
+    nrest=(nglo-2*HLS)%nb or nb
+    size=np.array([nmax]*nrest+[nmax-1]*(nb-nrest))
+    return np.concatenate([[0],np.cumsum(size-2*HLS)[:-1]]),size
+
+def layouts(mask,maxranks):
+    """all the jpni x jpnj layouts that fit in maxranks once the land subdomains are dropped
+
+    :mask: ocean mask, shape (jpjglo,jpiglo)
+    :maxranks: most ranks we can have
+    :returns: list of (cost, ocean subdomains, jpni, jpnj, jpimax, jpjmax) cheapest first
+    """
+    nj,ni=mask.shape
+    #ocean points in mask[:j,:i] is cs[j,i]
+    cs=np.zeros((nj+1,ni+1),int)
+    cs[1:,1:]=np.cumsum(np.cumsum(mask,0),1)
+    out=[]
+    for jpni in range(1,(ni-2*HLS)//MINPTS+1):
+        i0,isz=splits(ni,jpni)
+        for jpnj in range(1,(nj-2*HLS)//MINPTS+1):
+            j0,jsz=splits(nj,jpnj)
+            a,b=np.meshgrid(j0,i0,indexing='ij'),np.meshgrid(j0+jsz,i0+isz,indexing='ij')
+            npts=cs[b[0],b[1]]-cs[a[0],b[1]]-cs[b[0],a[1]]+cs[a[0],a[1]]
+            nocean=int((npts>0).sum())
+            if nocean>maxranks or nocean==0:
+                continue
+            cost=isz[0]*jsz[0]+HALO*2*HLS*(isz[0]+jsz[0])
+            out.append((cost,nocean,jpni,jpnj,int(isz[0]),int(jsz[0])))
+    return sorted(out)
+
+def decomp(bfile,maxranks,how='auto'):
+    """pick the decomposition for a run
+
+    :bfile: bathymetry (see oceanmask)
+    :maxranks: most ranks the run can have
+    :how: 'auto' for the best that fits in maxranks, or 'NIxNJ' (e.g. '32x36') for that layout
+    :returns: jpni, jpnj, number of ranks (ocean subdomains)
+    """
+    mask=oceanmask(bfile)
+    if how=='auto':
+        cands=layouts(mask,maxranks)
+        assert(cands!=[]),"no decomposition of "+bfile+" fits in "+str(maxranks)+" ranks"
+        cost,nocean,jpni,jpnj,jpi,jpj=min([c for c in cands if c[0]<=cands[0][0]*(1+TOL)],key=lambda c:(c[1],c[0]))
+    else:
+        jpni,jpnj=[int(n) for n in how.split('x')]
+        pick=[c for c in layouts(mask,jpni*jpnj) if c[2:4]==(jpni,jpnj)]
+        assert(pick!=[]),"can't decompose "+bfile+" "+how+" (subdomains smaller than "+str(MINPTS)+" points?)"
+        cost,nocean,jpni,jpnj,jpi,jpj=pick[0]
+        assert(nocean<=maxranks),how+" of "+bfile+" needs "+str(nocean)+" ranks, there's only room for "+str(maxranks)
+    print("decompNEMO: "+str(jpni)+"x"+str(jpnj)+" subdomains of "+str(jpi)+"x"+str(jpj)+" points, "+str(jpni*jpnj-nocean)+" all land so "+str(nocean)+" ranks ("+str(-(-nocean//CORES))+" nodes)")
+    return jpni,jpnj,nocean
+
+def fix(dfile,maxranks,how,nmls):
+    """decompose from dfile (domain_cfg.nc) as decomp does, put jpni x jpnj in the namelists nmls that exist and the ranks in RANKS"""
+    import f90nml
+    jpni,jpnj,ranks=decomp(dfile,maxranks,how)
+    for n in [n for n in nmls if os.path.exists(n)]:
+        f90nml.patch(n,{'nammpp':{'jpni':jpni,'jpnj':jpnj}},out_path=n+'_new')
+        os.rename(n+'_new',n)
+    with ctx.closing(open(RANKS+'.tmp','w')) as handle:
+        handle.write(str(ranks)+'\n')
+    os.rename(RANKS+'.tmp',RANKS)
+    return ranks
+
+def check(oout='ocean.output'):
+    """exit if the number of ocean subdomains in nemo.exe's oout isn't what RANKS says"""
+    with ctx.closing(open(RANKS,'r')) as handle:
+        ranks=int(handle.read().split()[0])
+    with ctx.closing(open(oout,'r')) as handle:
+        n=re.findall(r'Number of ocean subdomains\D*(\d+)',handle.read())
+    if n==[]:
+        print("decompNEMO: WARNING: no number of ocean subdomains in "+oout+" to check the "+str(ranks)+" ranks against")
+    elif int(n[0])!=ranks:
+        sys.exit("decompNEMO: E R R O R: nemo.exe found "+n[0]+" ocean subdomains, it was run on "+str(ranks)+" ranks ("+RANKS+")")
+
+if __name__ == "__main__":
+    if len(sys.argv)<2:
+        sys.exit(__doc__)
+    if sys.argv[1]=='fix':
+        fix(sys.argv[2],int(sys.argv[3]),sys.argv[4],sys.argv[5:])
+        sys.exit(0)
+    if sys.argv[1]=='check':
+        check(*sys.argv[2:3])
+        sys.exit(0)
+    maxranks=int(sys.argv[2]) if len(sys.argv)>2 else 1024
+    mask=oceanmask(sys.argv[1])
+    print(sys.argv[1]+': '+str(mask.shape[1])+'x'+str(mask.shape[0])+' points, '+str(round(100*mask.mean(),1))+'% ocean')
+    print('   jpni x jpnj    jpi x jpj   land  ranks  nodes    cost')
+    for cost,nocean,jpni,jpnj,jpi,jpj in layouts(mask,maxranks)[:20]:
+        print(str(jpni).rjust(7)+' x '+str(jpnj).ljust(4)+str(jpi).rjust(6)+' x '+str(jpj).ljust(4)+str(jpni*jpnj-nocean).rjust(6)+str(nocean).rjust(7)+str(-(-nocean//CORES)).rjust(7)+str(round(cost)).rjust(8))
+    decomp(sys.argv[1],maxranks)
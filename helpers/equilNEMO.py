@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+"""
+ Has the spin up got there yet? Cheap equilibrium metrics of each spin up year and an early switch to the production phase
+
+ python equilNEMO.py check YEAR [RUNDIR]   - (goNEMOproduction.sh, in the background after each spin up year's postNEMO.py) add the
+                                             metrics of YEAR (and any earlier year that's missing) to equil.txt and, once the drift
+                                             has been small enough for long enough, write spinup.done
+ python equilNEMO.py status [RUNDIR]       - metrics and drifts of the last years, or python equilNEMO.py status rfiles/runme
+
+ The metrics come from the restart written at the end of the year (restarts.py find), with mesh_mask.nc's cell sizes:
+    ke  domain mean kinetic energy (m2 s-2)
+    hc  heat content, rho0 cp T integrated over the ocean (J)
+    tx  zonal transport through the re-entrant boundary, column SECTION (Sv)
+ The drift of ke and tx is the least squares trend over the last WINDOW years as a fraction of their mean over WINDOW years, that
+ of hc the trend as a heat flux through the sea surface (W m-2). The spin up is done when they're all under KEDRIFT, TXDRIFT and
+ HCFLUX for NCONFIRM years running, and it's had MINYEARS years.
+
+ goNEMOproduction.sh (set up with equil) stops the spin up loop at the next launch once spinup.done is there, writes the year the
+ production phase starts in production.start and runs restarts.NPROD production years from then, rather than always spinning up to
+ rP_YEAR_MAX-9. streamNEMO.py, budgetNEMO.py and restarts.py thin take the production years from production.start when it's there.
+ Delete spinup.done (before the next launch) to carry on spinning up; write it yourself to switch now.
+"""
+import sys,os
+import contextlib as ctx
+import numpy as np
+from restarts import params,find,prodstart
+
+#years the drift is fitted over
+WINDOW=10
+#fraction of the mean ke/tx they can drift by over WINDOW years
+KEDRIFT=0.02
+TXDRIFT=0.02
+#heat flux the drift in heat content is worth through the surface (W m-2)
+HCFLUX=0.1
+#years in a row the drift has to be small
+NCONFIRM=3
+#spin up years before a switch is considered
+MINYEARS=30
+#x index of the section tx is through (0 is the halo column of a jperio=1 domain)
+SECTION=1
+RHO0CP=1026.*3991.86795711963
+EQFILE='equil.txt'
+FLAG='spinup.done'
+NAMES=['ke','hc','tx']
+
+def metrics(rst,mesh):
+    """(ke, hc, tx) of restart file rst"""
+    import netCDF4
+    with ctx.closing(netCDF4.Dataset(mesh)) as nc:
+        m={v:np.squeeze(np.ma.filled(nc.variables[v][...],0)).astype(np.float64) for v in \
+           ['e1t','e2t','e3t_0','tmask','umask','vmask','e2u','e3u_0']}
+    with ctx.closing(netCDF4.Dataset(rst)) as nc:
+        un,vn,tn=[np.squeeze(np.ma.filled(nc.variables[v][...],0)).astype(np.float64) for v in ['un','vn','tn']]
+    vol=m['e1t']*m['e2t']*m['e3t_0']*m['tmask']
+    ke=0.5*np.sum((un**2*m['umask']+vn**2*m['vmask'])*vol)/np.sum(vol)
+    hc=RHO0CP*np.sum(tn*vol)
+    tx=np.sum((un*m['e2u']*m['e3u_0']*m['umask'])[:,:,SECTION])/1e6
+    return ke,hc,tx
+
+def read(run):
+    """{year: (ke, hc, tx)} of run's equil.txt"""
+    out={}
+    if os.path.exists(run+'/'+EQFILE):
+        with ctx.closing(open(run+'/'+EQFILE,'r')) as handle:
+            for l in handle:
+                w=l.split()
+                if len(w)==4 and not l.startswith('#'):
+                    out[int(w[0])]=tuple([float(x) for x in w[1:]])
+    return out
+
+def drift(rec,year,area):
+    """{'ke','hc','tx': drift} over the WINDOW years to year, None if there aren't that many"""
+    ys=[y for y in range(year-WINDOW+1,year+1) if y in rec]
+    if len(ys)<WINDOW:
+        return None
+    a=np.array([rec[y] for y in ys])
+    slope=np.polyfit(np.array(ys,np.float64),a,1)[0]
+    return {'ke':abs(slope[0])*WINDOW/abs(a[:,0].mean()),'hc':abs(slope[1])/(365.*86400*area),'tx':abs(slope[2])*WINDOW/max(abs(a[:,2].mean()),1e-6)}
+
+def settled(d):
+    """True if drifts d are all small enough"""
+    return d is not None and d['ke']<KEDRIFT and d['hc']<HCFLUX and d['tx']<TXDRIFT
+
+def surface(run):
+    """sea surface area of run's mesh_mask.nc (m2)"""
+    import netCDF4
+    with ctx.closing(netCDF4.Dataset(run+'/mesh_mask.nc')) as nc:
+        return float(np.sum(np.squeeze(nc.variables['e1t'][...]*nc.variables['e2t'][...])*np.squeeze(nc.variables['tmask'][...])[0]))
+
+def check(run,year):
+    """add the metrics of year (and missing years before it) to equil.txt, write spinup.done if the spin up has settled"""
+    exp,ns,ymax=params(run)
+    rec=read(run)
+    for y in range(1,year+1):
+        rst=find(run,y,exp,ns) if y not in rec else None
+        if rst is not None:
+            rec[y]=metrics(rst,run+'/mesh_mask.nc')
+    with ctx.closing(open(run+'/'+EQFILE+'.tmp','w')) as handle:
+        handle.write('# year ke(m2 s-2) hc(J) tx(Sv)\n')
+        for y in sorted(rec):
+            handle.write(str(y).rjust(6)+' '+' '.join(['%.8e'%x for x in rec[y]])+'\n')
+    os.rename(run+'/'+EQFILE+'.tmp',run+'/'+EQFILE)
+    area=surface(run)
+    d=drift(rec,year,area)
+    print('equilNEMO.py: '+exp+' year '+str(year)+' '+('drift '+' '.join([k+' '+'%.3g'%d[k] for k in NAMES]) if d else 'not '+str(WINDOW)+' years yet'))
+    if os.path.exists(run+'/'+FLAG) or os.path.exists(run+'/production.start') or year<MINYEARS:
+        return
+    if all([settled(drift(rec,y,area)) for y in range(year-NCONFIRM+1,year+1)]):
+        with ctx.closing(open(run+'/'+FLAG,'w')) as handle:
+            handle.write(str(year)+' '+' '.join([k+' '+'%.3g'%d[k] for k in NAMES])+'\n')
+        print('equilNEMO.py: '+exp+' settled after year '+str(year)+', switching to the production phase at the next launch')
+
+def status(run):
+    """print the metrics and drifts of run's last few years"""
+    exp,ns,ymax=params(run)
+    rec=read(run)
+    if rec=={}:
+        print(exp.ljust(24)+' no '+EQFILE+' yet')
+        return
+    area=surface(run)
+    y=max(rec)
+    d=drift(rec,y,area)
+    if os.path.exists(run+'/production.start'):
+        state='production from year '+str(prodstart(run,ymax))
+    else:
+        state='settled, switching' if os.path.exists(run+'/'+FLAG) else 'spinning up'
+    print(exp.ljust(24)+' year '+str(y).rjust(4)+'  ke '+'%.3e'%rec[y][0]+'  tx '+'%7.2f'%rec[y][2]+' Sv  '+\
+          ('drift ke '+'%.3f'%d['ke']+' hc '+'%.3f'%d['hc']+' W m-2 tx '+'%.3f'%d['tx'] if d else 'drift -')+'  '+state)
+
+if __name__ == "__main__":
+    if len(sys.argv)<2 or sys.argv[1] not in ['check','status']:
+        sys.exit(__doc__)
+    if sys.argv[1]=='check':
+        check(sys.argv[3].rstrip('/') if len(sys.argv)>3 else '.',int(sys.argv[2]))
+    else:
+        arg=sys.argv[2] if len(sys.argv)>2 else '.'
+        if os.path.isfile(arg):
+            #rfiles/runme: rP_YEAR_MAX then a run folder a line
+            with ctx.closing(open(arg,'r')) as handle:
+                for r in [l.strip().rstrip('/') for l in handle if l.strip()!=''][1:]:
+                    status(r)
+        else:
+            status(arg.rstrip('/'))
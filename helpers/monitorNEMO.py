@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+"""
+ Keep an eye on all the members of an ensemble while they run
+
+ python monitorNEMO.py rfiles/runme [every]    - every few seconds (default EVERY, 0 to look once) a line per member: year, how far
+                                               through it, steps a second, when the year and the run should be done, and
+                                               STALLED for members whose time step hasn't moved in STALL seconds
+                                               (looking once the exit status is 1 if any have stalled)
+
+ nemo.exe rewrites time.step (the step it's on) every step and the job scripts keep the year in time.year.step, so a look is just a
+ stat and two tiny reads per member, nothing touches ocean.output or the outputs. Steps a second is over the last WINDOW seconds of
+ looks; before there are two looks it's from the start of the launch (the 'nemo start' record in telemetry.log, see telemetry.py).
+ A member whose time step is stuck on the last step of a year is in postNEMO.py (post), that's only a stall after POSTSTALL seconds.
+ Each look also asks squeue (once, for all the members) what jobs we have; a member with a job pending and none running (resubmitted
+ and waiting in the queue) hasn't stalled however old its time.step is.
+"""
+import sys,os
+import re
+import time
+import subprocess
+import collections
+import contextlib as ctx
+import f90nml
+from restarts import prodstart,NPROD
+
+#seconds between looks
+EVERY=60
+#steps a second is worked out over this many seconds
+WINDOW=600
+#a member whose time.step hasn't changed in this long has stalled (nemo.exe writes it every step, a step takes seconds)
+STALL=900
+#same for a member that's finished a year's steps and is in postNEMO.py (rebuilds, moving files about)
+POSTSTALL=3600
+
+def readrun(run):
+    """what doesn't change during a run: (time steps per year, last year) from run/namelist_cfg and run/rPARAMS.py"""
+    with ctx.closing(open(run+'/rPARAMS.py','r')) as handle:
+        prm=dict(re.findall(r"^(rP_\w+)='(.*)'",handle.read(),re.M))
+    rdt=f90nml.read(run+'/namelist_cfg')['namdom']['rn_rdt']
+    return int(int(prm['rP_NDAYS'])*86400//rdt),int(prm['rP_YEAR_MAX'])
+
+def launched(run):
+    """(time, year) of the last 'nemo start' record in run/telemetry.log, None if there isn't one"""
+    last=None
+    if os.path.exists(run+'/telemetry.log'):
+        with ctx.closing(open(run+'/telemetry.log','r')) as handle:
+            for l in handle:
+                l=l.split()
+                if len(l)==8 and l[6]=='nemo' and l[7]=='start':
+                    last=(int(l[0]),int(l[4]))
+    return last
+
+def queued():
+    """{run folder: set of states} of our jobs (squeue, by the folder they were submitted from), {} if there's no squeue"""
+    try:
+        out=subprocess.check_output(['squeue','-h','-u',os.environ.get('USER',''),'-o','%T %Z'],universal_newlines=True)
+    except (OSError,subprocess.CalledProcessError):
+        return {}
+    jobs={}
+    for l in out.splitlines():
+        l=l.split()
+        if len(l)==2:
+            jobs.setdefault(os.path.abspath(l[1]),set()).add(l[0])
+    return jobs
+
+def look(run):
+    """(time step, time.step mtime, year in time.year.step), None for what isn't there"""
+    kt,mt,yr=None,None,None
+    #a pipelined launch runs in .packrun/ (see packNEMO.py)
+    ts=run+'/.packrun/time.step' if os.path.exists(run+'/.packrun/time.step') else run+'/time.step'
+    try:
+        mt=os.stat(ts).st_mtime
+        with ctx.closing(open(ts,'r')) as handle:
+            kt=int(handle.read().split()[0])
+    except (OSError,IndexError,ValueError):
+        pass
+    try:
+        with ctx.closing(open(run+'/time.year.step','r')) as handle:
+            yr=int(handle.read().strip().split('=')[1])
+    except (OSError,IndexError,ValueError):
+        pass
+    return kt,mt,yr
+
+def hms(s):
+    """s seconds as e.g. 3d04h or 5h12m"""
+    s=int(s)
+    return str(s//86400)+'d'+str(s%86400//3600).zfill(2)+'h' if s>=86400 else str(s//3600)+'h'+str(s%3600//60).zfill(2)+'m'
+
+class Member(object):
+    """one run folder and its recent looks"""
+    def __init__(self,run):
+        self.run=run
+        self.name=os.path.basename(run)
+        self.nstep,self.ymax=None,None
+        self.looks=collections.deque()
+
+    def status(self,now,jobs={}):
+        """a line about this member, and whether it has stalled (jobs is queued())"""
+        if self.nstep is None:
+            try:
+                self.nstep,self.ymax=readrun(self.run)
+            except (OSError,KeyError,ValueError):
+                return self.name.ljust(24)+' not set up (no rPARAMS.py/namelist_cfg)',False
+        kt,mt,yr=look(self.run)
+        #an early switch to the production phase (equilNEMO.py) ends the run sooner
+        self.ymax=prodstart(self.run,self.ymax)+NPROD-1
+        if yr is not None and yr>self.ymax:
+            return self.name.ljust(24)+' done ('+str(self.ymax)+' years)',False
+        if kt is None:
+            return self.name.ljust(24)+' year '+str(yr or '-').rjust(4)+'  no time.step (queued or between launches)',False
+
+        if len(self.looks)>0 and kt<self.looks[-1][1]:
+            #started again from an earlier restart
+            self.looks.clear()
+        if len(self.looks)==0 or self.looks[-1][1]!=kt:
+            self.looks.append((mt,kt))
+        while len(self.looks)>2 and self.looks[1][0]<now-WINDOW:
+            self.looks.popleft()
+        rate=None
+        if len(self.looks)>=2 and self.looks[-1][1]>self.looks[0][1]:
+            (t0,k0),(t1,k1)=self.looks[0],self.looks[-1]
+            rate=(k1-k0)/max(t1-t0,1.)
+        else:
+            start=launched(self.run)
+            if start is not None and mt>start[0] and kt>(start[1]-1)*self.nstep:
+                rate=(kt-(start[1]-1)*self.nstep)/max(mt-start[0],1.)
+
+        year=(kt-1)//self.nstep+1
+        done=kt-(year-1)*self.nstep
+        post=done==self.nstep
+        age=now-mt
+        stalled=age>(POSTSTALL if post else STALL)
+        #resubmitted and waiting for its turn, nemo.exe isn't running so time.step can't move
+        states=jobs.get(os.path.abspath(self.run),set())
+        pending='PENDING' in states and 'RUNNING' not in states
+        if pending:
+            stalled=False
+        line=self.name.ljust(24)+' year '+str(year).rjust(4)+' '+str(round(100.*done/self.nstep,1)).rjust(6)+'%'
+        line+=(str(round(rate,2)) if rate else '-').rjust(9)+' steps/s'
+        if rate:
+            line+='  year in '+('-' if post else hms((self.nstep-done)/rate)).rjust(6)+\
+                  ', run in '+hms(((self.ymax-year+1)*self.nstep-done)/rate).rjust(6)
+        line+='  '+('STALLED ' if stalled else '')+('(post) ' if post else '')+('(pending) ' if pending else '')+'time.step '+hms(age)+' old'
+        return line,stalled
+
+if __name__ == "__main__":
+    if len(sys.argv)<2:
+        sys.exit(__doc__)
+    every=int(sys.argv[2]) if len(sys.argv)>2 else EVERY
+    with ctx.closing(open(sys.argv[1],'r')) as handle:
+        runs=[l.strip().rstrip('/') for l in handle if l.strip()!=''][1:]
+    members=[Member(r) for r in runs]
+    while True:
+        now=time.time()
+        jobs=queued()
+        lines=[m.status(now,jobs) for m in members]
+        print(time.strftime('%Y-%m-%d %H:%M:%S')+' '+str(len(members))+' members, '+str(sum([s for l,s in lines]))+' stalled')
+        for l,s in lines:
+            print('    '+l)
+        if every<=0:
+            #so it can go in a cron job/watch that tells us
+            sys.exit(1 if any([s for l,s in lines]) else 0)
+        if all(['done (' in l for l,s in lines]):
+            break
+        sys.stdout.flush()
+        time.sleep(every)
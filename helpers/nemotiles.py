@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""
+ Read NEMO per processor (tile) files as if they had been rebuilt, without rebuilding them
+
+    from nemotiles import TiledFile
+    rst=TiledFile('asf_c73_00008_04161000_restart',1024)
+    sst=rst['tn'][0,0,:,:]        #whole domain, surface
+    sec=rst['vn'][0,:,200,:]      #a section, only the 32 tiles it crosses get read
+
+ Only the DOMAIN_* attributes of the tiles are read up front (see rebuild_tiles.tileinfo), a slice then reads just the tiles
+ it intersects. Missing (land suppressed) tiles come back as the variable's _FillValue (or 0), same as rebuild_tiles.py.
+
+ python nemotiles.py filebase ndomain [variable]   - what's in the tiles, and min/mean/max of each level of variable
+"""
+import sys,os
+import contextlib as ctx
+import numpy as np
+import netCDF4
+from rebuild_tiles import tileinfo
+
+class TiledFile(object):
+    """a set of tile files (filebase_NNNN.nc) that looks like the rebuilt filebase.nc"""
+    def __init__(self,base,ndomain):
+        """
+        :base: file base (as for rebuild_nemo), e.g. mesh_mask or OUTNEMO_0094/asf_c73_00008_04117200_restart
+        :ndomain: number of tiles
+        """
+        tiles=[base+'_'+str(n).zfill(4)+'.nc' for n in range(ndomain)]
+        tiles=[t for t in tiles if os.path.exists(t)]
+        assert(tiles!=[]),"no tiles "+base+"_NNNN.nc found"
+        self.base=base
+        self.tiles=tiles
+        self.info=tileinfo(tiles)
+        #number of tile reads so far (to see how much a slice cost)
+        self.nread=0
+        with ctx.closing(netCDF4.Dataset(tiles[0])) as nc:
+            dnames=list(nc.dimensions)
+            self.split=[dnames[i-1] for i in np.atleast_1d(nc.DOMAIN_dimensions_ids)]
+            gsize=dict(zip(self.split,[int(s) for s in np.atleast_1d(nc.DOMAIN_size_global)]))
+            self.dimensions={d.name:gsize.get(d.name,len(d)) for d in nc.dimensions.values()}
+            self.variables={}
+            for v in nc.variables.values():
+                self.variables[v.name]=TiledVariable(self,v.name,v.dimensions,v.dtype,\
+                        v._FillValue if '_FillValue' in v.ncattrs() else 0,{a:v.getncattr(a) for a in v.ncattrs()})
+        #global [start,stop) of each tile's interior, per tiled dimension
+        self.bounds={d:np.array([[g[d].start,g[d].stop] for t,l,g in self.info]) for d in self.split}
+
+    def __getitem__(self,v):
+        return self.variables[v]
+
+    def read(self,v,key):
+        """global slice key of variable v, reading only the tiles it needs"""
+        var=self.variables[v]
+        if not isinstance(key,tuple):
+            key=(key,)
+        if [k for k in key if k is Ellipsis]:
+            i=key.index(Ellipsis)
+            key=key[:i]+(slice(None),)*(len(var.shape)-len(key)+1)+key[i+1:]
+        key=key+(slice(None),)*(len(var.shape)-len(key))
+        assert(len(key)==len(var.shape)),"too many indices for "+v+" "+str(var.shape)
+
+        #bounding box (lo,hi) of the request and what to take from it afterwards
+        lo,hi,take=[],[],[]
+        for k,n in zip(key,var.shape):
+            if isinstance(k,slice):
+                start,stop,step=k.indices(n)
+                assert(step>0),"negative steps aren't supported"
+                cnt=max(0,(stop-start+step-1)//step)
+                lo.append(start)
+                hi.append(start+(cnt-1)*step+1 if cnt>0 else start)
+                take.append(slice(None,None,step))
+            else:
+                k=int(k)+n if int(k)<0 else int(k)
+                assert(0<=k<n),"index "+str(k)+" out of range for "+v+" "+str(var.shape)
+                lo.append(k)
+                hi.append(k+1)
+                take.append(0)
+
+        out=np.full([b-a for a,b in zip(lo,hi)],var.fill,dtype=var.dtype)
+        if out.size>0:
+            sdims=[d for d in var.dimensions if d in self.split]
+            if sdims==[]:
+                with ctx.closing(netCDF4.Dataset(self.tiles[0])) as nc:
+                    nc.set_auto_mask(False)
+                    out[...]=nc.variables[v][tuple([slice(a,b) for a,b in zip(lo,hi)])]
+                self.nread+=1
+            else:
+                hit=np.ones(len(self.info),bool)
+                for d in sdims:
+                    i=var.dimensions.index(d)
+                    hit&=(self.bounds[d][:,0]<hi[i]) & (self.bounds[d][:,1]>lo[i])
+                for n in np.flatnonzero(hit):
+                    t,loc,gbl=self.info[n]
+                    lidx,oidx=[],[]
+                    for d,a,b in zip(var.dimensions,lo,hi):
+                        if d in gbl:
+                            a,b=max(a,gbl[d].start),min(b,gbl[d].stop)
+                            lidx.append(slice(loc[d].start+a-gbl[d].start,loc[d].start+b-gbl[d].start))
+                            oidx.append(slice(a-lo[var.dimensions.index(d)],b-lo[var.dimensions.index(d)]))
+                        else:
+                            lidx.append(slice(a,b))
+                            oidx.append(slice(None))
+                    with ctx.closing(netCDF4.Dataset(t)) as nc:
+                        nc.set_auto_mask(False)
+                        out[tuple(oidx)]=nc.variables[v][tuple(lidx)]
+                    self.nread+=1
+        return out[tuple(take)]
+
+class TiledVariable(object):
+    """a variable of a TiledFile, slice it like a netCDF4 variable"""
+    def __init__(self,tf,name,dimensions,dtype,fill,attrs):
+        self.tf=tf
+        self.name=name
+        self.dimensions=dimensions
+        self.dtype=dtype
+        self.fill=fill
+        self.attrs=attrs
+        self.shape=tuple([tf.dimensions[d] for d in dimensions])
+
+    def __getitem__(self,key):
+        return self.tf.read(self.name,key)
+
+if __name__ == "__main__":
+    if len(sys.argv)<3:
+        sys.exit('usage: python nemotiles.py filebase ndomain [variable]')
+    tf=TiledFile(sys.argv[1],int(sys.argv[2]))
+    print(tf.base+': '+str(len(tf.tiles))+' tiles, '+', '.join([d+'='+str(n) for d,n in tf.dimensions.items()]))
+    for v in tf.variables.values():
+        print('    '+v.name+' '+str(v.dimensions)+' '+str(v.dtype))
+    if len(sys.argv)>3:
+        v=tf[sys.argv[3]]
+        lead=v.shape[:-2] if [d for d in v.dimensions[-2:] if d in tf.split] else ()
+        for idx in np.ndindex(*lead):
+            a=v[idx]
+            print('    '+v.name+str(list(idx))+': min '+str(a.min())+' mean '+str(a.mean())+' max '+str(a.max()))
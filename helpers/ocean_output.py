@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+"""
+ Index the ocean.output.NNNN files of runs so questions about them don't mean grepping hundreds of 4000 line files
+
+ python ocean_output.py index RUNDIR [RUNDIR ...]      - build/update the index of each run (in parallel), only new or changed years are read
+ python ocean_output.py opened RUNDIR YEAR             - files opened (iom_nf90_open) in year YEAR
+ python ocean_output.py restartvars RUNDIR [YEAR]      - variables written to the restart (the last year if no YEAR)
+ python ocean_output.py warnings RUNDIR                - warnings (and errors) by year
+ python ocean_output.py summary RUNDIR                 - events of each kind by year, and the years that didn't finish (no restart written)
+
+ Each line of interest becomes an event (year, line, kind, var, file, kt, rec, text), kinds:
+    open (file, text=mode), close (file), read (var, file, rec), write (var, file), fld_read (var, kt, rec, text=date),
+    restart (kt of rst_write), warning/error (text), namelist (var=group), mpp (var=jpni/jpnj/ocean/suppressed land, rec=value)
+ The index of a run (RUNDIR/ocean_output.npz) is columnar: numbers as arrays, strings as codes into a vocabulary, see load/select.
+ The ocean.output.NNNN are looked for in RUNDIR/ and RUNDIR/OUTNEMO_NNNN/ (where postNEMO.py puts them).
+"""
+import sys,os
+import re
+import glob
+import concurrent.futures
+import contextlib as ctx
+import numpy as np
+
+KINDS=['open','close','read','write','fld_read','restart','warning','error','namelist','mpp']
+STRS=['var','file','text']
+NUMS={'year':np.int16,'line':np.int32,'kind':np.int8,'kt':np.int64,'rec':np.int32}
+IDX='ocean_output.npz'
+
+PATS=[('open',re.compile(r'iom_nf90_open ~~~ (?:open existing|create new) file: (?P<file>\S+) in (?P<text>\w+) mode')),
+      ('close',re.compile(r'iom_close ~~~ close file: (?P<file>\S+) ok')),
+      ('read',re.compile(r'^\s+read (?P<var>\S+) \(rec:\s*(?P<rec>\d+)\) in (?P<file>\S+) ok')),
+      ('write',re.compile(r'iom_nf90_rp0123d, file: (?P<file>\S+), var: (?P<var>\S+) written ok')),
+      ('fld_read',re.compile(r'fld_read: var (?P<var>\S+) kt =\s*(?P<kt>\d+).*Y/M/D = (?P<text>[\d/]+), records?(?: b/a)?:\s*(?P<rec>\d+)')),
+      ('restart',re.compile(r'rst_write : write oce restart file\s+kt =\s*(?P<kt>\d+)')),
+      ('namelist',re.compile(r'^\s+Namelist :?\s*(?P<var>nam\w+)')),
+      ('mpp',re.compile(r'^\s+(?P<var>jpni|jpnj) =\s*(?P<rec>\d+)\s*$')),
+      ('mpp',re.compile(r'Number of (?P<var>ocean|suppressed land) subdomains =\s*(?P<rec>\d+)'))]
+ALERT=re.compile(r'===>>> : (W A R N I N G|E R R O R)')
+
+def parse(f):
+    """events of one ocean.output, as a generator of (line, kind, var, file, kt, rec, text)"""
+    alert=None
+    with ctx.closing(open(f,'r',errors='replace')) as handle:
+        for n,l in enumerate(handle):
+            if alert is not None:
+                #the message is the first line after the banner that isn't blank or ====
+                if l.strip()!='' and not l.strip().startswith('='):
+                    yield (alert[0],alert[1],'','',0,0,l.strip())
+                    alert=None
+                continue
+            m=ALERT.search(l)
+            if m is not None:
+                alert=(n+1,'warning' if m.group(1).startswith('W') else 'error')
+                continue
+            for kind,pat in PATS:
+                m=pat.search(l)
+                if m is not None:
+                    g=m.groupdict()
+                    yield (n+1,kind,g.get('var') or '',g.get('file') or '',int(g.get('kt') or 0),int(g.get('rec') or 0),g.get('text') or '')
+                    break
+    if alert is not None:
+        yield (alert[0],alert[1],'','',0,0,'')
+
+def outputs(run):
+    """{year: ocean.output file} of a run folder"""
+    out={}
+    for f in glob.glob(run+'/ocean.output.[0-9]*')+glob.glob(run+'/OUTNEMO_[0-9]*/ocean.output.[0-9]*'):
+        yr=os.path.basename(f).split('.')[-1]
+        if yr.isdigit():
+            out[int(yr)]=f
+    return out
+
+def load(run):
+    """the index of a run as {column: array} (strings decoded), plus 'files': {year: (file, size, mtime)}, None if there isn't one"""
+    if not os.path.exists(run+'/'+IDX):
+        return None
+    with np.load(run+'/'+IDX) as z:
+        idx={c:z['col_'+c] for c in NUMS}
+        for c in STRS:
+            idx[c]=z['vocab_'+c][z['col_'+c]]
+        idx['files']={int(y):(str(f),int(s),float(t)) for y,f,s,t in zip(z['fyear'],z['fname'],z['fsize'],z['fmtime'])}
+    return idx
+
+def save(run,idx):
+    """write the index of a run (written to a temporary file first so it's never half there)"""
+    cols={'col_'+c:idx[c].astype(t) for c,t in NUMS.items()}
+    for c in STRS:
+        cols['vocab_'+c],codes=np.unique(idx[c].astype(str),return_inverse=True)
+        cols['col_'+c]=codes.astype(np.int32)
+    years=sorted(idx['files'])
+    cols['fyear']=np.array(years,np.int16)
+    cols['fname']=np.array([idx['files'][y][0] for y in years],str)
+    cols['fsize']=np.array([idx['files'][y][1] for y in years],np.int64)
+    cols['fmtime']=np.array([idx['files'][y][2] for y in years],float)
+    tmp=run+'/'+IDX[:-4]+'.tmp.npz'
+    np.savez_compressed(tmp,**cols)
+    os.rename(tmp,run+'/'+IDX)
+
+def index(run):
+    """build or update the index of run folder run, only (re)reading the years that are new or have changed
+
+    :returns: (run, years read, number of events in the index)
+    """
+    files=outputs(run)
+    idx=load(run)
+    if idx is None:
+        idx={c:np.zeros(0,t) for c,t in NUMS.items()}
+        idx.update({c:np.zeros(0,str) for c in STRS})
+        idx['files']={}
+    todo=[]
+    for y,f in sorted(files.items()):
+        st=os.stat(f)
+        if idx['files'].get(y)!=(f,st.st_size,st.st_mtime):
+            todo.append(y)
+            idx['files'][y]=(f,st.st_size,st.st_mtime)
+    for y in [y for y in idx['files'] if y not in files]:
+        todo.append(y)
+        del idx['files'][y]
+    if todo==[]:
+        return run,[],len(idx['year'])
+
+    keep=~np.isin(idx['year'],todo)
+    cols={c:[idx[c][keep]] for c in list(NUMS)+STRS}
+    for y in todo:
+        if y not in files:
+            continue
+        ev=list(parse(files[y]))
+        if ev==[]:
+            continue
+        line,kind,var,fil,kt,rec,text=zip(*ev)
+        new={'year':np.full(len(ev),y),'line':line,'kind':[KINDS.index(k) for k in kind],'kt':kt,'rec':rec,'var':var,'file':fil,'text':text}
+        for c in cols:
+            cols[c].append(np.array(new[c],dtype=NUMS.get(c,str)))
+    for c in cols:
+        idx[c]=np.concatenate(cols[c])
+    order=np.lexsort((idx['line'],idx['year']))
+    for c in cols:
+        idx[c]=idx[c][order]
+    save(run,idx)
+    return run,todo,len(idx['year'])
+
+def select(idx,kind,year=None,**match):
+    """rows of the index of one kind (and year), e.g. select(idx,'write',96,file='...'), as a list of dictionaries"""
+    sel=idx['kind']==KINDS.index(kind)
+    if year is not None:
+        sel&=idx['year']==year
+    for c,v in match.items():
+        sel&=idx[c]==v
+    return [{c:idx[c][i] for c in list(NUMS)+STRS if c!='kind'} for i in np.flatnonzero(sel)]
+
+def indexall(runs,nproc=None):
+    """index a lot of runs (e.g. all the members in rfiles/runme) on a pool of processes"""
+    if nproc is None:
+        nproc=min(len(runs),len(os.sched_getaffinity(0)),16)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max(nproc,1)) as pool:
+        for run,todo,nev in pool.map(index,runs):
+            print(run+': '+(str(len(todo))+' year(s) (re)read' if todo!=[] else 'up to date')+', '+str(nev)+' events')
+
+if __name__ == "__main__":
+    if len(sys.argv)<3 or sys.argv[1] not in ['index','opened','restartvars','warnings','summary']:
+        sys.exit(__doc__)
+    if sys.argv[1]=='index':
+        indexall([r.rstrip('/') for r in sys.argv[2:]])
+        sys.exit(0)
+    run=sys.argv[2].rstrip('/')
+    index(run)
+    idx=load(run)
+    assert(idx is not None and idx['files']!={}),"no ocean.output.NNNN found in "+run
+    if sys.argv[1]=='opened':
+        for f in sorted(set([e['file'] for e in select(idx,'open',int(sys.argv[3]))])):
+            print(f)
+    elif sys.argv[1]=='restartvars':
+        yr=int(sys.argv[3]) if len(sys.argv)>3 else max(idx['files'])
+        for e in select(idx,'write',yr):
+            if '_restart' in e['file']:
+                print(e['var'])
+    elif sys.argv[1]=='warnings':
+        for kind in ['error','warning']:
+            for e in select(idx,kind):
+                print(str(e['year']).zfill(4)+' '+kind.ljust(8)+'line '+str(e['line']).ljust(6)+e['text'])
+    else:
+        years=sorted(idx['files'])
+        print('year '+' '.join([k[:8].rjust(8) for k in KINDS]))
+        for y in years:
+            print(str(y).zfill(4)+' '+' '.join([str(int(((idx['year']==y) & (idx['kind']==i)).sum())).rjust(8) for i in range(len(KINDS))]))
+        unfinished=[y for y in years if not ((idx['year']==y) & (idx['kind']==KINDS.index('restart'))).any()]
+        print('years that did not write a restart (did not finish): '+(' '.join([str(y) for y in unfinished]) if unfinished!=[] else 'none'))
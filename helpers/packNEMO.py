@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+"""
+ Helper for running several model years in one nemo.exe launch (the packed loops of goNEMOlong.sh/goNEMOproduction.sh, see wryears in setupNEMO_ARC2.py)
+
+ python packNEMO.py stretch N : (after preNEMO.py) namelist_cfg runs N years in one go, with a restart written at the end of every year
+ python packNEMO.py year K    : (after nemo.exe) make the run folder look like year K (0..N-1) of the stretch was run on its own so
+                                postNEMO.py can do its usual bookkeeping for it, exits 1 if year K didn't finish (no restart)
+                                or an xios output spans more than a year
+
+ and when the posts are pipelined (run in the background of the next launch):
+ python packNEMO.py launch N YEAR : (after preNEMO.py) the same for a launch from YEAR run in .packrun/, which has links to the run
+                                    folder's inputs and its own namelist_cfg. It starts from the restart tiles the last launch left in
+                                    .packrst/ (the posts that rebuild them into OUTNEMO_NNNN/restarts/ run alongside it), exits 1 if
+                                    they aren't there and preNEMO.py didn't set up YEAR either
+ python packNEMO.py hand          : (after nemo.exe, once the posts of the last launch are done) move what nemo.exe wrote in .packrun/
+                                    to the run folder for the posts (packNEMO.py year) and keep the tiles of its last restart in .packrst/
+
+ Whatever belongs to the later years of the stretch (restarts and xios output) is kept in .packhold/ while the earlier years are
+ processed, and ocean.output/time.step/run.stat are handed to each year. That needs xios to start a new file every year: setupNEMO_ARC2.py
+ puts split_freq="1y" in the file_defs (yearly) and a stretch of more than a year refuses to start if one of them isn't split that way.
+ A pipelined launch never writes in the run folder, so it and the posts of the one before don't get in each other's way.
+"""
+import sys,os
+import re
+import glob
+import shutil
+import fnmatch
+import datetime
+import contextlib as ctx
+import f90nml
+
+HOLD='.packhold/'
+#(pipeline) where nemo.exe runs, and the tiles of the restart the last launch ended with
+RUN='.packrun/'
+RST='.packrst/'
+#(pipeline) what isn't linked into RUN: what nemo.exe (and the posts) write
+NOLINK=['OUTNEMO_*','namelist_cfg','ocean.output*','time.*','run.stat*','timing.output','layout.dat','output.*','mesh_mask*',
+        'communication_report.txt','*_restart*.nc','*_'+'[0-9]'*8+'_'+'[0-9]'*8+'_*.nc','*.sh','*.log','domaincfg','cfl','scaling']
+#files that nemo.exe writes once for the whole stretch (postNEMO.py moves them away) so each year gets them
+SHARED=['ocean.output','time.step','run.stat']
+#xios split_freq that gives each year its own files
+SPLIT='1y'
+FREQ=re.compile(r'(\d+(?:\.\d+)?)\s*(y|mo|d|h|mi|s|ts)')
+MONTHS={'y':12.,'mo':1.,'d':1/31.,'h':1/744.,'mi':1/44640.,'s':1/2678400.,'ts':0.}
+
+def nstep(nml):
+    """number of time steps in one model year (rP_NDAYS from rPARAMS.py)"""
+    sys.path.insert(0,os.getcwd())
+    from rPARAMS import rP_NDAYS
+    secs=int(rP_NDAYS)*86400
+    rdt=nml['namdom']['rn_rdt']
+    assert(secs%rdt==0),"a year ("+rP_NDAYS+" days) isn't a whole number of time steps of "+str(rdt)+"s"
+    return int(secs//rdt)
+
+def modelday(d,leapy):
+    """days since 0001-01-01 of date d (yyyymmdd) in nemo's calendar (nn_leapy)"""
+    y,m,dd=int(d[:4]),int(d[4:6]),int(d[6:8])
+    if leapy==30:
+        return (y-1)*360+(m-1)*30+dd-1
+    elif leapy==0:
+        return (y-1)*365+[0,31,59,90,120,151,181,212,243,273,304,334][m-1]+dd-1
+    return datetime.date(y,m,dd).toordinal()-1
+
+def months(freq):
+    """length of xios duration freq (e.g. 1y, 6mo, 5d) in months, near enough"""
+    return sum([float(v)*MONTHS[u] for v,u in FREQ.findall(freq)])
+
+def yearly(f):
+    """patch file_def f so xios starts a new file every year: split_freq 1y on file_definition (what files inherit), longer ones cut to 1y"""
+    with ctx.closing(open(f,'r')) as handle:
+        s=handle.read()
+    s=re.sub(r'split_freq\s*=\s*"([^"]*)"',lambda m: 'split_freq="'+SPLIT+'"' if months(m.group(1))>12 else m.group(0),s)
+    s=re.sub(r'<file_definition(?![^>]*split_freq)','<file_definition split_freq="'+SPLIT+'"',s)
+    #a new file rather than in place, the template may be linked into other run folders
+    with ctx.closing(open(f+'_new','w')) as handle:
+        handle.write(s)
+    os.rename(f+'_new',f)
+
+def unsplit(f):
+    """names of the (enabled) files of file_def f that xios won't split a year a file"""
+    import xml.etree.ElementTree as ET
+    out=[]
+    def walk(e,att):
+        att=dict(att,**{k:v for k,v in e.attrib.items() if k in ['split_freq','output_freq','enabled']})
+        if e.tag=='file' and att.get('enabled','true').strip('.').lower()!='false':
+            split=months(att.get('split_freq',''))
+            if split==0 or split>12 or months(att.get('output_freq',''))>12:
+                out.append(e.get('id',e.get('name_suffix','?')))
+        for c in e:
+            walk(c,att)
+    walk(ET.parse(f).getroot(),{})
+    return out
+
+def splitcheck(n):
+    """stop if a stretch of n years would put more than one year in a file"""
+    bad=[x+': '+' '.join(unsplit(x)) for x in sorted(glob.glob('file_def*.xml')) if unsplit(x)!=[]]
+    if n>1 and bad!=[]:
+        sys.exit('packNEMO: E R R O R: xios would write years of the stretch into the same file (split_freq not 1y or shorter),'+\
+                 ' stopping.\n    '+'\n    '.join(bad))
+
+def stretch(n):
+    """patch namelist_cfg (as left by preNEMO.py) to run n years"""
+    splitcheck(n)
+    nml=f90nml.read('namelist_cfg')
+    it0=nml['namrun']['nn_it000']
+    ns=nstep(nml)
+    if os.path.exists(HOLD):
+        shutil.rmtree(HOLD)
+    os.mkdir(HOLD)
+    f90nml.patch('namelist_cfg',{'namrun':{'nn_itend':it0-1+n*ns,'nn_stock':ns}},out_path='namelist_cfg_new')
+    shutil.move('namelist_cfg_new','namelist_cfg')
+    shutil.copy2('namelist_cfg',HOLD+'namelist_cfg')
+    with ctx.closing(open(HOLD+'stretch','w')) as handle:
+        handle.write(str(it0)+' '+str(n)+' '+str(ns)+'\n')
+    print('packNEMO: years of '+str(ns)+' steps, running '+str(n)+' of them from step '+str(it0)+' to '+str(it0-1+n*ns))
+
+def launch(n,y):
+    """set up RUN for a launch of n years from year y, from the tiles in RST if they're the end of year y-1"""
+    splitcheck(n)
+    nml=f90nml.read('namelist_cfg')
+    ns=nstep(nml)
+    it0=(y-1)*ns+1
+    patch={'nn_itend':it0-1+n*ns,'nn_stock':ns}
+    rst=nml['namrun']['cn_exp']+'_'+str(it0-1).zfill(8)+'_restart'
+    if glob.glob(RST+rst+'_[0-9]*.nc')!=[]:
+        patch.update({'nn_it000':it0,'ln_rstart':True,'cn_ocerst_indir':os.path.abspath(RST),'cn_ocerst_in':rst})
+        print('packNEMO: starting from the tiles of '+rst+' in '+RST)
+    elif nml['namrun']['nn_it000']!=it0:
+        sys.exit('packNEMO: E R R O R: year '+str(y)+' starts at step '+str(it0)+', preNEMO.py set up '+str(nml['namrun']['nn_it000'])+\
+                 ' and there are no '+rst+' tiles in '+RST+', stopping.')
+    if os.path.exists(RUN):
+        shutil.rmtree(RUN)
+    os.mkdir(RUN)
+    for f in sorted(os.listdir('.')):
+        if not f.startswith('.') and not any([fnmatch.fnmatch(f,p) for p in NOLINK]):
+            os.symlink(os.path.abspath(f),RUN+f)
+    f90nml.patch('namelist_cfg',{'namrun':patch},out_path=RUN+'namelist_cfg')
+    with ctx.closing(open(RUN+'stretch','w')) as handle:
+        handle.write(str(it0)+' '+str(n)+' '+str(ns)+'\n')
+    print('packNEMO: years of '+str(ns)+' steps, running '+str(n)+' of them from step '+str(it0)+' to '+str(it0-1+n*ns)+' in '+RUN)
+
+def hand():
+    """move what nemo.exe wrote in RUN to the run folder (and the stretch to HOLD), keep the tiles of its last restart in RST"""
+    with ctx.closing(open(RUN+'stretch','r')) as handle:
+        it0,n,ns=[int(v) for v in handle.read().split()]
+    if os.path.exists(HOLD):
+        shutil.rmtree(HOLD)
+    os.mkdir(HOLD)
+    shutil.move(RUN+'stretch',HOLD+'stretch')
+    shutil.copy2(RUN+'namelist_cfg',HOLD+'namelist_cfg')
+    for f in sorted(os.listdir(RUN)):
+        if not os.path.islink(RUN+f):
+            shutil.move(RUN+f,f)
+    shutil.rmtree(RUN)
+    #hard links, so they're still there for the next launch once the posts have rebuilt them
+    tiles=glob.glob('*_'+str(it0-1+n*ns).zfill(8)+'_restart_[0-9]*.nc')
+    if tiles!=[]:
+        if os.path.exists(RST):
+            shutil.rmtree(RST)
+        os.mkdir(RST)
+        for f in tiles:
+            os.link(f,RST+f)
+    print('packNEMO: handed steps '+str(it0)+' to '+str(it0-1+n*ns)+' to the posts, '+str(len(tiles))+' restart tiles kept for the next launch')
+
+def restore():
+    """put back everything that was held for later years"""
+    for f in glob.glob(HOLD+'later/*'):
+        shutil.move(f,os.path.basename(f))
+
+def abort(msg):
+    """give ocean.output etc. back to the run folder, drop the hold and stop"""
+    print('packNEMO: E R R O R: '+msg+', stopping.')
+    for f in SHARED:
+        if os.path.exists(HOLD+f):
+            shutil.copy2(HOLD+f,f)
+    shutil.rmtree(HOLD)
+    sys.exit(1)
+
+def year(k):
+    """make the run folder look like year k of the stretch"""
+    with ctx.closing(open(HOLD+'stretch','r')) as handle:
+        it0,n,ns=[int(v) for v in handle.read().split()]
+    assert(0<=k<n),"year "+str(k)+" isn't part of a stretch of "+str(n)+" years"
+    restore()
+    iend=it0-1+(k+1)*ns
+
+    if glob.glob('*_'+str(iend).zfill(8)+'_restart*.nc')==[]:
+        abort('no restart for step '+str(iend)+' so year '+str(k)+' of the stretch did not finish')
+
+    nml=f90nml.read(HOLD+'namelist_cfg')
+    leapy=nml['namrun']['nn_leapy']
+    ndays=ns*nml['namdom']['rn_rdt']/86400.
+    #a file that runs into the next year can't be given to either
+    for f in glob.glob('*.nc'):
+        d=re.search(r'_(\d{8})_(\d{8})_',f)
+        if d is not None and modelday(d.group(2),leapy)-modelday(d.group(1),leapy)+1>ndays+(leapy==1):
+            abort(f+' spans more than a year (xios split_freq longer than 1y?)')
+    if k==0:
+        for f in SHARED:
+            if os.path.exists(f):
+                shutil.copy2(f,HOLD+f)
+        #the xios output files are named expname_freq_startdate_enddate_..., the first year's are the earliest
+        dates=[re.search(r'_(\d{8})_\d{8}_',os.path.basename(f)) for f in glob.glob('*.nc')]
+        dates=[d.group(1) for d in dates if d is not None]
+        with ctx.closing(open(HOLD+'day0','w')) as handle:
+            handle.write(str(min([modelday(d,leapy) for d in dates])) if dates!=[] else '')
+
+    with ctx.closing(open(HOLD+'day0','r')) as handle:
+        day0=handle.read().strip()
+
+    #hold back what the later years wrote
+    os.makedirs(HOLD+'later',exist_ok=True)
+    for f in glob.glob('*.nc'):
+        kt=re.search(r'_(\d{8})_restart',f)
+        d=re.search(r'_(\d{8})_\d{8}_',f)
+        if kt is not None and int(kt.group(1))>iend:
+            shutil.move(f,HOLD+'later/'+f)
+        elif kt is None and d is not None and day0!='' and (modelday(d.group(1),leapy)-int(day0))//ndays>k:
+            shutil.move(f,HOLD+'later/'+f)
+
+    for f in SHARED:
+        if os.path.exists(HOLD+f):
+            shutil.copy2(HOLD+f,f)
+    if os.path.exists('time.step'):
+        with ctx.closing(open('time.step','w')) as handle:
+            handle.write(str(iend).rjust(10)+'\n')
+
+    #namelist as if this year was run on its own (postNEMO.py keeps a copy of it)
+    f90nml.patch(HOLD+'namelist_cfg',{'namrun':{'nn_it000':it0+k*ns,'nn_itend':iend}},out_path='namelist_cfg_new')
+    shutil.move('namelist_cfg_new','namelist_cfg')
+    print('packNEMO: year '+str(k+1)+' of '+str(n)+' in this stretch (steps '+str(it0+k*ns)+' to '+str(iend)+')')
+
+    if k==n-1:
+        shutil.rmtree(HOLD)
+
+if __name__ == "__main__":
+    if len(sys.argv)<2 or sys.argv[1] not in ['stretch','year','launch','hand']:
+        sys.exit('usage: python packNEMO.py stretch N | year K | launch N YEAR | hand')
+    if sys.argv[1]=='stretch':
+        stretch(int(sys.argv[2]))
+    elif sys.argv[1]=='launch':
+        launch(int(sys.argv[2]),int(sys.argv[3]))
+    elif sys.argv[1]=='hand':
+        hand()
+    else:
+        year(int(sys.argv[2]))
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""
+ Routine level timings (namctl ln_timing) of a few years of a run, and what they cost per time step
+
+ python profileNEMO.py table [RUNDIR]     - seconds per time step of each routine in each year that was timed
+ python profileNEMO.py diff [RUNDIR]      - spin up against production: seconds per step of each routine (most extra cost first)
+                                            and the namelist settings that differ between the two
+
+ and in the job scripts (see wryears in setupNEMO_ARC2.py, main's timing):
+ python profileNEMO.py switch YEAR NPACK Y [Y ...]   - ln_timing on in namelist_cfg if the launch of NPACK years from YEAR has a Y in it, off if not
+                                                       (Y can be production, the first production year, see restarts.py prodstart)
+ python profileNEMO.py keep YEAR NPACK PHASE         - move timing.output (and the namelists it ran with) to timing/NNNN_PHASE/
+
+ timing.output covers a whole nemo.exe launch, so with packed years (ypack) it's the launch starting at YEAR, the number of time
+ steps comes from the namelist_cfg kept with it. The routine times are those "Averaged timing on all processors", the time of a
+ routine includes the routines it calls (stp is the whole time step).
+"""
+import sys,os
+import re
+import glob
+import shutil
+import contextlib as ctx
+import f90nml
+from restarts import params,prodstart
+
+TDIR='timing/'
+NUM=re.compile(r'^[-+]?(\d+\.?\d*|\.\d+)([eEdD][-+]?\d+)?$')
+
+def switch(year,npack,years):
+    """ln_timing on in namelist_cfg if one of years is in this launch, off otherwise
+
+    'production' in years is the year the production phase starts, which isn't known before the run with an early switch (equilNEMO.py)
+    """
+    if 'production' in years:
+        years=[prodstart('.',params('.')[2]) if y=='production' else y for y in years]
+    on=len([y for y in years if year<=y<year+npack])>0
+    f90nml.patch('namelist_cfg',{'namctl':{'ln_timing':on}},out_path='namelist_cfg_new')
+    shutil.move('namelist_cfg_new','namelist_cfg')
+    if on:
+        print('profileNEMO: timing nemo.exe for years '+str(year)+'-'+str(year+npack-1))
+
+def keep(year,npack,phase):
+    """move this launch's timing.output to timing/NNNN_phase/ with the namelists it ran with"""
+    d=TDIR+str(year).zfill(4)+'_'+phase+'/'
+    if os.path.exists(d):
+        shutil.rmtree(d)
+    os.makedirs(d)
+    shutil.move('timing.output',d+'timing.output')
+    for f in ['namelist_cfg','namelist_ref']:
+        shutil.copy2(f,d+f)
+    with ctx.closing(open(d+'years','w')) as handle:
+        handle.write(str(npack)+'\n')
+
+def parse(f):
+    """{routine: elapsed seconds} of the "Averaged timing on all processors" table of timing.output f (the first table if it hasn't one)"""
+    with ctx.closing(open(f,'r',errors='replace')) as handle:
+        lines=handle.read().splitlines()
+    start=[n for n,l in enumerate(lines) if 'Averaged timing' in l]
+    start=start[0] if start!=[] else 0
+    out={}
+    table=False
+    for l in lines[start:]:
+        w=l.split()
+        if not table:
+            table=w!=[] and w[0]=='Section'
+            continue
+        if len(w)<2 or not NUM.match(w[1]):
+            if out!={}:
+                break
+            continue
+        out[w[0]]=float(w[1].replace('D','E').replace('d','e'))
+    return out
+
+def steps(d):
+    """time steps in the launch timed in folder d"""
+    nml=f90nml.read(d+'namelist_cfg')['namrun']
+    return nml['nn_itend']-nml['nn_it000']+1
+
+def timed(run):
+    """[(year, phase, {routine: seconds per time step})] of the years timed in run, by year"""
+    out=[]
+    for d in sorted(glob.glob(run+'/'+TDIR+'[0-9]*_*/')):
+        year,phase=os.path.basename(d[:-1]).split('_',1)
+        if os.path.exists(d+'timing.output'):
+            ns=steps(d)
+            out.append((int(year),phase,{r:t/ns for r,t in parse(d+'timing.output').items()}))
+    return out
+
+def settings(d):
+    """namelist_ref with namelist_cfg on top (what nemo.exe ran with) as {(group, variable): value}"""
+    out={}
+    for f in ['namelist_ref','namelist_cfg']:
+        if os.path.exists(d+f):
+            for g,v in f90nml.read(d+f).items():
+                for k,val in (v.items() if isinstance(v,dict) else []):
+                    out[(g,k)]=val
+    return out
+
+def average(tims):
+    """{routine: mean seconds per step} over a list of timed years (routines missing from a year count as 0)"""
+    rs=set([r for t in tims for r in t])
+    return {r:sum([t.get(r,0.) for t in tims])/len(tims) for r in rs}
+
+if __name__ == "__main__":
+    if len(sys.argv)<2 or sys.argv[1] not in ['switch','keep','table','diff']:
+        sys.exit(__doc__)
+    if sys.argv[1]=='switch':
+        switch(int(sys.argv[2]),int(sys.argv[3]),[y if y=='production' else int(y) for y in sys.argv[4:]])
+        sys.exit(0)
+    if sys.argv[1]=='keep':
+        keep(int(sys.argv[2]),int(sys.argv[3]),sys.argv[4])
+        sys.exit(0)
+
+    run=sys.argv[2].rstrip('/') if len(sys.argv)>2 else '.'
+    tims=timed(run)
+    if tims==[]:
+        sys.exit('no timed years in '+run+'/'+TDIR+' (setupNEMO_ARC2.py main(...,timing=[...]))')
+
+    if sys.argv[1]=='table':
+        rs=sorted(set([r for y,p,t in tims for r in t]),key=lambda r:-max([t.get(r,0.) for y,p,t in tims]))
+        print('routine'.ljust(20)+''.join([(str(y)+' '+p[:4]).rjust(12) for y,p,t in tims])+'   (s/step)')
+        for r in rs:
+            print(r.ljust(20)+''.join([(str(round(t[r],4)) if r in t else '-').rjust(12) for y,p,t in tims]))
+    else:
+        spin=[t for y,p,t in tims if p in ['spinup','long']]
+        prod=[t for y,p,t in tims if p=='production']
+        if spin==[] or prod==[]:
+            sys.exit('need a timed spin up year and a timed production year to diff, have: '+' '.join([str(y)+'_'+p for y,p,t in tims]))
+        s,p=average(spin),average(prod)
+        print('routine'.ljust(20)+'spinup'.rjust(12)+'production'.rjust(12)+'extra'.rjust(12)+'   (s/step, '+str(len(spin))+' and '+str(len(prod))+' years)')
+        for r in sorted(set(s)|set(p),key=lambda r:-(p.get(r,0.)-s.get(r,0.))):
+            print(r.ljust(20)+(str(round(s[r],4)) if r in s else '-').rjust(12)+(str(round(p[r],4)) if r in p else '-').rjust(12)+\
+                  str(round(p.get(r,0.)-s.get(r,0.),4)).rjust(12))
+        print('')
+        ds=[d for d in sorted(glob.glob(run+'/'+TDIR+'[0-9]*_*/')) if d.rstrip('/').endswith(('_spinup','_long'))]
+        dp=[d for d in sorted(glob.glob(run+'/'+TDIR+'[0-9]*_production/'))]
+        a,b=settings(ds[0]),settings(dp[0])
+        print('namelist settings that differ ('+os.path.basename(ds[0][:-1])+' -> '+os.path.basename(dp[0][:-1])+', time step counters left out):')
+        for k in sorted(set(a)|set(b)):
+            if a.get(k)!=b.get(k) and k[1] not in ['nn_it000','nn_itend','nn_date0','nn_stock','ln_rstart','cn_ocerst_in','nn_rstctl']:
+                print('    '+k[0]+'/'+k[1]+': '+str(a.get(k,'-'))+' -> '+str(b.get(k,'-')))
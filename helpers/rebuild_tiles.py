@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+"""
+ Rebuild NEMO per processor (tile) files, e.g. mesh_mask_0000.nc ... mesh_mask_1023.nc, into one file (mesh_mask.nc)
+
+ python rebuild_tiles.py [-t nproc] [-d deflate] [-c chunksize] filebase ndomain
+
+ Drop-in for rebuild_nemo (same arguments and output, rP_RBUILD_NEMO in rPARAMS.py points here). The tiles are put together by a pool
+ of processes, each task being a few variables (or a range of levels of a big one) so only a handful of slabs of the global domain are
+ in memory at once, and the output is written straight to chunked netCDF4 (filebase.nc appears once it's complete). A chunk is a
+ level of the domain (or as CHUNKS says), cut down in y then x to at most chunksize bytes if -c is given.
+"""
+import os
+import time
+import argparse
+import concurrent.futures
+import contextlib as ctx
+import numpy as np
+import netCDF4
+
+#biggest slab (bytes) of the global domain a task puts together
+SLAB=64*1024**2
+#chunk shape of the output if not level by level, "x 257" a line for x, y and z (chunkNEMO.py writes it next to this script)
+CHUNKS=os.path.join(os.path.dirname(os.path.abspath(__file__)),'rebuild_tiles.chunks')
+
+def chunking(dims,shape,split,itemsize=4,csize=None):
+    """chunk sizes of an output variable, a whole level of the domain each (or as CHUNKS says) and a time record, halved along the
+    biggest of the tiled dimensions until they're at most csize bytes if csize is given"""
+    spec={}
+    if os.path.exists(CHUNKS):
+        with ctx.closing(open(CHUNKS,'r')) as handle:
+            spec=dict([(l.split()[0],int(l.split()[1])) for l in handle if len(l.split())==2])
+    out=[]
+    for d,n in zip(dims,shape):
+        if d in split:
+            out.append(min(spec.get(d,n),n))
+        elif d.startswith('depth') or d=='nav_lev':
+            out.append(min(spec.get('z',1),n))
+        else:
+            out.append(1)
+    while csize is not None and int(np.prod(out))*itemsize>csize:
+        i=max([i for i,d in enumerate(dims) if d in split],key=lambda i:out[i])
+        if out[i]==1:
+            break
+        out[i]=(out[i]+1)//2
+    return out
+
+def tileinfo(tiles):
+    """where the interior (no halo) of each tile goes in the global domain, from the DOMAIN_* attributes NEMO writes
+
+    :tiles: list of tile files
+    :returns: list of (tile, {dimension: local slice}, {dimension: global slice})
+    """
+    out=[]
+    for t in tiles:
+        with ctx.closing(netCDF4.Dataset(t)) as nc:
+            dnames=list(nc.dimensions)
+            dims=[dnames[i-1] for i in np.atleast_1d(nc.DOMAIN_dimensions_ids)]
+            loc,gbl={},{}
+            for d,f,l,hs,he in zip(dims,*[np.atleast_1d(nc.getncattr('DOMAIN_'+a)) for a in ['position_first','position_last','halo_size_start','halo_size_end']]):
+                n=len(nc.dimensions[d])
+                assert(n==l-f+1),t+": "+d+" is "+str(n)+" long but DOMAIN_position_first/last say "+str(f)+"-"+str(l)
+                loc[d]=slice(int(hs),int(n-he))
+                gbl[d]=slice(int(f-1+hs),int(l-he))
+        out.append((t,loc,gbl))
+    return out
+
+def rdslab(tasks,info):
+    """put together one task's worth of global slabs from all the tiles
+
+    :tasks: list of (variable, dimensions, global shape, split dimension, k0, k1, fill value, dtype)
+    :info: see tileinfo
+    :returns: list of (variable, k0, k1, slab)
+    """
+    slabs=[]
+    for v,dims,shape,sdim,k0,k1,fill,dtype in tasks:
+        shape=list(shape)
+        if sdim is not None:
+            shape[dims.index(sdim)]=k1-k0
+        slabs.append(np.full(shape,fill,dtype=dtype))
+    for t,loc,gbl in info:
+        with ctx.closing(netCDF4.Dataset(t)) as nc:
+            nc.set_auto_mask(False)
+            for (v,dims,shape,sdim,k0,k1,fill,dtype),slab in zip(tasks,slabs):
+                lidx=tuple([loc[d] if d in loc else (slice(k0,k1) if d==sdim else slice(None)) for d in dims])
+                gidx=tuple([gbl[d] if d in gbl else slice(None) for d in dims])
+                slab[gidx]=nc.variables[v][lidx]
+    return [(v,k0,k1,slab) for (v,dims,shape,sdim,k0,k1,fill,dtype),slab in zip(tasks,slabs)]
+
+def mktasks(nc,split,gsize):
+    """split the tiled variables of (tile) nc into tasks of at most SLAB bytes, big variables are split along the dimension before y
+
+    :nc: open tile
+    :split: names of the tiled dimensions
+    :gsize: {dimension: global size}
+    """
+    tasks,cur,cursize=[],[],0
+    for v in nc.variables.values():
+        if not [d for d in v.dimensions if d in split]:
+            continue
+        shape=[gsize.get(d,len(nc.dimensions[d])) for d in v.dimensions]
+        fill=v._FillValue if '_FillValue' in v.ncattrs() else 0
+        size=int(np.prod(shape))*v.dtype.itemsize
+        sdim=v.dimensions[-3] if len(v.dimensions)>=3 else None
+        if size<=SLAB or sdim is None:
+            parts=[(None,0,0)]
+        else:
+            nk=shape[-3]
+            step=max(1,int(nk*SLAB//size))
+            parts=[(sdim,k,min(k+step,nk)) for k in range(0,nk,step)]
+        for sd,k0,k1 in parts:
+            psize=size if sd is None else size*(k1-k0)//shape[-3]
+            if cur!=[] and cursize+psize>SLAB:
+                tasks.append(cur)
+                cur,cursize=[],0
+            cur.append((v.name,v.dimensions,shape,sd,k0,k1,fill,v.dtype.str))
+            cursize+=psize
+    if cur!=[]:
+        tasks.append(cur)
+    return tasks
+
+def rebuild(base,ndomain,nproc=None,deflate=0,csize=None):
+    """rebuild base_0000.nc ... into base.nc
+
+    :base: file base (as for rebuild_nemo), e.g. mesh_mask or asf_c73_00008_04161000_restart
+    :ndomain: number of tiles, missing ones (land suppressed) are filled with the variables' _FillValue (or 0)
+    :nproc: number of processes (default: the cpus we've been given, up to 32)
+    :deflate: netCDF4 compression level of the output (0 for none)
+    :csize: biggest chunk of the output (bytes), None for a whole level
+    :returns: output file
+    """
+    t0=time.time()
+    if nproc is None:
+        nproc=min(len(os.sched_getaffinity(0)),32)
+    tiles=[base+'_'+str(n).zfill(4)+'.nc' for n in range(ndomain)]
+    tiles=[t for t in tiles if os.path.exists(t)]
+    assert(tiles!=[]),"no tiles "+base+"_NNNN.nc found"
+    if len(tiles)<ndomain:
+        print("WARNING: only "+str(len(tiles))+" of "+str(ndomain)+" tiles of "+base+", the missing ones will be filled in")
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=nproc) as pool:
+        #reading the attributes of a thousand files is worth sharing out too
+        chunks=[tiles[i::nproc] for i in range(nproc)]
+        info=dict([(i[0],i) for part in pool.map(tileinfo,chunks) for i in part])
+        info=[info[t] for t in tiles]
+
+        ofile=base+'.nc'
+        tmp=ofile+'.tmp'
+        with ctx.closing(netCDF4.Dataset(tiles[0])) as nc, ctx.closing(netCDF4.Dataset(tmp,'w',format='NETCDF4')) as out:
+            dnames=list(nc.dimensions)
+            split=[dnames[i-1] for i in np.atleast_1d(nc.DOMAIN_dimensions_ids)]
+            gsize=dict(zip(split,[int(s) for s in np.atleast_1d(nc.DOMAIN_size_global)]))
+            out.setncatts({a:nc.getncattr(a) for a in nc.ncattrs() if not a.startswith('DOMAIN_')})
+            for d in nc.dimensions.values():
+                out.createDimension(d.name,None if d.isunlimited() else gsize.get(d.name,len(d)))
+            for v in nc.variables.values():
+                kw={}
+                if [d for d in v.dimensions if d in split]:
+                    kw['chunksizes']=chunking(v.dimensions,[gsize.get(d,len(nc.dimensions[d])) for d in v.dimensions],split,v.dtype.itemsize,csize)
+                    if deflate>0:
+                        kw.update(zlib=True,complevel=deflate)
+                ov=out.createVariable(v.name,v.dtype,v.dimensions,fill_value=v._FillValue if '_FillValue' in v.ncattrs() else None,**kw)
+                ov.setncatts({a:v.getncattr(a) for a in v.ncattrs() if a!='_FillValue'})
+                ov.set_auto_mask(False)
+                if not [d for d in v.dimensions if d in split]:
+                    #not tiled (time, levels, scalars like kt), same in all the tiles
+                    v.set_auto_mask(False)
+                    ov[tuple([slice(0,n) for n in v.shape])]=v[...]
+            tasks=mktasks(nc,split,gsize)
+
+            #only keep a few tasks' worth of slabs on the go
+            jobs=set()
+            todo=list(tasks)
+            while todo!=[] or jobs:
+                while todo!=[] and len(jobs)<nproc+2:
+                    jobs.add(pool.submit(rdslab,todo.pop(0),info))
+                done,jobs=concurrent.futures.wait(jobs,return_when=concurrent.futures.FIRST_COMPLETED)
+                for job in done:
+                    for v,k0,k1,slab in job.result():
+                        #explicit extents as the unlimited (time) dimension starts off empty
+                        idx=[slice(0,n) for n in slab.shape]
+                        if k1>k0:
+                            idx[-3]=slice(k0,k1)
+                        out.variables[v][tuple(idx)]=slab
+    os.rename(tmp,ofile)
+    print("rebuilt "+ofile+" from "+str(len(tiles))+" tiles ("+str(sum([len(t) for t in tasks]))+" pieces of variables) in "+str(round(time.time()-t0,1))+"s on "+str(nproc)+" processes")
+    return ofile
+
+if __name__ == "__main__":
+    parser=argparse.ArgumentParser(description='rebuild NEMO tile files (filebase_NNNN.nc) into filebase.nc, takes the same arguments as rebuild_nemo')
+    parser.add_argument('-t',type=int,default=None,help='number of processes (rebuild_nemo: threads)')
+    parser.add_argument('-d',type=int,default=0,help='deflation level of the output')
+    parser.add_argument('-c',type=int,default=None,help='chunksize (bytes), the most a chunk of the output holds (default: a level, or see chunkNEMO.py)')
+    parser.add_argument('filebase')
+    parser.add_argument('ndomain',type=int)
+    args,rest=parser.parse_known_args()
+    if rest!=[]:
+        print("WARNING: ignoring rebuild_nemo options "+' '.join(rest))
+    rebuild(args.filebase,args.ndomain,nproc=args.t,deflate=args.d,csize=args.c)
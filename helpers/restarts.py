@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+"""
+ Keep track of a run's restarts (OUTNEMO_NNNN/restarts/<exp>_<kt>_restart.nc) and keep them small
+
+ python restarts.py tidy [RUNDIR]          - (the job scripts, in the background after each postNEMO.py) add the new restarts to the
+                                             index and deflate all but the newest KEEP of them
+ python restarts.py path YEAR [RUNDIR]     - the restart written at the end of year YEAR (what year YEAR+1 starts from)
+ python restarts.py status [RUNDIR]        - what's in the index and what it takes up, or python restarts.py status rfiles/runme
+ python restarts.py rebuild [RUNDIR]       - make the index again from what's on disk (the only thing that lists the OUTNEMO_* folders)
+ python restarts.py thin N [RUNDIR]        - DELETE the deflated restarts except every Nth year, the end of the spin up and the newest KEEP
+
+ Deflating is lossless netCDF4 compression (zlib with shuffle) of the file in place, so nemo.exe reads a deflated restart as it is
+ and a run can go back to any year without unpacking anything. A deflated copy is checked against the original before it replaces it.
+ The index (restarts.idx in the run folder) is a fixed width record a year, "year kt state bytes path", so finding a year's restart
+ is a seek to (year-1)*REC (lookup). cflNEMO.py prep and equilNEMO.py check find restarts that way (find, newest), falling back to
+ where a restart would be for the year or two tidy hasn't got to yet; preNEMO.py still picks its own.
+ tidy only ever looks at the path the next year's restart will be at (year N's is written at step N*(steps a year)).
+"""
+import sys,os
+import re
+import glob
+import fcntl
+import contextlib as ctx
+import numpy as np
+import f90nml
+
+#restarts left as nemo.exe wrote them (the next launch reads the newest)
+KEEP=2
+#zlib level, 1 gets most of what there is to get (land, the zeros of the walled shelves) for a lot less time than 9
+COMPLEVEL=1
+#bytes per index record
+REC=160
+IDX='restarts.idx'
+#years in the production phase (goNEMOproduction.sh: SYEARS=rP_YEAR_MAX-9)
+NPROD=10
+#an xios output, <exp>_<freq>_<start>_<end>_<name>.nc
+OUT=re.compile(r'^.*_(\d+[a-z]+)_\d{8}_\d{8}_(.*)\.nc$')
+
+def rparams(run):
+    """{name: value (a string)} of the rP_ settings in rPARAMS.py of run folder run"""
+    with ctx.closing(open(run+'/rPARAMS.py','r')) as handle:
+        return dict(re.findall(r"^(rP_\w+)='(.*)'",handle.read(),re.M))
+
+def params(run):
+    """(experiment name, time steps a year, rP_YEAR_MAX) of run folder run"""
+    prm=rparams(run)
+    rdt=f90nml.read(run+'/namelist_cfg')['namdom']['rn_rdt']
+    return os.path.basename(os.path.abspath(run)),int(int(prm['rP_NDAYS'])*86400//rdt),int(prm['rP_YEAR_MAX'])
+
+def outputs(run,year):
+    """{key: file} of the xios outputs of year (in OUTNEMO_NNNN/ of run folder run, where postNEMO.py puts them)"""
+    out={}
+    for f in sorted(glob.glob(run+'/OUTNEMO_'+str(year).zfill(4)+'/*_[0-9]*_[0-9]*_*.nc')):
+        m=OUT.match(os.path.basename(f))
+        if m is not None:
+            out[m.group(1)+'_'+m.group(2)]=f
+    return out
+
+def prodstart(run,ymax):
+    """first production year of run: production.start (goNEMOproduction.sh with an early switch, see equilNEMO.py) or rP_YEAR_MAX-9"""
+    if os.path.exists(run+'/production.start'):
+        with ctx.closing(open(run+'/production.start','r')) as handle:
+            return int(handle.read().split()[0])
+    return ymax-NPROD+1
+
+def rstpath(exp,year,ns):
+    """where (relative to the run folder) the restart written at the end of year is"""
+    return 'OUTNEMO_'+str(year).zfill(4)+'/restarts/'+exp+'_'+str(year*ns).zfill(8)+'_restart.nc'
+
+def lookup(run,year):
+    """(kt, state, bytes, absolute path) of the restart written at the end of year, None if it isn't in the index"""
+    if not os.path.exists(run+'/'+IDX) or year<1:
+        return None
+    with ctx.closing(open(run+'/'+IDX,'rb')) as handle:
+        handle.seek((year-1)*REC)
+        w=handle.read(REC).decode().split()
+    if len(w)!=5 or int(w[0])!=year:
+        return None
+    return int(w[1]),w[2],int(w[3]),os.path.join(os.path.abspath(run),w[4])
+
+def find(run,year,exp,ns):
+    """absolute path of the restart written at the end of year, from the index or where it would be if it isn't in it yet (None if it isn't there)"""
+    rst=lookup(run,year)
+    if rst is not None:
+        return rst[3] if rst[1] in ['hot','deflated'] else None
+    f=os.path.join(os.path.abspath(run),rstpath(exp,year,ns))
+    return f if os.path.exists(f) else None
+
+def newest(run):
+    """(year, absolute path) of the newest restart of run folder run, None if it hasn't got one"""
+    exp,ns,ymax=params(run)
+    year=os.path.getsize(run+'/'+IDX)//REC if os.path.exists(run+'/'+IDX) else 0
+    #tidy runs after postNEMO.py, so the index can be a year or two behind
+    while year<ymax and os.path.exists(run+'/'+rstpath(exp,year+1,ns)):
+        year+=1
+    while year>0 and find(run,year,exp,ns) is None:
+        year-=1
+    return (year,find(run,year,exp,ns)) if year>0 else None
+
+def record(run,year,kt,state,size,path):
+    """write year's record of the index"""
+    rec=(str(year).rjust(6)+' '+str(kt).rjust(10)+' '+state.ljust(8)+' '+str(size).rjust(14)+' '+path)
+    assert(len(rec)<REC),"restart path too long for the index: "+path
+    mode='r+b' if os.path.exists(run+'/'+IDX) else 'w+b'
+    with ctx.closing(open(run+'/'+IDX,mode)) as handle:
+        handle.seek(0,2)
+        if handle.tell()<(year-1)*REC:
+            #blank records for the years that aren't there
+            handle.write(((' '*(REC-1))+'\n').encode()*((year-1)-handle.tell()//REC))
+        handle.seek((year-1)*REC)
+        handle.write((rec.ljust(REC-1)+'\n').encode())
+
+def records(run):
+    """all the records of the index, as a list of (year, kt, state, bytes, path)"""
+    out=[]
+    if os.path.exists(run+'/'+IDX):
+        with ctx.closing(open(run+'/'+IDX,'r')) as handle:
+            for l in handle:
+                w=l.split()
+                if len(w)==5:
+                    out.append((int(w[0]),int(w[1]),w[2],int(w[3]),w[4]))
+    return out
+
+def deflated(f):
+    """True if netCDF file f is netCDF4 with its variables already compressed"""
+    import netCDF4
+    with ctx.closing(netCDF4.Dataset(f)) as nc:
+        if not nc.data_model.startswith('NETCDF4'):
+            return False
+        return all([v.filters().get('zlib',False) for v in nc.variables.values() if v.ndim>0])
+
+def deflate(f):
+    """compress restart f in place (lossless), returns its new size"""
+    import netCDF4
+    tmp=f[:-3]+'.deflate.nc'
+    with ctx.closing(netCDF4.Dataset(f)) as src, ctx.closing(netCDF4.Dataset(tmp,'w',format='NETCDF4')) as dst:
+        src.set_auto_maskandscale(False)
+        dst.setncatts({a:src.getncattr(a) for a in src.ncattrs()})
+        for d in src.dimensions.values():
+            dst.createDimension(d.name,None if d.isunlimited() else len(d))
+        for v in src.variables.values():
+            fill=v.getncattr('_FillValue') if '_FillValue' in v.ncattrs() else None
+            o=dst.createVariable(v.name,v.dtype,v.dimensions,zlib=v.ndim>0,complevel=COMPLEVEL,shuffle=True,fill_value=fill)
+            o.setncatts({a:v.getncattr(a) for a in v.ncattrs() if a!='_FillValue'})
+            o.set_auto_maskandscale(False)
+            o[...]=v[...]
+    #a restart we can't start from is worse than a big one
+    with ctx.closing(netCDF4.Dataset(f)) as a, ctx.closing(netCDF4.Dataset(tmp)) as b:
+        a.set_auto_maskandscale(False)
+        b.set_auto_maskandscale(False)
+        for v in a.variables:
+            if not np.array_equal(a.variables[v][...],b.variables[v][...],equal_nan=a.variables[v].dtype.kind=='f'):
+                os.remove(tmp)
+                raise ValueError("deflated "+f+" doesn't match the original ("+v+"), left it alone")
+    os.rename(tmp,f)
+    return os.path.getsize(f)
+
+@ctx.contextmanager
+def locked(run,wait=False):
+    """hold the run's index lock (yields False if someone else has it and wait is False)"""
+    with ctx.closing(open(run+'/'+IDX+'.lock','w')) as handle:
+        try:
+            fcntl.flock(handle,fcntl.LOCK_EX if wait else fcntl.LOCK_EX|fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        yield True
+
+def tidy(run):
+    """add the restarts written since the last tidy to the index, then deflate all but the newest KEEP"""
+    with locked(run) as ok:
+        if not ok:
+            print('restarts.py: another tidy of '+run+' is running')
+            return
+        exp,ns,ymax=params(run)
+        recs=records(run)
+        year=(max([r[0] for r in recs]) if recs!=[] else 0)+1
+        while year<=ymax and os.path.exists(run+'/'+rstpath(exp,year,ns)):
+            record(run,year,year*ns,'hot',os.path.getsize(run+'/'+rstpath(exp,year,ns)),rstpath(exp,year,ns))
+            year+=1
+        recs=[r for r in records(run) if r[2]=='hot']
+        for y,kt,state,size,path in recs[:-KEEP] if KEEP>0 else recs:
+            if not os.path.exists(run+'/'+path):
+                record(run,y,kt,'missing',0,path)
+                continue
+            new=os.path.getsize(run+'/'+path) if deflated(run+'/'+path) else deflate(run+'/'+path)
+            record(run,y,kt,'deflated',new,path)
+            print('restarts.py: '+path+' '+str(size//2**20)+' -> '+str(new//2**20)+' MB')
+
+def rebuild(run):
+    """make the index again from the restarts on disk"""
+    with locked(run,wait=True):
+        exp,ns,ymax=params(run)
+        if os.path.exists(run+'/'+IDX):
+            os.remove(run+'/'+IDX)
+        for y in range(1,ymax+1):
+            path=rstpath(exp,y,ns)
+            if os.path.exists(run+'/'+path):
+                record(run,y,y*ns,'deflated' if deflated(run+'/'+path) else 'hot',os.path.getsize(run+'/'+path),path)
+
+def thin(run,every):
+    """delete the deflated restarts except every every'th year, the last spin up year and the newest KEEP"""
+    with locked(run,wait=True):
+        exp,ns,ymax=params(run)
+        recs=records(run)
+        keep=set([r[0] for r in recs[-KEEP:]]+[prodstart(run,ymax)-1])
+        for y,kt,state,size,path in recs:
+            if state=='deflated' and y%every!=0 and y not in keep:
+                #(someone may have got there first)
+                if os.path.exists(run+'/'+path):
+                    os.remove(run+'/'+path)
+                record(run,y,kt,'deleted',0,path)
+                print('restarts.py: deleted '+path)
+
+def status(run):
+    """print a summary of the index of run, returns bytes on disk"""
+    recs=records(run)
+    print(os.path.basename(os.path.abspath(run)))
+    for state in ['hot','deflated','deleted','missing']:
+        sel=[r for r in recs if r[2]==state]
+        if sel!=[]:
+            print('    '+state.ljust(9)+str(len(sel)).rjust(4)+' years '+str(round(sum([r[3] for r in sel])/2.**30,1)).rjust(8)+' GB  ('+\
+                  ' '.join([str(y) for y in [sel[0][0],sel[-1][0]]])+')')
+    hot=[r[3] for r in recs if r[2]=='hot']
+    dfl=[r[3] for r in recs if r[2]=='deflated']
+    if hot!=[] and dfl!=[]:
+        print('    a deflated restart is '+str(round(100*np.mean(dfl)/np.mean(hot)))+'% of a hot one')
+    return sum([r[3] for r in recs])
+
+if __name__ == "__main__":
+    if len(sys.argv)<2 or sys.argv[1] not in ['tidy','path','status','rebuild','thin']:
+        sys.exit(__doc__)
+    cmd=sys.argv[1]
+    if cmd in ['path','thin']:
+        n=int(sys.argv[2])
+        run=sys.argv[3].rstrip('/') if len(sys.argv)>3 else '.'
+    else:
+        run=sys.argv[2].rstrip('/') if len(sys.argv)>2 else '.'
+    if cmd=='tidy':
+        tidy(run)
+    elif cmd=='path':
+        rst=lookup(run,n)
+        if rst is None:
+            sys.exit('no restart for the end of year '+str(n)+' in '+run+'/'+IDX)
+        print(rst[3])
+    elif cmd=='rebuild':
+        rebuild(run)
+        status(run)
+    elif cmd=='thin':
+        thin(run,n)
+        status(run)
+    elif os.path.isfile(run):
+        #rfiles/runme: rP_YEAR_MAX then a run folder a line
+        with ctx.closing(open(run,'r')) as handle:
+            runs=[l.strip().rstrip('/') for l in handle if l.strip()!=''][1:]
+        print(str(len(runs))+' runs, '+str(round(sum([status(r) for r in runs])/2.**30,1))+' GB of restarts')
+    else:
+        status(run)
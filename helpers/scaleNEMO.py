@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+ Read the strong scaling suite (goNEMOscaling.sh, see mkscaling in setupNEMO_ARC2.py) and pick a core count
+
+ python scaleNEMO.py [sypd]   - (in the run folder) time per step at each core count of scaling/ladder, a fitted scaling curve and the
+                                cheapest number of nodes that still does sypd simulated years per day (default TARGET)
+
+ Each rung of the ladder ran nemo.exe for a fixed number of steps and logged time.step against the clock (scaling/NNNN/steps.log),
+ the time per step is the slope of that once the run got going (so the initialisation isn't counted), failing that the job's
+ start/end (scaling/NNNN/t.start, t.end). The curve is t(n) = a + b/n + c log2(n) (serial part, the part that scales and the
+ communication that grows with the number of ranks n). A rung ran on the ranks in scaling/NNNN/decomp.ranks if it's there (the job
+ decomposes the domain_cfg.nc it reads again), those of the ladder otherwise.
+"""
+import sys,os
+import contextlib as ctx
+import numpy as np
+import f90nml
+
+#cores per ARCHER2 node
+CORES=128
+#simulated years per day we'd like (100 years in about 3 weeks)
+TARGET=5.
+
+def steptime(d):
+    """seconds per time step of the scaling run in folder d (nan if it didn't get anywhere)"""
+    if os.path.exists(d+'/steps.log'):
+        with ctx.closing(open(d+'/steps.log','r')) as handle:
+            log=[l.split() for l in handle]
+        log=np.array([[float(l[0]),float(l[1])] for l in log if len(l)==2])
+        if len(log)>0:
+            #skip the first 10% of the steps (initialisation, first xios writes)
+            log=log[log[:,1]>=0.1*log[:,1].max()]
+            if len(log)>=3 and np.ptp(log[:,1])>0:
+                return np.polyfit(log[:,1],log[:,0],1)[0]
+    if os.path.exists(d+'/t.start') and os.path.exists(d+'/t.end') and os.path.exists(d+'/time.step'):
+        t=[]
+        for f in ['t.start','t.end','time.step']:
+            with ctx.closing(open(d+'/'+f,'r')) as handle:
+                t.append(float(handle.read().split()[0]))
+        if t[2]>0:
+            return (t[1]-t[0])/t[2]
+    return np.nan
+
+def rungranks(d,ranks):
+    """ranks the scaling run in folder d ran on (decompNEMO.py fix), ranks (the ladder's) if it didn't say"""
+    if os.path.exists(d+'/decomp.ranks'):
+        with ctx.closing(open(d+'/decomp.ranks','r')) as handle:
+            return int(handle.read().split()[0])
+    return ranks
+
+def fit(ranks,tstep):
+    """least squares fit of the scaling curve, returns a function of the number of ranks"""
+    ranks,tstep=np.array(ranks,float),np.array(tstep,float)
+    basis=lambda n:[np.ones_like(n),1./n,np.log2(n)][:3 if len(ranks)>=3 else 2]
+    coef=np.linalg.lstsq(np.array(basis(ranks)).T,tstep,rcond=None)[0]
+    return lambda n:np.maximum(np.dot(coef,basis(np.array(n,float))),1e-6)
+
+def nstep():
+    """time steps per model year (namelist_cfg and rP_NDAYS from rPARAMS.py in the run folder)"""
+    sys.path.insert(0,os.getcwd())
+    from rPARAMS import rP_NDAYS
+    return int(rP_NDAYS)*86400/f90nml.read('namelist_cfg')['namdom']['rn_rdt']
+
+if __name__ == "__main__":
+    target=float(sys.argv[1]) if len(sys.argv)>1 else TARGET
+    ns=nstep()
+    with ctx.closing(open('scaling/ladder','r')) as handle:
+        ladder=[[int(v) for v in l.split()] for l in handle if l.strip()!='' and not l.startswith('#')]
+
+    print('  cores  ranks  nodes  jpni x jpnj   s/step    sypd  nodeh/year  efficiency')
+    done=[]
+    for cores,ranks,nodes,jpni,jpnj in ladder:
+        t=steptime('scaling/'+str(cores).zfill(4))
+        ranks=rungranks('scaling/'+str(cores).zfill(4),ranks)
+        if not np.isnan(t):
+            done.append((cores,ranks,nodes,t))
+        eff='' if done==[] or np.isnan(t) else str(round(done[0][3]*done[0][1]/(t*ranks),2)).rjust(12)
+        print(str(cores).rjust(7)+str(ranks).rjust(7)+str(nodes).rjust(7)+str(jpni).rjust(6)+' x '+str(jpnj).ljust(4)+\
+              ('     not run/no steps' if np.isnan(t) else str(round(t,4)).rjust(9)+str(round(86400/(t*ns),2)).rjust(8)+str(round(nodes*t*ns/3600,1)).rjust(12))+eff)
+    if len(done)<2:
+        sys.exit('need at least 2 rungs of the ladder to have run to fit a scaling curve')
+
+    curve=fit([d[1] for d in done],[d[3] for d in done])
+    print('')
+    print('fitted curve (ranks = nodes x '+str(CORES)+', land suppression will take a few off):')
+    best=None
+    for nodes in range(1,max([d[2] for d in done])+1):
+        t=float(curve(nodes*CORES))
+        sypd,cost=86400/(t*ns),nodes*t*ns/3600
+        ok=sypd>=target
+        if ok and (best is None or cost<best[2]):
+            best=(nodes,sypd,cost)
+        print(str(nodes).rjust(7)+' nodes '+str(round(t,4)).rjust(9)+' s/step '+str(round(sypd,2)).rjust(8)+' sypd '+str(round(cost,1)).rjust(8)+' nodeh/year'+('' if ok else '  (too slow)'))
+    print('')
+    if best is None:
+        print('E R R O R: none of the node counts tried make '+str(target)+' simulated years per day, try a longer ladder')
+        sys.exit(1)
+    print('cheapest that makes '+str(target)+' sypd: '+str(best[0])+' nodes ('+str(best[0]*CORES)+' cores), '+\
+          str(round(best[1],2))+' sypd at '+str(round(best[2],1))+' node hours a model year')
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+"""
+ Spin up time series and production means of a run, kept up to date a year at a time rather than worked out once the run is over
+
+ python streamNEMO.py fold YEAR [RUNDIR]  - (the job scripts, in the background after each postNEMO.py) fold the outputs of YEAR, and
+                                            any earlier year that got missed, into the series and (production years) the running sums
+ python streamNEMO.py finalize [RUNDIR]   - write <exp>_series_<key>.nc and <exp>_prodmean_<key>.nc in RUNDIR/stream/ from what's
+                                            been folded so far (fine mid-run, the attributes say which years are in it)
+ python streamNEMO.py status [RUNDIR]     - which years are in, or python streamNEMO.py status rfiles/runme
+
+ key is the output frequency and file kind, e.g. 1m_grid_T for <exp>_1m_00940101_00941231_grid_T.nc in OUTNEMO_0094/.
+ The series is the domain mean of every variable at every output time, volume (or area, for 2D fields) weighted with mesh_mask.nc
+ when the run folder has one, a plain mean of the unmasked points otherwise. The production means are what ncra gives over the last
+ NPROD years (goNEMOproduction.sh: SYEARS=rP_YEAR_MAX-9, or production.start): the running sums are float64 and, as with ncra, a point
+ is divided by the number of records it had a value in (<var>_nrec next to the sum), so land (no records) stays _FillValue.
+
+ A year's series goes in stream/series/NNNN.json and the sums in stream/sum_<key>.nc with the years that are in them as an
+ attribute, both written to a temporary file and renamed, so a fold that's killed part way leaves nothing half done and the next
+ fold just does that year again.
+"""
+import sys,os
+import json
+import glob
+import fcntl
+import contextlib as ctx
+import numpy as np
+from restarts import rparams,outputs,prodstart,NPROD
+
+SDIR='stream'
+#suffix of the per point record counts that go with the sums
+NSUF='_nrec'
+
+def timed(nc):
+    """variables of nc worth averaging: floats with a time_counter record"""
+    return [v for v in nc.variables.values() if v.ndim>0 and v.dimensions[0].startswith('time') and v.dtype.kind=='f'\
+            and not v.name.startswith('time') and not v.name.endswith('_bounds')]
+
+@ctx.contextmanager
+def locked(run):
+    """hold the run's stream lock (folds of consecutive years queue up behind each other)"""
+    with ctx.closing(open(run+'/'+SDIR+'/lock','w')) as handle:
+        fcntl.flock(handle,fcntl.LOCK_EX)
+        yield
+
+class Weights(object):
+    """cell volumes/areas (0 on land) from mesh_mask.nc for the grid of each output kind, None when there's no mesh_mask.nc"""
+    def __init__(self,run):
+        self.mesh=run+'/mesh_mask.nc' if os.path.exists(run+'/mesh_mask.nc') else None
+        self.cache={}
+
+    def get(self,key,shape):
+        """weights for a field of shape (z,y,x) or (y,x) of output key (grid_U is on u points, icemod/SBC etc on t points)"""
+        g=key.split('_')[-1].lower() if '_grid_' in key else 't'
+        if self.mesh is None or g not in 'tuvw' or len(shape)<2:
+            return None
+        if (g,shape) not in self.cache:
+            import netCDF4
+            with ctx.closing(netCDF4.Dataset(self.mesh)) as nc:
+                h='t' if g=='w' else g
+                a=np.squeeze(nc.variables['e1'+h][...]*nc.variables['e2'+h][...]).astype(np.float64)
+                msk=np.squeeze(nc.variables[h+'mask'][...]).astype(np.float64)
+                e3=np.squeeze(nc.variables['e3'+g+'_0'][...]).astype(np.float64) if 'e3'+g+'_0' in nc.variables else None
+            w=None
+            if len(shape)==2 and a.shape==shape:
+                w=a*msk[0]
+            elif len(shape)==3 and e3 is not None and msk.shape==shape:
+                w=a[np.newaxis]*e3*msk
+            self.cache[(g,shape)]=w
+        return self.cache[(g,shape)]
+
+def mean(a,w):
+    """(weighted) mean of the unmasked points of a"""
+    a=np.ma.masked_invalid(a)
+    if w is None:
+        return float(a.mean()) if a.count()>0 else None
+    w=np.ma.array(w,mask=np.ma.getmaskarray(a))
+    s=w.sum()
+    return float((a*w).sum()/s) if s else None
+
+def series(files,wts):
+    """{key: {'time', 'units', 'vars': {var: domain means}}} of one year's outputs"""
+    import netCDF4
+    out={}
+    for key,f in sorted(files.items()):
+        with ctx.closing(netCDF4.Dataset(f)) as nc:
+            t=nc.variables['time_counter'] if 'time_counter' in nc.variables else None
+            o={'time':[float(x) for x in t[:]] if t is not None else [],'units':{},'vars':{}}
+            if t is not None:
+                o['units'][t.name]=getattr(t,'units','')
+            for v in timed(nc):
+                o['units'][v.name]=getattr(v,'units','')
+                o['vars'][v.name]=[mean(v[k],wts.get(key,v.shape[1:])) for k in range(v.shape[0])]
+        out[key]=o
+    return out
+
+def foldsum(sfile,f,year):
+    """add the records of output f to the running sums (and counts of records with a value) in sfile (made from f if it isn't there),
+    False if f has nothing to sum"""
+    import netCDF4
+    with ctx.closing(netCDF4.Dataset(f)) as src:
+        if timed(src)==[]:
+            return False
+    tmp=sfile[:-3]+'.tmp.nc'
+    old=netCDF4.Dataset(sfile) if os.path.exists(sfile) else None
+    with ctx.closing(netCDF4.Dataset(f)) as src, ctx.closing(netCDF4.Dataset(tmp,'w',format='NETCDF4')) as dst:
+        vs=timed(src)
+        for d in sorted(set([d for v in vs for d in v.dimensions[1:]])):
+            dst.createDimension(d,len(src.dimensions[d]))
+        years=(old.getncattr('years').split() if old is not None else [])+[str(year)]
+        nrec=(int(old.getncattr('nrec')) if old is not None else 0)+len(src.dimensions[vs[0].dimensions[0]])
+        dst.setncatts({'source':os.path.basename(f),'years':' '.join(years),'nrec':nrec})
+        for v in vs:
+            o=dst.createVariable(v.name,np.float64,v.dimensions[1:],zlib=True,complevel=1,fill_value=netCDF4.default_fillvals['f8'])
+            o.setncatts({a:v.getncattr(a) for a in v.ncattrs() if a not in ['_FillValue','missing_value']})
+            c=dst.createVariable(v.name+NSUF,np.int32,v.dimensions[1:],zlib=True,complevel=1)
+            c.long_name='records summed into '+v.name
+            s=np.zeros(v.shape[1:],np.float64)
+            n=np.zeros(v.shape[1:],np.int32)
+            for k in range(v.shape[0]):
+                a=np.ma.masked_invalid(v[k])
+                s+=a.filled(0)
+                n+=~np.ma.getmaskarray(a)
+            if old is not None and v.name in old.variables:
+                s+=np.ma.filled(old.variables[v.name][...],0)
+                n+=np.ma.filled(old.variables[v.name+NSUF][...],0)
+            o[...]=np.ma.array(s,mask=n==0)
+            c[...]=n
+    if old is not None:
+        old.close()
+    os.rename(tmp,sfile)
+    return True
+
+def folded(run):
+    """years with a series in stream/series/"""
+    return sorted([int(os.path.basename(f)[:-5]) for f in glob.glob(run+'/'+SDIR+'/series/[0-9]*.json')])
+
+def summed(run,key):
+    """years in the running sums of output key"""
+    import netCDF4
+    if not os.path.exists(run+'/'+SDIR+'/sum_'+key+'.nc'):
+        return []
+    with ctx.closing(netCDF4.Dataset(run+'/'+SDIR+'/sum_'+key+'.nc')) as nc:
+        return [int(y) for y in nc.getncattr('years').split()]
+
+def fold(run,year):
+    """fold year, and the years before it that are missing, into the series and (production years) the sums"""
+    exp,ymax=os.path.basename(os.path.abspath(run)),int(rparams(run)['rP_YEAR_MAX'])
+    if not os.path.exists(run+'/'+SDIR+'/series'):
+        os.makedirs(run+'/'+SDIR+'/series')
+    wts=Weights(run)
+    with locked(run):
+        done=set(folded(run))
+        for y in range(1,year+1):
+            files=outputs(run,y)
+            if files=={}:
+                continue
+            if y not in done:
+                tmp=run+'/'+SDIR+'/series/'+str(y).zfill(4)+'.json.tmp'
+                with ctx.closing(open(tmp,'w')) as handle:
+                    json.dump(series(files,wts),handle)
+                os.rename(tmp,tmp[:-4])
+                print('streamNEMO.py: '+exp+' year '+str(y)+' series ('+' '.join(sorted(files))+')')
+            if prodstart(run,ymax)<=y<prodstart(run,ymax)+NPROD:
+                for key,f in sorted(files.items()):
+                    if y not in summed(run,key):
+                        if foldsum(run+'/'+SDIR+'/sum_'+key+'.nc',f,y):
+                            print('streamNEMO.py: '+exp+' year '+str(y)+' into the '+key+' production sums')
+
+def finalize(run):
+    """write the series and production means of what's been folded, returns the files written"""
+    import netCDF4
+    exp,ymax=os.path.basename(os.path.abspath(run)),int(rparams(run)['rP_YEAR_MAX'])
+    years=folded(run)
+    assert(years!=[]),"nothing folded in "+run+'/'+SDIR+' yet (python streamNEMO.py fold YEAR)'
+    yrs={}
+    for y in years:
+        with ctx.closing(open(run+'/'+SDIR+'/series/'+str(y).zfill(4)+'.json','r')) as handle:
+            yrs[y]=json.load(handle)
+    out=[]
+    for key in sorted(set([k for y in years for k in yrs[y]])):
+        ys=[y for y in years if key in yrs[y]]
+        names=sorted(set([v for y in ys for v in yrs[y][key]['vars']]))
+        #records a year
+        n=[max([len(yrs[y][key]['time'])]+[len(x) for x in yrs[y][key]['vars'].values()]) for y in ys]
+        f=run+'/'+SDIR+'/'+exp+'_series_'+key+'.nc'
+        with ctx.closing(netCDF4.Dataset(f[:-3]+'.tmp.nc','w',format='NETCDF4')) as nc:
+            nc.setncatts({'title':exp+' '+key+' domain means','years':' '.join([str(y) for y in ys]),
+                          'weights':'mesh_mask.nc cell volumes/areas' if os.path.exists(run+'/mesh_mask.nc') else 'none (unmasked points)'})
+            nc.createDimension('time_counter',None)
+            t=nc.createVariable('time_counter',np.float64,('time_counter',))
+            t.units=[yrs[y][key]['units'].get('time_counter','') for y in ys][-1]
+            t[:]=np.concatenate([np.array(yrs[y][key]['time'],np.float64) if yrs[y][key]['time']!=[] else np.full(k,np.nan) for y,k in zip(ys,n)])
+            yv=nc.createVariable('year',np.int32,('time_counter',))
+            yv[:]=np.concatenate([np.full(k,y,np.int32) for y,k in zip(ys,n)])
+            for v in names:
+                o=nc.createVariable(v,np.float64,('time_counter',),fill_value=netCDF4.default_fillvals['f8'])
+                o.units=[yrs[y][key]['units'].get(v,'') for y in ys][-1]
+                o[:]=np.ma.masked_invalid(np.concatenate([np.array([np.nan if x is None else x for x in yrs[y][key]['vars'].get(v,[None]*k)],np.float64)\
+                                                          for y,k in zip(ys,n)]))
+        os.rename(f[:-3]+'.tmp.nc',f)
+        out.append(f)
+    for sfile in sorted(glob.glob(run+'/'+SDIR+'/sum_*.nc')):
+        key=os.path.basename(sfile)[4:-3]
+        f=run+'/'+SDIR+'/'+exp+'_prodmean_'+key+'.nc'
+        with ctx.closing(netCDF4.Dataset(sfile)) as src, ctx.closing(netCDF4.Dataset(f[:-3]+'.tmp.nc','w',format='NETCDF4')) as dst:
+            nrec=int(src.getncattr('nrec'))
+            dst.setncatts({'title':exp+' '+key+' production mean','years':src.getncattr('years'),'nrec':nrec,
+                           'complete':int(len(src.getncattr('years').split())==NPROD)})
+            dst.createDimension('time_counter',None)
+            for d in src.dimensions.values():
+                dst.createDimension(d.name,len(d))
+            for v in [v for v in src.variables.values() if not v.name.endswith(NSUF)]:
+                o=dst.createVariable(v.name,np.float32,('time_counter',)+v.dimensions,zlib=True,complevel=1,fill_value=netCDF4.default_fillvals['f4'])
+                o.setncatts({a:v.getncattr(a) for a in v.ncattrs() if a!='_FillValue'})
+                n=np.ma.filled(src.variables[v.name+NSUF][...],0)
+                o[0]=np.ma.array(np.ma.filled(v[...],0)/np.maximum(n,1),mask=n==0)
+        os.rename(f[:-3]+'.tmp.nc',f)
+        out.append(f)
+    return out
+
+def status(run):
+    """print which years are in the series and production sums of run"""
+    exp,ymax=os.path.basename(os.path.abspath(run)),int(rparams(run)['rP_YEAR_MAX'])
+    years=folded(run)
+    print(exp+': series '+(str(len(years))+' years ('+str(years[0])+'-'+str(years[-1])+')' if years!=[] else 'none yet')+' of '+str(ymax))
+    for sfile in sorted(glob.glob(run+'/'+SDIR+'/sum_*.nc')):
+        key=os.path.basename(sfile)[4:-3]
+        print('    '+key.ljust(20)+' production sums '+str(len(summed(run,key)))+'/'+str(NPROD)+' years')
+
+if __name__ == "__main__":
+    if len(sys.argv)<2 or sys.argv[1] not in ['fold','finalize','status']:
+        sys.exit(__doc__)
+    cmd=sys.argv[1]
+    if cmd=='fold':
+        run=sys.argv[3].rstrip('/') if len(sys.argv)>3 else '.'
+        fold(run,int(sys.argv[2]))
+    else:
+        run=sys.argv[2].rstrip('/') if len(sys.argv)>2 else '.'
+        if cmd=='finalize':
+            for f in finalize(run):
+                print('streamNEMO.py: wrote '+f)
+        elif os.path.isfile(run):
+            #rfiles/runme: rP_YEAR_MAX then a run folder a line
+            with ctx.closing(open(run,'r')) as handle:
+                for r in [l.strip().rstrip('/') for l in handle if l.strip()!=''][1:]:
+                    status(r)
+        else:
+            status(run)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+ Throughput of runs from the timing records the job scripts write (telemetry.log, see wryears in setupNEMO_ARC2.py)
+
+ python telemetry.py RUNDIR [RUNDIR ...]     - per year and per phase (spinup/production/long) throughput of each run
+ python telemetry.py rfiles/runme            - the same for all the members listed in runme, plus the ensemble totals and
+                                               what the rest of the run will cost
+
+ Each record is "time job nodes phase year years step start/end" with step one of pre (preNEMO.py/packNEMO.py stretch),
+ nemo (nemo.exe), post (one postNEMO.py) and wait (for a post that's in the way of the next launch). A year's wall clock is the
+ time from the start of its launch to the start of the next launch of the job (or the last record of the job) shared out over
+ the years of the launch, so it's what the run really gets through whether postNEMO.py is pipelined or not.
+"""
+import sys,os
+import contextlib as ctx
+import numpy as np
+from restarts import prodstart
+
+STEPS=['pre','nemo','post','wait']
+#years flagged as slow take this much longer than the median of their phase
+SLOW=1.5
+
+def records(run):
+    """list of (time, job, nodes, phase, year, years, step, edge) from run/telemetry.log"""
+    out=[]
+    if not os.path.exists(run+'/telemetry.log'):
+        return out
+    with ctx.closing(open(run+'/telemetry.log','r')) as handle:
+        for l in handle:
+            l=l.split()
+            if len(l)!=8 or l[6] not in STEPS or l[7] not in ['start','end']:
+                continue
+            out.append((int(l[0]),l[1],int(l[2]),l[3],int(l[4]),int(l[5]),l[6],l[7]))
+    return out
+
+def years(run):
+    """{year: {'phase','job','nodes','wall', and seconds of each step}} of a run, wall is per year (see above)"""
+    recs=sorted(records(run),key=lambda r:r[0])
+    out={}
+    opened={}
+    jobend={}
+    for t,job,nodes,phase,year,nyr,step,edge in recs:
+        jobend[job]=t
+        key=(job,phase,year,step)
+        if edge=='start':
+            opened[key]=(t,nyr)
+        elif key in opened:
+            t0,nyr=opened.pop(key)
+            for y in range(year,year+nyr):
+                yr=out.setdefault(y,{'phase':phase,'job':job,'nodes':nodes,'wall':np.nan})
+                yr[step]=yr.get(step,0.)+(t-t0)/float(nyr)
+
+    #wall clock from one launch to the next
+    launches=[(t,job,nodes,phase,year,nyr) for t,job,nodes,phase,year,nyr,step,edge in recs if step=='pre' and edge=='start']
+    for n,(t,job,nodes,phase,year,nyr) in enumerate(launches):
+        nxt=launches[n+1][0] if n+1<len(launches) and launches[n+1][1]==job else jobend[job]
+        for y in range(year,year+nyr):
+            yr=out.setdefault(y,{'phase':phase,'job':job,'nodes':nodes})
+            yr.update({'phase':phase,'job':job,'nodes':nodes,'wall':(nxt-t)/float(nyr)})
+    return out
+
+def phases(yrs):
+    """{phase: (years, median wall per year (s), simulated years per day, node hours per year, node hours, slow years)}"""
+    out={}
+    for phase in sorted(set([y['phase'] for y in yrs.values()])):
+        sel=sorted([(k,y) for k,y in yrs.items() if y['phase']==phase and not np.isnan(y.get('wall',np.nan))])
+        if sel==[]:
+            continue
+        wall=np.array([y['wall'] for k,y in sel])
+        nodeh=np.array([y['nodes']*y['wall']/3600. for k,y in sel])
+        med=np.median(wall)
+        out[phase]=(len(sel),med,86400/med,nodeh.mean(),nodeh.sum(),[k for k,y in sel if y['wall']>SLOW*med])
+    return out
+
+def report(run):
+    """print the per year and per phase throughput of a run, returns (phases, last year done)"""
+    yrs=years(run)
+    print(run)
+    if yrs=={}:
+        print('    no telemetry.log records yet')
+        return {},0
+    print('    year phase         nodes   wall/yr(s)  '+'  '.join([s.rjust(8) for s in STEPS])+'     sypd')
+    for k in sorted(yrs):
+        y=yrs[k]
+        print('    '+str(k).rjust(4)+' '+y['phase'].ljust(14)+str(y['nodes']).rjust(5)+str(round(y.get('wall',np.nan))).rjust(13)+'  '+\
+              '  '.join([str(round(y[s])).rjust(8) if s in y else '-'.rjust(8) for s in STEPS])+str(round(86400/y['wall'],2) if y.get('wall',0)>0 else '-').rjust(9))
+    ph=phases(yrs)
+    for phase,(n,med,sypd,nhy,nh,slow) in ph.items():
+        print('    '+phase+': '+str(n)+' years, '+str(round(sypd,2))+' sypd, '+str(round(nhy,1))+' node hours a year ('+str(round(nh))+' so far)'+\
+              (', slow years: '+' '.join([str(s) for s in slow]) if slow!=[] else ''))
+    return ph,max(yrs)
+
+if __name__ == "__main__":
+    if len(sys.argv)<2:
+        sys.exit(__doc__)
+    ymax=None
+    runs=[r.rstrip('/') for r in sys.argv[1:]]
+    if len(runs)==1 and os.path.isfile(runs[0]):
+        #rfiles/runme: rP_YEAR_MAX then a run folder a line
+        with ctx.closing(open(runs[0],'r')) as handle:
+            lines=[l.strip() for l in handle if l.strip()!='']
+        ymax=int(lines[0])
+        runs=[l.rstrip('/') for l in lines[1:]]
+
+    tot,todo=0.,0.
+    for run in runs:
+        ph,last=report(run)
+        tot+=sum([p[4] for p in ph.values()])
+        if ymax is not None and ph!={}:
+            #what's left at the rate of each phase (production at the spin up rate until there is one)
+            spin=ph.get('spinup',ph.get('long',list(ph.values())[0]))[3]
+            prod=ph['production'][3] if 'production' in ph else spin
+            left=[y for y in range(last+1,ymax+1)]
+            cost=sum([prod if y>=prodstart(run,ymax) else spin for y in left])
+            todo+=cost
+            print('    '+str(len(left))+' years to go, about '+str(round(cost))+' node hours')
+        print('')
+    print(str(len(runs))+' run(s): '+str(round(tot))+' node hours so far'+(', about '+str(round(todo))+' to go' if ymax is not None else ''))
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""
+ One Zarr store for the whole ensemble: the selected fields of every member's years, chunked and compressed, indexed by member, year
+ and time, so a 100 year series of all the members is one lazy open rather than thousands of netCDF files
+
+ python zarrNEMO.py init STORE FIELDS MEMBER [MEMBER ...] - (setupNEMO_ARC2.py mkensemble) make the store, or add members to it,
+                                                            FIELDS is json, e.g. '{"1m_grid_T": ["toce", "soce"]}' ([] for all)
+ python zarrNEMO.py append YEAR STORE [RUNDIR]            - (the job scripts, in the background after each postNEMO.py) write
+                                                            YEAR of RUNDIR, and any earlier year of it that isn't in yet
+ python zarrNEMO.py status STORE                          - which years of which members are in
+
+ Reading it:
+    import zarrNEMO
+    ds=zarrNEMO.load(STORE,'1m_grid_T')        #xarray, dask backed; (member, year, time_counter, [depth], y, x), years not in are NaN
+    ds.toce.sel(member='asf_c73_00008').mean(('y','x'))
+
+ key is the output frequency and file kind, e.g. 1m_grid_T for <exp>_1m_00940101_00941231_grid_T.nc in OUTNEMO_0094/.
+ Each key is a group of the store and a chunk is one member's year (one record of it for 3D fields), so members write different
+ chunk files and never get in each other's way; only making arrays and adding members change the metadata (under a lock on the
+ store, then the consolidated metadata is made again). A year goes in atomically: its chunks are written (each a temporary file
+ renamed by zarr) and then its flag in done, which is all load() and status trust, so a year that's cut short just gets written again.
+"""
+import sys,os
+import json
+import fcntl
+import contextlib as ctx
+import numpy as np
+from restarts import rparams,outputs
+
+#blosc zstd with bit shuffle, ~the compression of zlib 4 for a fraction of the time
+CLEVEL=3
+
+@ctx.contextmanager
+def locked(path):
+    """hold an flock on path (made if it isn't there)"""
+    with ctx.closing(open(path,'w')) as handle:
+        fcntl.flock(handle,fcntl.LOCK_EX)
+        yield
+
+def compressor():
+    from numcodecs import Blosc
+    return Blosc(cname='zstd',clevel=CLEVEL,shuffle=Blosc.BITSHUFFLE)
+
+def init(store,fields,members):
+    """make store with fields ({key: [variables]}), or add the members it hasn't got to it"""
+    import zarr
+    if not os.path.exists(store):
+        os.makedirs(store)
+    with locked(store+'/.lock'):
+        root=zarr.open_group(store,mode='a')
+        have=list(root.attrs.get('members',[]))
+        new=[m for m in members if m not in have]
+        if root.attrs.get('fields') not in [None,fields]:
+            print('zarrNEMO.py: '+store+' already has fields '+json.dumps(root.attrs['fields'])+', keeping those')
+        else:
+            root.attrs['fields']=fields
+        root.attrs['members']=have+new
+        #groups made already grow a member for each new one
+        for key in root.group_keys():
+            g=root[key]
+            for a in g.array_keys():
+                if g[a].attrs.get('_ARRAY_DIMENSIONS',[''])[0]=='member':
+                    g[a].resize((len(have+new),)+g[a].shape[1:])
+            g['member'][:]=np.array(have+new)
+        zarr.consolidate_metadata(store)
+    return new
+
+def mkgroup(root,key,f,fields,ymax):
+    """make the group of output key with the shapes of output f"""
+    import netCDF4
+    nm=len(root.attrs['members'])
+    g=root.create_group(key)
+    with ctx.closing(netCDF4.Dataset(f)) as nc:
+        nt=len(nc.dimensions['time_counter'])
+        vs=[v for v in nc.variables.values() if v.ndim>1 and v.dimensions[0]=='time_counter' and v.dtype.kind=='f' \
+            and not v.name.endswith('_bounds') and (fields==[] or v.name in fields)]
+        assert(vs!=[]),"none of "+str(fields)+" in "+f
+        for v in vs:
+            chunks=(1,1,1 if v.ndim>3 else nt)+v.shape[1:]
+            a=g.create_dataset(v.name,shape=(nm,ymax,nt)+v.shape[1:],chunks=chunks,dtype=np.float32,compressor=compressor(),fill_value=np.nan)
+            a.attrs.update({k:str(v.getncattr(k)) for k in v.ncattrs() if k not in ['_FillValue','missing_value','coordinates']})
+            a.attrs['_ARRAY_DIMENSIONS']=['member','year','time_counter']+list(v.dimensions[1:])
+        t=g.create_dataset('time',shape=(nm,ymax,nt),chunks=(1,1,nt),dtype=np.float64,fill_value=np.nan)
+        t.attrs.update({'_ARRAY_DIMENSIONS':['member','year','time_counter'],'units':getattr(nc.variables['time_counter'],'units','')})
+        d=g.create_dataset('done',shape=(nm,ymax),chunks=(1,ymax),dtype=np.int8,fill_value=0)
+        d.attrs['_ARRAY_DIMENSIONS']=['member','year']
+        g.create_dataset('member',data=np.array(root.attrs['members']),dtype='<U64',fill_value=None).attrs['_ARRAY_DIMENSIONS']=['member']
+        g.create_dataset('year',data=np.arange(1,ymax+1,dtype=np.int32),fill_value=None).attrs['_ARRAY_DIMENSIONS']=['year']
+        for v in ['nav_lat','nav_lon']:
+            if v in nc.variables:
+                g.create_dataset(v,data=np.asarray(nc.variables[v][...],np.float32),fill_value=None).attrs['_ARRAY_DIMENSIONS']=list(nc.variables[v].dimensions)
+    return g
+
+def write(g,im,year,f):
+    """put output f in as year of member im (done flag last)"""
+    import netCDF4
+    with ctx.closing(netCDF4.Dataset(f)) as nc:
+        nt=len(nc.dimensions['time_counter'])
+        assert(nt==g['time'].shape[2]),f+" has "+str(nt)+" records, the store has "+str(g['time'].shape[2])+" a year"
+        for a in g.array_keys():
+            if a in nc.variables and g[a].attrs.get('_ARRAY_DIMENSIONS',[''])[0]=='member':
+                v=nc.variables[a]
+                for k in range(nt) if v.ndim>3 else [slice(None)]:
+                    g[a][im,year-1,k]=np.ma.filled(np.ma.masked_invalid(v[k]).astype(np.float32),np.nan)
+        g['time'][im,year-1]=nc.variables['time_counter'][:]
+    g['done'][im,year-1]=1
+
+def append(store,year,run):
+    """write year of run folder run, and its earlier years that aren't in yet, to store"""
+    import zarr
+    name,ymax=os.path.basename(os.path.abspath(run)),int(rparams(run)['rP_YEAR_MAX'])
+    with locked(run+'/zarr.lock'):
+        root=zarr.open_group(store,mode='r+')
+        assert(name in root.attrs['members']),name+" isn't a member of "+store+" (python zarrNEMO.py init)"
+        im=root.attrs['members'].index(name)
+        fields=root.attrs['fields']
+        for y in range(1,min(year,ymax)+1):
+            files=outputs(run,y)
+            for key in sorted(fields):
+                if key not in files:
+                    continue
+                if key not in root:
+                    with locked(store+'/.lock'):
+                        root=zarr.open_group(store,mode='r+')
+                        if key not in root:
+                            mkgroup(root,key,files[key],fields[key],ymax)
+                            zarr.consolidate_metadata(store)
+                g=root[key]
+                if g['done'][im,y-1]==0:
+                    write(g,im,y,files[key])
+                    print('zarrNEMO.py: '+name+' year '+str(y)+' '+key)
+
+def load(store,key):
+    """xarray dataset of output key, years that aren't in yet masked"""
+    import xarray as xr
+    #NaN is the fill of the fields anyway, this keeps done and year integers
+    ds=xr.open_zarr(store,group=key,consolidated=True,mask_and_scale=False)
+    for v in ds.data_vars:
+        if v!='done' and ds[v].dims[:2]==('member','year'):
+            ds[v]=ds[v].where(ds.done==1)
+    return ds
+
+def status(store):
+    """print which years of which members are in store"""
+    import zarr
+    root=zarr.open_consolidated(store,mode='r')
+    print(store+': '+str(len(root.attrs['members']))+' members, fields '+json.dumps(root.attrs['fields']))
+    for key in sorted(root.group_keys()):
+        done=root[key]['done'][...]
+        print('    '+key)
+        for m,d in zip(root.attrs['members'],done):
+            ys=np.flatnonzero(d)+1
+            print('        '+m.ljust(24)+str(len(ys)).rjust(4)+' years'+(' ('+str(ys[0])+'-'+str(ys[-1])+')' if len(ys) else ''))
+
+if __name__ == "__main__":
+    if len(sys.argv)<3 or sys.argv[1] not in ['init','append','status']:
+        sys.exit(__doc__)
+    if sys.argv[1]=='init':
+        print('zarrNEMO.py: added '+' '.join(init(sys.argv[2].rstrip('/'),json.loads(sys.argv[3]),sys.argv[4:])))
+    elif sys.argv[1]=='append':
+        append(sys.argv[3].rstrip('/'),int(sys.argv[2]),sys.argv[4].rstrip('/') if len(sys.argv)>4 else '.')
+    else:
+        status(sys.argv[2].rstrip('/'))
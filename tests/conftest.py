@@ -0,0 +1,76 @@
+"""
+ The helper scripts live in helpers/ (setupNEMO_ARC2.py copies them into each run folder), the tests import them from there, and
+ setupNEMO_ARC2.py is the same in every case folder bar a few settings of the case, the setup fixture is the first one's
+"""
+import sys,os
+import contextlib as ctx
+import numpy as np
+import pytest
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),'helpers'))
+
+def mknc(path,dims,variables,fmt='NETCDF4',attrs={}):
+    """write a small netCDF file, variables is {name: (dimensions, data)} (a masked array for missing points)"""
+    import netCDF4
+    with ctx.closing(netCDF4.Dataset(path,'w',format=fmt)) as nc:
+        nc.setncatts(attrs)
+        for d,n in dims.items():
+            nc.createDimension(d,n)
+        for name,(d,a) in variables.items():
+            a=np.ma.asarray(a)
+            v=nc.createVariable(name,a.dtype,d,fill_value=netCDF4.default_fillvals[a.dtype.str[1:]] if a.dtype.kind=='f' else None)
+            v[...]=a
+    return str(path)
+
+@pytest.fixture
+def nc():
+    return mknc
+
+def mktiles(base,variables,px,py,halo=1,missing=[]):
+    """split global variables {name: (dimensions, data)} (dimensions from time_counter, nav_lev, y, x) into px*py NEMO tile files
+    base_NNNN.nc, halo points on the inner edges, leaving out the tiles in missing (land suppressed)"""
+    import netCDF4
+    v=list(variables.values())[0]
+    ny,nx=[n for d,n in zip(v[0],np.shape(v[1])) if d in ['y','x']]
+    sizes=dict([(d,n) for dims,a in variables.values() for d,n in zip(dims,np.shape(a))])
+    xs,ys=np.array_split(np.arange(nx),px),np.array_split(np.arange(ny),py)
+    for j,yi in enumerate(ys):
+        for i,xi in enumerate(xs):
+            n=j*px+i
+            if n in missing:
+                continue
+            cut={}
+            attrs={'DOMAIN_number_total':px*py,'DOMAIN_number':n,'DOMAIN_dimensions_ids':[1,2],'DOMAIN_size_global':[nx,ny]}
+            for d,idx,last in [('x',xi,i==px-1),('y',yi,j==py-1)]:
+                hs=halo if idx[0]>0 else 0
+                he=halo if not last else 0
+                cut[d]=slice(idx[0]-hs,idx[-1]+1+he)
+                attrs.setdefault('DOMAIN_position_first',[]).append(idx[0]-hs+1)
+                attrs.setdefault('DOMAIN_position_last',[]).append(idx[-1]+1+he)
+                attrs.setdefault('DOMAIN_halo_size_start',[]).append(hs)
+                attrs.setdefault('DOMAIN_halo_size_end',[]).append(he)
+            with ctx.closing(netCDF4.Dataset(base+'_'+str(n).zfill(4)+'.nc','w')) as nc:
+                nc.setncatts(attrs)
+                for d in ['x','y','nav_lev','time_counter']:
+                    if d in sizes:
+                        nc.createDimension(d,None if d=='time_counter' else cut[d].stop-cut[d].start if d in cut else sizes[d])
+                for name,(dims,a) in variables.items():
+                    a=np.asarray(a)
+                    var=nc.createVariable(name,a.dtype,dims,fill_value=-1 if a.dtype.kind=='f' else None)
+                    var[tuple([slice(0,k) for k in np.shape(a[tuple([cut.get(d,slice(None)) for d in dims])])])]=\
+                        a[tuple([cut.get(d,slice(None)) for d in dims])]
+
+@pytest.fixture
+def tiles():
+    return mktiles
+
+@pytest.fixture(scope='session')
+def setup():
+    import importlib.util
+    f=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),'asf_c73_00008','setupNEMO_ARC2.py')
+    spec=importlib.util.spec_from_file_location('setupNEMO_ARC2',f)
+    mod=importlib.util.module_from_spec(spec)
+    #by name too, so mkensemble's workers can find setupmember
+    sys.modules['setupNEMO_ARC2']=mod
+    spec.loader.exec_module(mod)
+    return mod
@@ -0,0 +1,103 @@
+import os
+import contextlib as ctx
+import subprocess
+import sys
+import numpy as np
+import netCDF4
+import pytest
+import budgetNEMO
+
+NT,NZ,NY,NX=2,3,4,5
+
+def fields(seed=0):
+    """trends hpg, zdf, adv and tau (a part of zdf), and tot their sum"""
+    rng=np.random.default_rng(seed)
+    t={n:rng.standard_normal((NT,NZ,NY,NX)) for n in ['hpg','zdf','adv']}
+    t['tau']=0.5*t['zdf']
+    t['tot']=t['hpg']+t['zdf']+t['adv']
+    return t
+
+def grid():
+    e1=np.full((NY,NX),2.)
+    e2=np.full((NY,NX),3.)
+    e30=np.array([1.,2.,4.])[:,None,None]*np.ones((NZ,NY,NX))
+    msk=np.ones((NZ,NY,NX))
+    msk[2,:,0]=0
+    msk[:,0,0]=0
+    return e1,e2,e30,msk
+
+def trends(f,nc,t,e3=None,units='m/s^2'):
+    """an output with the u trends t, thickness weighted (times e3) if e3 is given"""
+    dims=('time_counter','depthu','y','x')
+    v={'utrd_'+n:(dims,a if e3 is None else a*e3) for n,a in t.items()}
+    v['time_counter']=(('time_counter',),np.arange(NT,dtype='f8'))
+    if e3 is not None:
+        v['e3u']=(dims,e3)
+    nc(f,{'time_counter':NT,'depthu':NZ,'y':NY,'x':NX},v)
+    with ctx.closing(netCDF4.Dataset(f,'a')) as out:
+        for n in t:
+            out.variables['utrd_'+n].units=units
+    return f
+
+def expected(t,e1,e2,e3,msk):
+    terms=sorted(t)
+    s=np.array([t[n] for n in terms]+[t['hpg']+t['zdf']+t['adv']-t['tot']])
+    w=e3*msk
+    return (terms+['res'],np.einsum('itkyx,tkyx->ti',s,w*e1*e2),np.einsum('itkyx,tkyx->ti',s**2,w*e1*e2),
+            np.einsum('itkyx,tkyx->iyx',s,w)/NT,np.einsum('itkyx,tkyx->iky',s,w*e1)/NT)
+
+@pytest.mark.parametrize('mem',[budgetNEMO.MEM,1])
+def test_budget(tmp_path,nc,monkeypatch,mem):
+    #a level at a time with MEM 1
+    monkeypatch.setattr(budgetNEMO,'MEM',mem)
+    t=fields()
+    e1,e2,e30,msk=grid()
+    with ctx.closing(netCDF4.Dataset(trends(str(tmp_path/'u.nc'),nc,t))) as f:
+        terms,vol,ms,dep,zon,volume,tw=budgetNEMO.budget(f,'u',e1,e2,e30,msk)
+    ex=expected(t,e1,e2,np.broadcast_to(e30,(NT,NZ,NY,NX)),msk)
+    assert terms==ex[0]==['adv','hpg','tau','tot','zdf','res'] and not tw
+    for a,b in zip([vol,ms,dep,zon],ex[1:]):
+        assert np.allclose(a,b)
+    #the budget closes
+    assert np.allclose(vol[:,-1],0) and np.allclose(ms[:,-1],0)
+    assert volume==np.sum(e30*msk*e1*e2)
+
+def test_budget_thickness_weighted_vvl(tmp_path,nc):
+    t=fields(1)
+    e1,e2,e30,msk=grid()
+    e3=e30[None]*(1+0.1*np.arange(NT))[:,None,None,None]
+    with ctx.closing(netCDF4.Dataset(trends(str(tmp_path/'u.nc'),nc,t,e3,'m2/s2'))) as f:
+        terms,vol,ms,dep,zon,volume,tw=budgetNEMO.budget(f,'u',e1,e2,e30,msk)
+    assert tw
+    for a,b in zip([vol,ms,dep,zon],expected(t,e1,e2,e3,msk)[1:]):
+        assert np.allclose(a,b)
+
+def test_thick():
+    class V(object):
+        pass
+    v=V()
+    for u,tw in [('m2/s2',True),('m2 s-2',True),('m2s-2',True),('m/s^2',False),('m s-2',False),('',False)]:
+        v.units=u
+        assert budgetNEMO.thick(v)==tw
+
+def test_year_summary(tmp_path,nc):
+    r=str(tmp_path/'x')
+    os.makedirs(r+'/OUTNEMO_0001')
+    with open(r+'/rPARAMS.py','w') as handle:
+        handle.write("rP_YEAR_MAX='1'\n")
+    e1,e2,e30,msk=grid()
+    nc(r+'/mesh_mask.nc',{'t':1,'z':NZ,'y':NY,'x':NX},{'e1u':(('t','y','x'),e1[None]),'e2u':(('t','y','x'),e2[None]),
+       'e3u_0':(('t','z','y','x'),e30[None]),'umask':(('t','z','y','x'),msk[None].astype('i1'))})
+    nc(r+'/OUTNEMO_0001/x_1m_00010101_00011231_grid_T.nc',{'y':NY},{'sst':(('y',),np.zeros(NY))})
+    assert 'no trends' in budgetNEMO.year(r,1)
+    trends(r+'/OUTNEMO_0001/x_1m_00010101_00011231_grid_U.nc',nc,fields())
+    assert budgetNEMO.trendfiles(r,1)=={'u':r+'/OUTNEMO_0001/x_1m_00010101_00011231_grid_U.nc'}
+    assert budgetNEMO.year(r,1).endswith('u: x_1m_00010101_00011231_grid_U.nc')
+    assert budgetNEMO.year(r,1).endswith('already done')
+    with ctx.closing(netCDF4.Dataset(r+'/budget/0001.nc')) as f:
+        assert f.terms_u=='adv hpg tau tot zdf res' and f.res_u=='sum less tot'
+        assert f.variables['u_dep'].shape==(6,NY,NX) and f.variables['u_zon'].shape==(6,NZ,NY)
+        assert np.allclose(f.variables['u_vol'][:],expected(fields(),e1,e2,np.broadcast_to(e30,(NT,NZ,NY,NX)),msk)[1])
+    out=subprocess.run([sys.executable,budgetNEMO.__file__,'summary',r],capture_output=True,text=True)
+    assert out.returncode==0,out.stderr
+    assert 'x                        u 1 years, res/largest rms 0.0%' in out.stdout
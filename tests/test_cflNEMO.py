@@ -0,0 +1,86 @@
+import os
+import subprocess
+import sys
+import f90nml
+import pytest
+import cflNEMO
+import restarts
+
+#as diacfl writes it, a line of the Courant numbers at each step then the largest of the run
+CFL='''  Time-step   Courant number   i    j    k
+       1   Max Cu    0.1000  120  300   10
+           Max Cv    0.0500   20   30    1
+           Max Cw    0.0100   40   50    3
+       2   Max Cu    0.2500  121  301   11
+           Max Cv    0.0600   20   30    1
+           Max Cw    1.2D-02   40   50    3
+ ******************************************
+ Max Cu     0.2500 at (i, j, k) = (  121  301   11) at step       2
+'''
+
+def run(tmp_path,rdt=1800.):
+    """run folder x, a 360 day year and 100 years"""
+    r=str(tmp_path/'x')
+    os.makedirs(r+'/cfl')
+    with open(r+'/rPARAMS.py','w') as handle:
+        handle.write("rP_NDAYS='360'\nrP_YEAR_MAX='100'\n")
+    f90nml.write({'namrun':{'nn_it000':1,'nn_itend':100},'namdom':{'rn_rdt':rdt}},r+'/namelist_cfg')
+    f90nml.write({'namrun':{'nn_it000':1,'nn_itend':100},'namdom':{'rn_rdt':rdt}},r+'/cfl/namelist_cfg')
+    return r
+
+def test_parse(tmp_path):
+    f=str(tmp_path/cflNEMO.CFLFILE)
+    with open(f,'w') as handle:
+        handle.write(CFL)
+    c=cflNEMO.parse(f)
+    assert c['u']==(0.25,2,'121  301   11')
+    assert c['v']==(0.06,2,'20   30    1') and c['w']==(0.012,2,'40   50    3')
+
+def test_pick():
+    #stable to 1800*0.6/0.25=4320s, 80% of that is 3456s, which divides a day
+    assert cflNEMO.pick(1800.,0.25,False)==(4320.,3456)
+    #from rest, never above the step now
+    assert cflNEMO.pick(1800.,0.25,True)==(4320.,1800)
+    #at most MAXUP times the step now
+    assert cflNEMO.pick(600.,0.01,False)[1]==1200
+    #too fast for anything
+    assert cflNEMO.pick(1.,100.,False)==(0.006,None)
+
+def test_steps():
+    out=cflNEMO.steps(2880,360,100)
+    assert out[0]=='rn_rdt 2880s: 10800 time steps a year, 1080000 for the 100 years'
+    assert [l.split()[0] for l in out[2:]]==['1','2','3',str(100-restarts.NPROD+1),'100']
+    assert out[-1].split()==['100','1069201','1080000','_01080000_restart.nc']
+    with pytest.raises(AssertionError):
+        cflNEMO.steps(7000,360,100)
+
+def test_prep(tmp_path,monkeypatch):
+    r=run(tmp_path)
+    monkeypatch.chdir(r+'/cfl')
+    cflNEMO.prep(2400,r)
+    with open('start','r') as handle:
+        assert handle.read()=='rest\n'
+    assert 'ln_rstart' not in f90nml.read('namelist_cfg')['namrun']
+    #the newest restart, 17280 steps a year
+    for y in [1,2]:
+        f=os.path.join(r,restarts.rstpath('x',y,17280))
+        os.makedirs(os.path.dirname(f))
+        open(f,'w').close()
+    cflNEMO.prep(2400,r)
+    nml=f90nml.read('namelist_cfg')['namrun']
+    assert (nml['ln_rstart'],nml['nn_it000'],nml['nn_itend'],nml['cn_ocerst_in'])==(True,34561,36960,'x_00034560_restart')
+    assert nml['cn_ocerst_indir']==os.path.dirname(f)+'/'
+    with open('start','r') as handle:
+        assert handle.read()==f+'\n'
+
+def test_report(tmp_path):
+    r=run(tmp_path)
+    assert cflNEMO.report(r)==(1800.,None,None)
+    with open(r+'/cfl/'+cflNEMO.CFLFILE,'w') as handle:
+        handle.write(CFL)
+    with open(r+'/cfl/start','w') as handle:
+        handle.write('/somewhere/x_00034560_restart.nc\n')
+    assert cflNEMO.report(r)==(1800.,0.25,3456)
+    out=subprocess.run([sys.executable,cflNEMO.__file__,r],capture_output=True,text=True)
+    assert out.returncode==0,out.stderr
+    assert 'use 3456s' in out.stdout and '48% fewer steps' in out.stdout and '      namdom: {rn_rdt: 3456.0}' in out.stdout
@@ -0,0 +1,31 @@
+import numpy as np
+import chunkNEMO
+
+def test_extents():
+    assert chunkNEMO.extents(slice(None),(4,5))==[[0,4],[0,5]]
+    assert chunkNEMO.extents((0,Ellipsis,2),(3,4,5,6))==[[0,1],[0,4],[0,5],[2,3]]
+    assert chunkNEMO.extents((-1,slice(2,None)),(4,5))==[[3,4],[2,5]]
+    assert chunkNEMO.extents((slice(None,None,-1),[3,1]),(4,5))==[[0,4],[1,4]]
+    assert chunkNEMO.extents((np.array([False,True,True,False]),np.array([-1])),(4,5))==[[1,3],[4,5]]
+    assert chunkNEMO.extents((np.array([],int),),(4,))==[[0,0]]
+
+def test_touched():
+    #a level of a 10x10 grid in 5x5 chunks of one level is 4 chunks
+    assert chunkNEMO.touched([[0,1],[0,10],[0,10]],[1,5,5],4)==4*25*4
+    #a point is a chunk
+    assert chunkNEMO.touched([[3,4],[7,8],[7,8]],[1,5,5],4)==25*4
+    #one that straddles a chunk boundary pulls in both
+    assert chunkNEMO.touched([[0,1],[4,6],[0,1]],[1,5,5],8)==2*25*8
+    assert chunkNEMO.touched([[0,0],[0,10],[0,10]],[1,5,5],4)==0
+
+def test_bench_2d_only(tmp_path,nc):
+    #only 2D fields read, so the candidates (and how it is now) have no z
+    f=nc(tmp_path/'x_1m_00010101_00011231_grid_T.nc',{'time_counter':None,'y':8,'x':12},
+         {'sst':(('time_counter','y','x'),np.ones((2,8,12),np.float32))})
+    log=str(tmp_path/'reads.log')
+    with open(log,'w') as handle:
+        handle.write('[3, "grid_T", "sst", ["time_counter", "y", "x"], [2, 8, 12], [[0, 2], [0, 8], [0, 12]]]\n')
+        handle.write('[1, "grid_T", "sst", ["time_counter", "y", "x"], [2, 8, 12], [[0, 1], [2, 3], [0, 12]]]\n')
+    best,size=chunkNEMO.bench(log,[f],str(tmp_path/'bench')+'/')
+    assert size=={'x':12,'y':8}
+    assert set(best)=={'x','y'}
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+import decompNEMO
+
+@pytest.mark.parametrize('nglo,nb',[(10,1),(10,3),(66,8),(102,7),(34,32)])
+def test_splits(nglo,nb):
+    first,size=decompNEMO.splits(nglo,nb)
+    hls=decompNEMO.HLS
+    assert len(first)==len(size)==nb
+    #the interiors follow on from each other and cover the domain, halos and all
+    np.testing.assert_array_equal(first[1:],first[:-1]+size[:-1]-2*hls)
+    assert first[0]==0 and first[-1]+size[-1]==nglo
+    #big ones first, at most a point apart
+    assert list(size)==sorted(size,reverse=True) and size[0]-size[-1]<=1
+
+def test_land_subdomains_are_dropped(tmp_path,nc):
+    b=np.ones((1,22,42),np.int32)
+    #columns 20 on are land, so are the two eastern subdomains of 4x2 (halos included)
+    b[:,:,20:]=0
+    f=nc(tmp_path/'domain_cfg.nc',{'t':1,'y':22,'x':42},{'bottom_level':(('t','y','x'),b)})
+    assert decompNEMO.oceanmask(f).shape==(22,42)
+    jpni,jpnj,ranks=decompNEMO.decomp(f,100,'4x2')
+    assert (jpni,jpnj,ranks)==(4,2,4)
+    assert decompNEMO.decomp(f,8,'auto')[2]<=8
+    #a layout picked by hand still has to fit
+    with pytest.raises(AssertionError):
+        decompNEMO.decomp(f,3,'4x2')
@@ -0,0 +1,74 @@
+import os
+import subprocess
+
+def domaincfg(run,nml='&namcfg\n/\n'):
+    """the domaincfg/ folder of run folder run"""
+    os.makedirs(os.path.join(run,'domaincfg'))
+    for f,text in [('bathy_meter.nc','bathy'),('namelist_cfg',nml),('namelist_ref','&namcfg\n/\n'),('make_domain_cfg.exe','exe')]:
+        with open(os.path.join(run,'domaincfg',f),'w') as handle:
+            handle.write(text)
+    return run
+
+def test_domcfgkey(setup,tmp_path):
+    a=domaincfg(str(tmp_path/'a'))
+    b=domaincfg(str(tmp_path/'b'))
+    c=domaincfg(str(tmp_path/'c'),'&namcfg\n  jpkdta = 75\n/\n')
+    hack=str(tmp_path/'hack.py')
+    with open(hack,'w') as handle:
+        handle.write('#hack\n')
+    #what's in the folder, not where it is
+    assert setup.domcfgkey(a,['',''])==setup.domcfgkey(b,['',''])
+    assert setup.domcfgkey(a,['',''])!=setup.domcfgkey(c,['',''])
+    assert setup.domcfgkey(a,['',''])!=setup.domcfgkey(a,['hacked',hack])
+    k=setup.domcfgkey(a,['hacked',hack])
+    with open(hack,'a') as handle:
+        handle.write('#hacked again\n')
+    assert setup.domcfgkey(a,['hacked',hack])!=k
+
+#make_domain_cfg.exe and the hack script, each call goes in $cdir/calls
+STUBS='''
+srun() { echo "srun $*" >> $cdir/calls; echo made > domain_cfg.nc; }
+python() { echo "python $*" >> $cdir/calls; cp $2 $3; echo hacked >> $3; }
+'''
+
+def script(setup,run,cdir,extdomaincfg):
+    f=os.path.join(run,'go.sh')
+    with open(os.path.join(run,'domaincfg','cachedir'),'w') as handle:
+        handle.write(cdir+'\n')
+    with open(f,'w') as handle:
+        handle.write('#!/bin/bash\n')
+        handle.write('cd '+run+'\n')
+        setup.wrdomcfg(handle,run,extdomaincfg)
+    subprocess.check_call(['bash','-n',f])
+    subprocess.check_call(['bash','-c','cdir='+cdir+'\n'+STUBS+'source '+f],cwd=run)
+
+def calls(cdir):
+    with open(os.path.join(cdir,'calls'),'r') as handle:
+        return [l.split()[0] for l in handle]
+
+def test_made_once(setup,tmp_path):
+    cdir=str(tmp_path/'cache'/'key')
+    hack=['hacked','/x/hack.py']
+    a=domaincfg(str(tmp_path/'a'))
+    script(setup,a,cdir,hack)
+    assert calls(cdir)==['srun','python']
+    with open(cdir+'/domain_cfg.nc','r') as handle:
+        assert handle.read()=='made\nhacked\n'
+    assert not os.path.islink(a+'/domain_cfg.nc')
+    #the next member with the same inputs links it in
+    b=domaincfg(str(tmp_path/'b'))
+    script(setup,b,cdir,hack)
+    assert calls(cdir)==['srun','python']
+    assert os.readlink(b+'/domain_cfg.nc')==cdir+'/domain_cfg.nc'
+    #and a resubmitted job keeps what it has
+    os.remove(b+'/domain_cfg.nc')
+    with open(b+'/domain_cfg.nc','w') as handle:
+        handle.write('mine\n')
+    script(setup,b,cdir,hack)
+    with open(b+'/domain_cfg.nc','r') as handle:
+        assert handle.read()=='mine\n'
+
+def test_rogue(setup,tmp_path):
+    with open(str(tmp_path/'go.sh'),'w') as handle:
+        setup.wrdomcfg(handle,str(tmp_path),['rogue','/x/domain_cfg.nc'])
+    assert os.path.getsize(str(tmp_path/'go.sh'))==0
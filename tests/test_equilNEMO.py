@@ -0,0 +1,84 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import equilNEMO
+import restarts
+
+SHAPE=(1,2,3,4)
+
+def run(tmp_path,nc,temps,un=0.1):
+    """run folder x, 10 steps a year, with a restart a year at temperature temps[year-1] (uniform) and zonal flow un"""
+    r=str(tmp_path/'x')
+    os.makedirs(r)
+    with open(r+'/rPARAMS.py','w') as handle:
+        handle.write("rP_NDAYS='10'\nrP_YEAR_MAX='50'\n")
+    with open(r+'/namelist_cfg','w') as handle:
+        handle.write('&namdom\n    rn_rdt = 86400.0\n/\n')
+    d=('t','z','y','x')
+    dims={'t':1,'z':2,'y':3,'x':4}
+    one=np.ones(SHAPE)
+    nc(r+'/mesh_mask.nc',dims,dict([(v,(d,1000.*one)) for v in ['e1t','e2t','e2u']]+[(v,(d,10.*one)) for v in ['e3t_0','e3u_0']]+\
+       [(v,(d,one.astype('i1'))) for v in ['tmask','umask','vmask']]))
+    for y,t in enumerate(temps,1):
+        f=os.path.join(r,restarts.rstpath('x',y,10))
+        os.makedirs(os.path.dirname(f))
+        nc(f,dims,{'un':(d,un*one),'vn':(d,0*one),'tn':(d,t*one)})
+    return r
+
+def test_metrics(tmp_path,nc):
+    r=run(tmp_path,nc,[2.])
+    ke,hc,tx=equilNEMO.metrics(os.path.join(r,restarts.rstpath('x',1,10)),r+'/mesh_mask.nc')
+    assert np.isclose(ke,0.5*0.1**2)
+    assert np.isclose(hc,equilNEMO.RHO0CP*2.*1000*1000*10*24)
+    #0.1 m/s through a 2 level, 3 row section of 1000m by 10m cells
+    assert np.isclose(tx,0.1*1000*10*6/1e6)
+
+def test_drift():
+    area=1e12
+    #ke up 1% of its mean over the window, tx steady, heat content worth 1 W m-2
+    rec={y:(1.+0.001*(y-5.5),1e20+365*86400*area*y,5.) for y in range(1,11)}
+    d=equilNEMO.drift(rec,10,area)
+    assert np.isclose(d['ke'],0.01) and np.isclose(d['hc'],1.) and np.isclose(d['tx'],0.)
+    assert not equilNEMO.settled(d)
+    assert equilNEMO.drift(rec,9,area) is None
+    del rec[3]
+    assert equilNEMO.drift(rec,10,area) is None
+    assert equilNEMO.settled({'ke':0.01,'hc':0.05,'tx':0.01}) and not equilNEMO.settled(None)
+
+def test_check(tmp_path,nc,monkeypatch):
+    monkeypatch.setattr(equilNEMO,'WINDOW',3)
+    monkeypatch.setattr(equilNEMO,'NCONFIRM',2)
+    monkeypatch.setattr(equilNEMO,'MINYEARS',4)
+    r=run(tmp_path,nc,[1.]*5)
+    equilNEMO.check(r,3)
+    assert sorted(equilNEMO.read(r))==[1,2,3] and not os.path.exists(r+'/'+equilNEMO.FLAG)
+    #a year's restart that's gone (thinned) isn't read again
+    os.remove(os.path.join(r,restarts.rstpath('x',2,10)))
+    equilNEMO.check(r,4)
+    assert sorted(equilNEMO.read(r))==[1,2,3,4]
+    with open(r+'/'+equilNEMO.FLAG,'r') as handle:
+        assert handle.read().split()[:2]==['4','ke']
+    out=subprocess.run([sys.executable,equilNEMO.__file__,'status',r],capture_output=True,text=True)
+    assert out.returncode==0,out.stderr
+    assert out.stdout.split()[:3]==['x','year','4'] and out.stdout.strip().endswith('settled, switching')
+    with open(r+'/production.start','w') as handle:
+        handle.write('5\n')
+    equilNEMO.status(r)
+
+def test_check_drifting(tmp_path,nc,monkeypatch,capsys):
+    monkeypatch.setattr(equilNEMO,'WINDOW',3)
+    monkeypatch.setattr(equilNEMO,'NCONFIRM',2)
+    monkeypatch.setattr(equilNEMO,'MINYEARS',4)
+    #warming a degree a year
+    r=run(tmp_path,nc,[1.,2.,3.,4.,5.])
+    equilNEMO.check(r,5)
+    assert not os.path.exists(r+'/'+equilNEMO.FLAG)
+    #already switched, no flag
+    r2=run(tmp_path/'b',nc,[1.]*5)
+    with open(r2+'/production.start','w') as handle:
+        handle.write('5\n')
+    equilNEMO.check(r2,5)
+    assert not os.path.exists(r2+'/'+equilNEMO.FLAG)
+    equilNEMO.status(r2)
+    assert capsys.readouterr().out.strip().endswith('production from year 5')
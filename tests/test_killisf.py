@@ -0,0 +1,44 @@
+import os
+import numpy as np
+import netCDF4
+import pytest
+
+def bathy(tmp_path,nc,name='bathy.nc',**extra):
+    v={'nav_lon':(('y','x'),np.arange(12.).reshape(3,4)),'Bathymetry_isf':(('y','x'),np.full((3,4),500.)),
+       'isf_draft':(('y','x'),np.full((3,4),100.))}
+    v.update(extra)
+    return nc(tmp_path/name,{'y':3,'x':4},v,attrs={'history':'made for a test'})
+
+def test_kill(setup,tmp_path,nc):
+    b=bathy(tmp_path,nc)
+    store=str(tmp_path/'killisf')+'/'
+    f=setup.mkkillisf(b,store)
+    assert f==store+'bathy_meter_killisf_'+setup.sha1sum(b)+'.nc'
+    with netCDF4.Dataset(f) as out:
+        assert sorted(out.variables)==['Bathymetry','nav_lon']
+        assert out.history=='made for a test'
+        np.testing.assert_array_equal(out.variables['Bathymetry'][...],np.full((3,4),500.))
+        np.testing.assert_array_equal(out.variables['nav_lon'][...],np.arange(12.).reshape(3,4))
+    #no temporary files left behind, only the result and its lock
+    assert sorted(os.listdir(store))==[os.path.basename(f),os.path.basename(f)+'.lock']
+
+def test_done_once(setup,tmp_path,nc,capsys):
+    b=bathy(tmp_path,nc)
+    store=str(tmp_path/'killisf')+'/'
+    f=setup.mkkillisf(b,store)
+    mt=os.stat(f).st_mtime_ns
+    #the same bathymetry under another name is the same result
+    c=bathy(tmp_path,nc,'copy.nc')
+    assert setup.mkkillisf(c,store)==f
+    assert os.stat(f).st_mtime_ns==mt
+    assert 'We have already killed the ice-shelf' in capsys.readouterr().out
+
+def test_bad_bathymetry(setup,tmp_path,nc):
+    store=str(tmp_path/'killisf')+'/'
+    b=bathy(tmp_path,nc,Bathymetry=(('y','x'),np.zeros((3,4))))
+    with pytest.raises(ValueError,match='already has a Bathymetry'):
+        setup.mkkillisf(b,store)
+    b=nc(tmp_path/'noisf.nc',{'y':3,'x':4},{'Bathymetry_isf':(('y','x'),np.zeros((3,4)))})
+    with pytest.raises(ValueError,match='has no isf_draft'):
+        setup.mkkillisf(b,store)
+    assert [f for f in os.listdir(store) if not f.endswith('.lock')]==[]
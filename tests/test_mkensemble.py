@@ -0,0 +1,37 @@
+import os
+import pytest
+
+def member(tmp_path,num,**kw):
+    m={'workfol':str(tmp_path)+'/','rP_CONFIG':'asf_c'+str(num),'rP_CONFIG_TYPE':'ASF','rP_CASE':'00008','NEMOexe':'/x/nemo.exe',
+       'NEMOdir':'/x/','WCONFIG':'/x/','BFILE':'/x/bathy.nc','TSFILE':'/x/TS.nc','FLXFCE':'/x/flx_grid_.nc','rP_NDAYS':365,
+       'rP_nml_patch':{},'rP_nml_domcfgpatch':{},'DOMAINcfg':'/x/make_domain_cfg.exe','killisf':False,'extdomaincfg':['',''],'submit':''}
+    m.update(kw)
+    return m
+
+def test_nothing_to_do(setup):
+    assert setup.mkensemble([])==[]
+
+def test_a_failing_member_doesnt_stop_the_others(setup,tmp_path,monkeypatch):
+    def main(workfol,rP_CONFIG,*args,**kw):
+        if rP_CONFIG=='asf_c74':
+            raise RuntimeError('no bathymetry for '+rP_CONFIG)
+        print('set up '+rP_CONFIG)
+        os.makedirs(workfol+rP_CONFIG)
+        return workfol+rP_CONFIG
+    monkeypatch.setattr(setup,'main',main)
+    monkeypatch.setattr(setup,'mkmesh',lambda *args,**kw:None)
+    status=setup.mkensemble([member(tmp_path,n) for n in [73,74,75]],nproc=2)
+    #in the order of the members, whatever order they finished in
+    assert [s[0] for s in status]==['asf_c73_00008','asf_c74_00008','asf_c75_00008']
+    assert [s[1] for s in status]==[str(tmp_path)+'/asf_c73',None,str(tmp_path)+'/asf_c75']
+    assert status[0][2] is None and status[2][2] is None
+    assert 'RuntimeError: no bathymetry for asf_c74' in status[1][2]
+    #each member talks to its own log
+    with open(str(tmp_path/'rfiles'/'asf_c73_00008.log')) as handle:
+        assert handle.read()=='set up asf_c73\n'
+    with open(str(tmp_path/'rfiles'/'asf_c74_00008.log')) as handle:
+        assert 'no bathymetry for asf_c74' in handle.read()
+
+def test_main_stops_on_missing_inputs(setup,tmp_path):
+    status=setup.mkensemble([member(tmp_path,73)])
+    assert status[0][1] is None and "can't find file: /x/bathy.nc" in status[0][2]
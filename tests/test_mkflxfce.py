@@ -0,0 +1,44 @@
+import os
+import f90nml
+import pytest
+
+NML='''&namsbc_flx
+   cn_dir      = './flxfce/'
+   sn_utau     = 'flxforce_grid_U' , -1 , 'utau' , .false. , .false., 'yearly' , '' , '' , ''
+   sn_qtot     = 'flxforce_grid_T' , -1 , 'qtot' , .false. , .false., 'yearly' , '' , '' , ''
+/
+'''
+
+def run(tmp_path):
+    """run folder with namelist_ref and an empty flxfce/, and the three flux forcing files"""
+    os.makedirs(str(tmp_path/'run'/'flxfce'))
+    with open(str(tmp_path/'run'/'namelist_ref'),'w') as handle:
+        handle.write(NML)
+    for g in 'TUV':
+        open(str(tmp_path/('flx_grid_'+g+'.nc')),'w').close()
+    return str(tmp_path/'run'),str(tmp_path/'flx_grid_.nc')
+
+def test_clim(setup,tmp_path):
+    r,flx=run(tmp_path)
+    patch=setup.mkflxfce(r,flx,'clim',range(1,101))
+    assert sorted(os.listdir(r+'/flxfce'))==['flxforce_grid_T.nc','flxforce_grid_U.nc','flxforce_grid_V.nc']
+    assert os.readlink(r+'/flxfce/flxforce_grid_U.nc')==str(tmp_path/'flx_grid_U.nc')
+    #only the clim flag changes
+    assert patch=={'namsbc_flx':{'sn_utau':['flxforce_grid_U',-1,'utau',False,True,'yearly','','',''],
+                                 'sn_qtot':['flxforce_grid_T',-1,'qtot',False,True,'yearly','','','']}}
+    setup.nmlpatch(r+'/namelist_ref',[patch],[r+'/namelist_cfg'])
+    assert f90nml.read(r+'/namelist_cfg')['namsbc_flx']['sn_qtot'][4] is True
+
+def test_yearly(setup,tmp_path):
+    r,flx=run(tmp_path)
+    assert setup.mkflxfce(r,flx,'yearly',range(1,4))=={}
+    assert len(os.listdir(r+'/flxfce'))==9
+    assert os.readlink(r+'/flxfce/flxforce_grid_T_y0003.nc')==str(tmp_path/'flx_grid_T.nc')
+
+def test_bad(setup,tmp_path):
+    r,flx=run(tmp_path)
+    with pytest.raises(ValueError):
+        setup.mkflxfce(r,flx,'monthly',range(1,4))
+    os.remove(str(tmp_path/'flx_grid_V.nc'))
+    with pytest.raises(AssertionError):
+        setup.mkflxfce(r,flx,'clim',range(1,4))
@@ -0,0 +1,49 @@
+import os
+import stat
+import time
+import f90nml
+import monitorNEMO
+
+def run(tmp_path,kt,age):
+    """a run folder 100 steps a year on time step kt of year 1, last written age seconds ago"""
+    r=tmp_path/'asf_c73_00008'
+    r.mkdir()
+    with open(str(r/'rPARAMS.py'),'w') as handle:
+        handle.write("rP_NDAYS='100'\nrP_YEAR_MAX='20'\n")
+    f90nml.write({'namdom':{'rn_rdt':86400.}},str(r/'namelist_cfg'))
+    with open(str(r/'time.step'),'w') as handle:
+        handle.write(str(kt)+'\n')
+    with open(str(r/'time.year.step'),'w') as handle:
+        handle.write('year=1\n')
+    t=time.time()-age
+    os.utime(str(r/'time.step'),(t,t))
+    return str(r)
+
+def test_stalled(tmp_path):
+    r=run(tmp_path,50,2*monitorNEMO.STALL)
+    line,stalled=monitorNEMO.Member(r).status(time.time())
+    assert stalled and 'STALLED' in line and ' 50.0%' in line
+
+def test_pending_job_is_not_a_stall(tmp_path):
+    r=run(tmp_path,50,2*monitorNEMO.STALL)
+    line,stalled=monitorNEMO.Member(r).status(time.time(),{r:set(['PENDING'])})
+    assert not stalled and '(pending)' in line and 'STALLED' not in line
+    #the next job waiting while this one has stopped moving is still a stall
+    line,stalled=monitorNEMO.Member(r).status(time.time(),{r:set(['PENDING','RUNNING'])})
+    assert stalled
+
+def test_post(tmp_path):
+    r=run(tmp_path,100,2*monitorNEMO.STALL)
+    line,stalled=monitorNEMO.Member(r).status(time.time())
+    assert not stalled and '(post)' in line
+
+def test_queued(tmp_path,monkeypatch):
+    b=tmp_path/'bin'
+    b.mkdir()
+    with open(str(b/'squeue'),'w') as handle:
+        handle.write('#!/bin/bash\necho "PENDING /x/a/"\necho "RUNNING /x/a"\necho "PENDING /x/b"\n')
+    os.chmod(str(b/'squeue'),os.stat(str(b/'squeue')).st_mode | stat.S_IEXEC)
+    monkeypatch.setenv('PATH',str(b)+os.pathsep+os.environ['PATH'])
+    assert monitorNEMO.queued()=={'/x/a':set(['PENDING','RUNNING']),'/x/b':set(['PENDING'])}
+    monkeypatch.setenv('PATH',str(tmp_path/'none'))
+    assert monitorNEMO.queued()=={}
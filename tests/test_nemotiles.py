@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from nemotiles import TiledFile
+
+def fields():
+    rng=np.random.default_rng(1)
+    return {'tn':(('time_counter','nav_lev','y','x'),rng.random((2,5,7,9)).astype('f4')),
+            'gdept_1d':(('nav_lev',),np.arange(5,dtype='f8'))}
+
+def test_tiledfile(tmp_path,tiles):
+    base=str(tmp_path/'x_00000010_restart')
+    f=fields()
+    tiles(base,f,3,2)
+    tf=TiledFile(base,6)
+    tn=f['tn'][1]
+    assert tf.dimensions=={'x':9,'y':7,'nav_lev':5,'time_counter':2}
+    assert tf['tn'].shape==(2,5,7,9)
+    assert (tf['tn'][...]==tn).all() and (tf['tn'][:]==tn).all()
+    assert (tf['tn'][1,2]==tn[1,2]).all()
+    assert (tf['tn'][0,:,2:6,1:8:3]==tn[0,:,2:6,1:8:3]).all()
+    assert (tf['tn'][-1,...,-1]==tn[-1,...,-1]).all()
+    assert (tf['gdept_1d'][1:4]==f['gdept_1d'][1][1:4]).all()
+    assert tf['tn'][0,0,3:3,:].shape==(0,9)
+
+def test_only_the_tiles_needed_are_read(tmp_path,tiles):
+    base=str(tmp_path/'x_00000010_restart')
+    tiles(base,fields(),3,2)
+    tf=TiledFile(base,6)
+    #a column is in one tile, a row crosses three
+    tf['tn'][0,:,5,7]
+    assert tf.nread==1
+    tf['tn'][0,0,2,:]
+    assert tf.nread==4
+    tf['gdept_1d'][:]
+    assert tf.nread==5
+
+def test_missing_tiles(tmp_path,tiles):
+    base=str(tmp_path/'x_00000010_restart')
+    f=fields()
+    tiles(base,f,3,2,missing=[0,5])
+    tf=TiledFile(base,6)
+    tn=tf['tn'][...]
+    assert (tn[:,:,:4,:3]==-1).all() and (tn[:,:,4:,6:]==-1).all()
+    assert (tn[:,:,:4,3:]==f['tn'][1][:,:,:4,3:]).all()
+    with pytest.raises(AssertionError):
+        tf['tn'][0,0,7,0]
+    with pytest.raises(AssertionError):
+        TiledFile(str(tmp_path/'none'),6)
@@ -0,0 +1,47 @@
+import os
+import f90nml
+
+NML='''!a comment that has to stay
+&namrun
+   nn_it000 = 1     ! first time step
+   nn_itend = 5840
+/
+&namdom
+   rn_rdt = 5400.
+/
+'''
+
+def test_nmlstack(setup):
+    #later patches win, groups and variables are merged, whatever their case
+    s=setup.nmlstack([{'namrun':{'nn_itend':10,'nn_stock':10}},None,{'NAMRUN':{'NN_ITEND':20}},{'namdom':{'rn_rdt':600.}}])
+    assert s=={'namrun':{'nn_itend':20,'nn_stock':10},'namdom':{'rn_rdt':600.}}
+    assert setup.nmlstack([])=={}
+
+def test_nmlpatch(setup,tmp_path,capsys):
+    ref=str(tmp_path/'namelist_ref')
+    with open(ref,'w') as handle:
+        handle.write(NML)
+    outs=[str(tmp_path/'namelist_cfg'),str(tmp_path/'namelist_cfg_copy')]
+    setup.nmlpatch(ref,[{'namrun':{'nn_itend':10}},{'namrun':{'nn_itend':20,'nn_stock':20}},{'namnope':{'ln_x':True}}],outs)
+    out=capsys.readouterr().out
+    assert 'namrun/nn_stock isn\'t in' in out and 'namelist group namnope isn\'t in' in out
+    nml=f90nml.read(outs[0])
+    assert (nml['namrun']['nn_it000'],nml['namrun']['nn_itend'],nml['namrun']['nn_stock'],nml['namdom']['rn_rdt'])==(1,20,20,5400.)
+    assert nml['namnope']['ln_x']==True
+    with open(outs[0],'r') as handle:
+        text=handle.read()
+    #patched in place, the comments stay
+    assert text.startswith('!a comment that has to stay') and '! first time step' in text
+    with open(outs[1],'r') as handle:
+        assert handle.read()==text
+    assert not os.path.exists(outs[0]+'_new')
+
+def test_nmlpatch_in_place(setup,tmp_path):
+    ref=str(tmp_path/'namelist_cfg')
+    with open(ref,'w') as handle:
+        handle.write(NML)
+    setup.nmlpatch(ref,[],[ref])
+    with open(ref,'r') as handle:
+        assert handle.read()==NML
+    setup.nmlpatch(ref,[{'namdom':{'rn_rdt':600.}}],[ref])
+    assert f90nml.read(ref)['namdom']['rn_rdt']==600.
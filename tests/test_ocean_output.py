@@ -0,0 +1,60 @@
+import os
+import shutil
+import subprocess
+import sys
+import ocean_output
+
+SAMPLE=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),'asf_c73_00008','ocean.output.0095')
+
+def test_parse_sample():
+    ev=list(ocean_output.parse(SAMPLE))
+    kinds=[e[1] for e in ev]
+    assert (kinds.count('restart'),kinds.count('mpp'),kinds.count('error'))==(1,4,0)
+    assert (27,'open','','domain_cfg.nc',0,0,'READ') in ev
+    assert (4291,'restart','','',4161000,0,'') in ev
+    assert (2386,'fld_read','utau','',4117201,4,'0096/04/21') in ev
+    assert (60,'mpp','ocean','',0,1024,'') in ev
+    assert (30,'warning','','',0,0,'iom_nf90_getatt: no attribute cn_cfg found') in ev
+    assert [e[0] for e in ev]==sorted([e[0] for e in ev])
+
+def test_parse_alerts(tmp_path):
+    f=str(tmp_path/'ocean.output')
+    with open(f,'w') as handle:
+        handle.write(' ===>>> : W A R N I N G\n ===============\n\n  something odd\n')
+        handle.write('   Namelist namrun\n      jpni =   32\n')
+        handle.write(' ===>>> : E R R O R\n')
+    assert list(ocean_output.parse(f))==[(1,'warning','','',0,0,'something odd'),(5,'namelist','namrun','',0,0,''),
+                                         (6,'mpp','jpni','',0,32,''),(7,'error','','',0,0,'')]
+
+def test_index(tmp_path):
+    run=str(tmp_path/'asf_c73_00008')
+    os.makedirs(run+'/OUTNEMO_0095')
+    shutil.copy(SAMPLE,run+'/OUTNEMO_0095/ocean.output.0095')
+    with open(run+'/ocean.output.0096','w') as handle:
+        handle.write(' ===>>> : E R R O R\n\n  blew up\n')
+    r,todo,nev=ocean_output.index(run)
+    assert todo==[95,96] and nev==len(list(ocean_output.parse(SAMPLE)))+1
+    idx=ocean_output.load(run)
+    assert sorted(idx['files'])==[95,96]
+    assert [e['text'] for e in ocean_output.select(idx,'error')]==['blew up']
+    assert [e['kt'] for e in ocean_output.select(idx,'restart',95)]==[4161000]
+    assert len(ocean_output.select(idx,'open',95,file='domain_cfg.nc'))==[e[3] for e in ocean_output.parse(SAMPLE) if e[1]=='open'].count('domain_cfg.nc')
+    #nothing changed, nothing read
+    assert ocean_output.index(run)[1]==[]
+    #year 96 ran again and finished, year 95 is gone
+    with open(run+'/ocean.output.0096','w') as handle:
+        handle.write(' rst_write : write oce restart file    kt =    4196000\n')
+    os.remove(run+'/OUTNEMO_0095/ocean.output.0095')
+    r,todo,nev=ocean_output.index(run)
+    assert sorted(todo)==[95,96] and nev==1
+    idx=ocean_output.load(run)
+    assert list(idx['files'])==[96] and ocean_output.select(idx,'error')==[]
+
+def test_summary(tmp_path):
+    run=str(tmp_path)
+    shutil.copy(SAMPLE,run+'/ocean.output.0095')
+    open(run+'/ocean.output.0096','w').close()
+    out=subprocess.run([sys.executable,ocean_output.__file__,'summary',run],capture_output=True,text=True)
+    assert out.returncode==0,out.stderr
+    assert out.stdout.strip().endswith('years that did not write a restart (did not finish): 96')
+    assert os.path.exists(run+'/'+ocean_output.IDX)
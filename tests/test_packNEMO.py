@@ -0,0 +1,123 @@
+import os
+import sys
+import glob
+import f90nml
+import pytest
+import packNEMO
+
+def test_modelday():
+    assert packNEMO.modelday('00010101',0)==0
+    assert packNEMO.modelday('00020101',0)==365
+    assert packNEMO.modelday('00011231',0)==364
+    assert packNEMO.modelday('00020101',30)==360
+    assert packNEMO.modelday('00010330',30)==89
+    assert packNEMO.modelday('20000301',1)-packNEMO.modelday('20000228',1)==2
+    assert packNEMO.modelday('19000301',1)-packNEMO.modelday('19000228',1)==1
+
+def stretch(files):
+    """a 2 year stretch of 10 steps a year (365 days, noleap) that has finished, in the current folder"""
+    os.makedirs(packNEMO.HOLD)
+    with open(packNEMO.HOLD+'stretch','w') as handle:
+        handle.write('1 2 10\n')
+    f90nml.write({'namrun':{'nn_it000':1,'nn_itend':20,'nn_leapy':0},'namdom':{'rn_rdt':3153600.}},packNEMO.HOLD+'namelist_cfg')
+    for f in files+['x_00000010_restart.nc','x_00000020_restart.nc','ocean.output']:
+        open(f,'w').close()
+
+def test_year(tmp_path,monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    stretch(['x_1y_00010101_00011231_grid_T.nc','x_1y_00020101_00021231_grid_T.nc'])
+    packNEMO.year(0)
+    assert sorted([f for f in os.listdir('.') if f.endswith('.nc')])==['x_00000010_restart.nc','x_1y_00010101_00011231_grid_T.nc']
+    assert f90nml.read('namelist_cfg')['namrun']['nn_itend']==10
+    #postNEMO.py moved the first year's away
+    os.remove('x_00000010_restart.nc')
+    os.remove('x_1y_00010101_00011231_grid_T.nc')
+    packNEMO.year(1)
+    assert sorted([f for f in os.listdir('.') if f.endswith('.nc')])==['x_00000020_restart.nc','x_1y_00020101_00021231_grid_T.nc']
+    assert f90nml.read('namelist_cfg')['namrun']['nn_it000']==11
+    assert not os.path.exists(packNEMO.HOLD)
+
+def test_year_stops_on_a_file_over_two_years(tmp_path,monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    stretch(['x_1y_00010101_00021231_grid_T.nc'])
+    with pytest.raises(SystemExit):
+        packNEMO.year(0)
+    assert not os.path.exists(packNEMO.HOLD)
+    assert os.path.exists('ocean.output')
+
+def test_year_stops_without_a_restart(tmp_path,monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    stretch([])
+    os.remove('x_00000020_restart.nc')
+    os.remove('x_00000010_restart.nc')
+    with pytest.raises(SystemExit):
+        packNEMO.year(0)
+
+def folder(it000=1):
+    """a run folder set up by preNEMO.py, 10 steps a year (365 days)"""
+    with open('rPARAMS.py','w') as handle:
+        handle.write("rP_NDAYS='365'\n")
+    f90nml.write({'namrun':{'cn_exp':'x','nn_it000':it000,'nn_itend':10,'nn_leapy':0},'namdom':{'rn_rdt':3153600.}},'namelist_cfg',force=True)
+    for f in ['nemo.exe','domain_cfg.nc','ocean.output','time.step']:
+        open(f,'w').close()
+
+def test_nstep(tmp_path,monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delitem(sys.modules,'rPARAMS',raising=False)
+    folder()
+    assert packNEMO.nstep(f90nml.read('namelist_cfg'))==10
+    monkeypatch.delitem(sys.modules,'rPARAMS')
+    with pytest.raises(AssertionError):
+        packNEMO.nstep({'namdom':{'rn_rdt':7000.}})
+
+def test_launch_hand(tmp_path,monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delitem(sys.modules,'rPARAMS',raising=False)
+    folder()
+    packNEMO.launch(2,1)
+    #the inputs are linked in, what nemo.exe writes for itself isn't
+    assert os.path.islink(packNEMO.RUN+'nemo.exe') and os.path.islink(packNEMO.RUN+'domain_cfg.nc')
+    assert not os.path.lexists(packNEMO.RUN+'ocean.output') and not os.path.lexists(packNEMO.RUN+'time.step')
+    nml=f90nml.read(packNEMO.RUN+'namelist_cfg')
+    assert (nml['namrun']['nn_it000'],nml['namrun']['nn_itend'],nml['namrun']['nn_stock'])==(1,20,10)
+    assert f90nml.read('namelist_cfg')['namrun']['nn_itend']==10
+    #what the stretch wrote
+    for f in ['x_00000010_restart_0000.nc','x_00000020_restart_0000.nc','x_00000020_restart_0001.nc','x_1y_00010101_00011231_grid_T.nc','ocean.output']:
+        open(packNEMO.RUN+f,'w').close()
+    packNEMO.hand()
+    assert not os.path.exists(packNEMO.RUN)
+    assert os.path.exists('x_1y_00010101_00011231_grid_T.nc') and os.path.exists('x_00000010_restart_0000.nc')
+    assert sorted(os.listdir(packNEMO.RST))==['x_00000020_restart_0000.nc','x_00000020_restart_0001.nc']
+    assert os.stat(packNEMO.RST+'x_00000020_restart_0000.nc').st_ino==os.stat('x_00000020_restart_0000.nc').st_ino
+    with open(packNEMO.HOLD+'stretch','r') as handle:
+        assert handle.read()=='1 2 10\n'
+    #the next launch carries on from the kept tiles even once the posts have rebuilt them away
+    for f in glob.glob('x_0000002*_restart_*.nc'):
+        os.remove(f)
+    packNEMO.launch(1,3)
+    nml=f90nml.read(packNEMO.RUN+'namelist_cfg')
+    assert (nml['namrun']['nn_it000'],nml['namrun']['nn_itend'],nml['namrun']['ln_rstart'])==(21,30,True)
+    assert (nml['namrun']['cn_ocerst_in'],nml['namrun']['cn_ocerst_indir'])==('x_00000020_restart',os.path.abspath(packNEMO.RST))
+
+def test_launch_stops_without_tiles(tmp_path,monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delitem(sys.modules,'rPARAMS',raising=False)
+    folder()
+    with pytest.raises(SystemExit):
+        packNEMO.launch(1,3)
+    #preNEMO.py set it up from a rebuilt restart
+    folder(21)
+    packNEMO.launch(1,3)
+    assert f90nml.read(packNEMO.RUN+'namelist_cfg')['namrun']['nn_itend']==30
+
+def test_launch_stops_on_unsplit_files(tmp_path,monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delitem(sys.modules,'rPARAMS',raising=False)
+    folder()
+    with open('file_def_nemo-oce.xml','w') as handle:
+        handle.write('<file_definition output_freq="1mo"><file id="f1" name_suffix="_grid_T"/></file_definition>\n')
+    packNEMO.launch(1,1)
+    with pytest.raises(SystemExit):
+        packNEMO.launch(2,1)
+    packNEMO.yearly('file_def_nemo-oce.xml')
+    packNEMO.launch(2,1)
@@ -0,0 +1,90 @@
+import os
+import subprocess
+import sys
+import f90nml
+import profileNEMO
+
+TIMING='''
+ Total timing (sum) :
+ --------------------
+Elapsed Time (s)  CPU Time (s)
+       2310.483      2287.012
+
+ Section             Elap. Time(s)  Elap. Time(%)  CPU Time(s)  CPU Time(%)  CPU/Elap Max elap(%)  Min elap(%)  Freq
+ stp                   9999.0000    99.04          9999.000     99.14         0.99      99.12      98.9     1.00
+
+ Averaged timing on all processors :
+ -----------------------------------
+ Section             Elap. Time(s)  Elap. Time(%)  CPU Time(s)  CPU Time(%)  CPU/Elap Max elap(%)  Min elap(%)  Freq
+ stp                   {stp}    99.04          2267.421     99.14         0.99      99.12      98.9     1.00
+ tra_adv_fct             {adv}    21.05           480.112     20.99         0.99      22.43      19.87     1.00
+ dia_ptr                 {ptr}     0.00             0.000      0.00         0.00       0.00       0.00     0.00
+
+ Detailed timing for proc :    0
+ --------------------------
+ Section             Elap. Time(s)  Elap. Time(%)  CPU Time(s)  CPU Time(%)  CPU/Elap Max elap(%)  Min elap(%)  Freq
+ stp                   8888.0000    99.04          8888.000     99.14         0.99      99.12      98.9     1.00
+'''
+
+def folder(tmp_path):
+    r=str(tmp_path/'asf_c73_00008')
+    os.makedirs(r)
+    with open(r+'/rPARAMS.py','w') as handle:
+        handle.write("rP_NDAYS='10'\nrP_YEAR_MAX='20'\n")
+    f90nml.write({'namrun':{'nn_it000':1,'nn_itend':10},'namdom':{'rn_rdt':86400.},'namctl':{'ln_timing':False}},r+'/namelist_cfg')
+    f90nml.write({'namtra_adv':{'ln_traadv_fct':True},'namctl':{'ln_timing':False}},r+'/namelist_ref')
+    return r
+
+def timing(f,stp,adv,ptr='0.1D+01'):
+    with open(f,'w') as handle:
+        handle.write(TIMING.format(stp=stp,adv=adv,ptr=ptr))
+
+def test_parse(tmp_path):
+    f=str(tmp_path/'timing.output')
+    timing(f,'2288.3251','486.1000')
+    assert profileNEMO.parse(f)=={'stp':2288.3251,'tra_adv_fct':486.1,'dia_ptr':1.}
+    #no averaged table (a single processor), the first one
+    with open(f,'w') as handle:
+        handle.write(TIMING.split(' Averaged')[0])
+    assert profileNEMO.parse(f)=={'stp':9999.}
+
+def test_switch(tmp_path,monkeypatch):
+    monkeypatch.chdir(folder(tmp_path))
+    profileNEMO.switch(3,2,[1,4])
+    assert f90nml.read('namelist_cfg')['namctl']['ln_timing']==True
+    profileNEMO.switch(5,2,[1,4])
+    assert f90nml.read('namelist_cfg')['namctl']['ln_timing']==False
+    #production is rP_YEAR_MAX-9 or production.start
+    profileNEMO.switch(11,1,['production'])
+    assert f90nml.read('namelist_cfg')['namctl']['ln_timing']==True
+    with open('production.start','w') as handle:
+        handle.write('8\n')
+    profileNEMO.switch(11,1,['production'])
+    assert f90nml.read('namelist_cfg')['namctl']['ln_timing']==False
+    profileNEMO.switch(7,2,['production'])
+    assert f90nml.read('namelist_cfg')['namctl']['ln_timing']==True
+
+def test_keep_timed(tmp_path,monkeypatch):
+    r=folder(tmp_path)
+    monkeypatch.chdir(r)
+    timing('timing.output','100.0','20.0')
+    profileNEMO.keep(2,1,'spinup')
+    assert not os.path.exists('timing.output')
+    assert sorted(os.listdir('timing/0002_spinup'))==['namelist_cfg','namelist_ref','timing.output','years']
+    #a packed launch of two years, in production with the advection scheme changed
+    f90nml.patch('namelist_cfg',{'namrun':{'nn_it000':11,'nn_itend':30}},out_path='namelist_cfg_new')
+    os.rename('namelist_cfg_new','namelist_cfg')
+    f90nml.patch('namelist_ref',{'namtra_adv':{'ln_traadv_fct':False}},out_path='namelist_ref_new')
+    os.rename('namelist_ref_new','namelist_ref')
+    timing('timing.output','300.0','100.0','0.')
+    profileNEMO.keep(12,2,'production')
+    tims=profileNEMO.timed(r)
+    assert tims==[(2,'spinup',{'stp':10.,'tra_adv_fct':2.,'dia_ptr':0.1}),(12,'production',{'stp':15.,'tra_adv_fct':5.,'dia_ptr':0.})]
+    assert profileNEMO.average([tims[0][2],{'stp':20.}])=={'stp':15.,'tra_adv_fct':1.,'dia_ptr':0.05}
+    out=subprocess.run([sys.executable,profileNEMO.__file__,'diff',r],capture_output=True,text=True)
+    assert out.returncode==0,out.stderr
+    lines=out.stdout.splitlines()
+    #most extra cost first
+    assert [l.split()[0] for l in lines[1:4]]==['stp','tra_adv_fct','dia_ptr']
+    assert '    namtra_adv/ln_traadv_fct: True -> False' in lines
+    assert not [l for l in lines if 'nn_it' in l]
@@ -0,0 +1,78 @@
+import os
+import pytest
+
+MANIFEST='''
+workfol: /x/rnemoARCHER2
+defaults:
+  rP_CONFIG: asf_c{NUM}
+  rP_CONFIG_TYPE: ASF
+  rP_CASE: '00008'
+  rP_NDAYS: 365
+  WCONFIG: /x/input
+  NEMOdir: /x/nemo/
+  NEMOexe: /x/nemo.exe
+  DOMAINcfg: /x/make_domain_cfg.exe
+  BFILE: '{WCONFIG}/bathy_c{NUM}.nc'
+  TSFILE: '{WCONFIG}/TS.nc'
+  FLXFCE: '{WCONFIG}/flxforce_case{flx}_grid_.nc'
+  extdomaincfg: [hacked, '{WCONFIG}/hack_c{NUM}.py']
+  rP_nml_patch:
+    namsbc: {ln_isf: false}
+    namtra_eiv: {ln_ldfeiv: true}
+members:
+  - {NUM: 73, flx: '18'}
+  - NUM: 74
+    flx: '19'
+    ypack: 5
+    rP_nml_patch:
+      namsbc: {nn_fsbc: 2}
+      namdom: {rn_rdt: 600.}
+'''
+
+def manifest(tmp_path,text):
+    f=str(tmp_path/'ensemble.yaml')
+    with open(f,'w') as handle:
+        handle.write(text)
+    return f
+
+def test_members(setup,tmp_path):
+    m=setup.readmanifest(manifest(tmp_path,MANIFEST))
+    assert [x['rP_CONFIG'] for x in m]==['asf_c73','asf_c74']
+    assert m[0]['workfol']=='/x/rnemoARCHER2/'
+    assert m[1]['BFILE']=='/x/input/bathy_c74.nc'
+    assert m[1]['FLXFCE']=='/x/input/flxforce_case19_grid_.nc'
+    assert m[1]['extdomaincfg']==['hacked','/x/input/hack_c74.py']
+    #optional settings get their defaults, the template variables don't get through
+    assert (m[0]['ypack'],m[1]['ypack'],m[0]['flxlayout'],m[0]['submit'],m[0]['zarr'])==(1,5,'yearly','',{})
+    assert 'NUM' not in m[0] and 'flx' not in m[0]
+    #merged group by group, variable by variable
+    assert m[0]['rP_nml_patch']=={'namsbc':{'ln_isf':False},'namtra_eiv':{'ln_ldfeiv':True}}
+    assert m[1]['rP_nml_patch']=={'namsbc':{'ln_isf':False,'nn_fsbc':2},'namtra_eiv':{'ln_ldfeiv':True},'namdom':{'rn_rdt':600.}}
+    assert m[1]['rP_nml_domcfgpatch']=={}
+
+def test_all_the_problems_together(setup,tmp_path,capsys):
+    bad=MANIFEST.replace("  - {NUM: 73, flx: '18'}","  - {NUM: 73, flx: '18', ypack: 0, decomp: 40, submit: goNEMOcfl.sh, colour: [red]}\n  - {NUM: 73, flx: '18'}")
+    bad=bad.replace("  rP_CASE: '00008'","  rP_CASE: 8\n  speed: fast")
+    #3 members with rP_CASE wrong, 2 of them the same name
+    with pytest.raises(ValueError,match='9 problem'):
+        setup.readmanifest(manifest(tmp_path,bad))
+    out=capsys.readouterr().out
+    for e in ['defaults: unknown setting speed','member 0 (asf_c73): ypack should be a whole number','member 0 (asf_c73): decomp should be',
+              'member 0 (asf_c73): can only submit goNEMOcfl.sh with cfl: true','member 0 (asf_c73): unknown setting colour',
+              'member 2 (asf_c74): rP_CASE should be a string','asf_c73_8 appears 2 times']:
+        assert e in out
+
+def test_duplicates_and_templates(setup,tmp_path,capsys):
+    with pytest.raises(ValueError):
+        setup.readmanifest(manifest(tmp_path,MANIFEST.replace("NUM: 74","NUM: 73")))
+    assert 'asf_c73_00008 appears 2 times' in capsys.readouterr().out
+    with pytest.raises(ValueError):
+        setup.readmanifest(manifest(tmp_path,MANIFEST.replace("{NUM: 73, flx: '18'}","{NUM: 73}")))
+    assert "member 0: unknown template variable 'flx'" in capsys.readouterr().out
+    with pytest.raises(ValueError,match='non-empty'):
+        setup.readmanifest(manifest(tmp_path,MANIFEST[:MANIFEST.index('members:')]+'members: []\n'))
+
+def test_the_ensemble_manifest(setup):
+    f=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),'ensemble_asf_00008.yaml')
+    m=setup.readmanifest(f)
+    assert len(m)==20 and len(set([x['rP_CONFIG'] for x in m]))==20
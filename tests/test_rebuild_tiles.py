@@ -0,0 +1,60 @@
+import os
+import contextlib as ctx
+import numpy as np
+import netCDF4
+import rebuild_tiles
+
+def fields():
+    rng=np.random.default_rng(0)
+    return {'tn':(('time_counter','nav_lev','y','x'),rng.random((2,5,7,9)).astype('f4')),
+            'mask':(('y','x'),np.arange(63,dtype='i4').reshape(7,9)),
+            'gdept_1d':(('nav_lev',),np.arange(5,dtype='f8'))}
+
+def test_tileinfo(tmp_path,tiles):
+    base=str(tmp_path/'mesh_mask')
+    tiles(base,fields(),3,2)
+    info=rebuild_tiles.tileinfo([base+'_0000.nc',base+'_0004.nc'])
+    #the interior of each tile, x is split 3,3,3 and y 4,3
+    assert info[0][1]=={'x':slice(0,3),'y':slice(0,4)} and info[0][2]=={'x':slice(0,3),'y':slice(0,4)}
+    assert info[1][1]=={'x':slice(1,4),'y':slice(1,4)} and info[1][2]=={'x':slice(3,6),'y':slice(4,7)}
+
+def test_rebuild(tmp_path,tiles,monkeypatch):
+    base=str(tmp_path/'x_00000010_restart')
+    f=fields()
+    tiles(base,f,3,2,missing=[2])
+    #small slabs so tn is pieced together a few levels at a time
+    monkeypatch.setattr(rebuild_tiles,'SLAB',200)
+    monkeypatch.setattr(rebuild_tiles,'CHUNKS',str(tmp_path/'none'))
+    assert rebuild_tiles.rebuild(base,6,nproc=2,deflate=1)==base+'.nc'
+    assert not os.path.exists(base+'.nc.tmp')
+    with ctx.closing(netCDF4.Dataset(base+'.nc')) as nc:
+        nc.set_auto_mask(False)
+        assert not [a for a in nc.ncattrs() if a.startswith('DOMAIN_')]
+        assert nc.variables['tn'].shape==(2,5,7,9)
+        tn,mask=nc.variables['tn'][...],nc.variables['mask'][...]
+        #the missing tile is filled in
+        assert (tn[:,:,:4,6:]==-1).all() and (mask[:4,6:]==0).all()
+        tn[:,:,:4,6:]=f['tn'][1][:,:,:4,6:]
+        mask[:4,6:]=f['mask'][1][:4,6:]
+        assert (tn==f['tn'][1]).all() and (mask==f['mask'][1]).all()
+        assert (nc.variables['gdept_1d'][...]==f['gdept_1d'][1]).all()
+        assert nc.variables['tn'].chunking()==[1,1,7,9] and nc.variables['tn'].filters()['zlib']
+
+def test_rebuild_chunksize(tmp_path,tiles,monkeypatch):
+    base=str(tmp_path/'mesh_mask')
+    tiles(base,fields(),3,2)
+    monkeypatch.setattr(rebuild_tiles,'CHUNKS',str(tmp_path/'none'))
+    #-c: a level is 7*9*4 bytes, cut down in the biggest tiled dimension until it's at most 64
+    rebuild_tiles.rebuild(base,6,nproc=1,csize=64)
+    with ctx.closing(netCDF4.Dataset(base+'.nc')) as nc:
+        assert nc.variables['tn'].chunking()==[1,1,4,3] and not nc.variables['tn'].filters()['zlib']
+        assert (nc.variables['tn'][...]==fields()['tn'][1]).all()
+
+def test_chunking(tmp_path,monkeypatch):
+    monkeypatch.setattr(rebuild_tiles,'CHUNKS',str(tmp_path/'chunks'))
+    dims,shape=('time_counter','nav_lev','y','x'),(1,75,1000,1200)
+    assert rebuild_tiles.chunking(dims,shape,['x','y'])==[1,1,1000,1200]
+    assert rebuild_tiles.chunking(dims,shape,['x','y'],4,1024**2)==[1,1,500,300]
+    with open(str(tmp_path/'chunks'),'w') as handle:
+        handle.write('x 400\ny 250\nz 5\n')
+    assert rebuild_tiles.chunking(dims,shape,['x','y'])==[1,5,250,400]
@@ -0,0 +1,118 @@
+import os
+import numpy as np
+import netCDF4
+import pytest
+import restarts
+
+def test_record_fills_the_years_before(tmp_path):
+    run=str(tmp_path)
+    restarts.record(run,3,30,'hot',1234,'OUTNEMO_0003/restarts/x_00000030_restart.nc')
+    assert os.path.getsize(run+'/'+restarts.IDX)==3*restarts.REC
+    assert restarts.lookup(run,1) is None
+    assert restarts.lookup(run,2) is None
+    assert restarts.lookup(run,3)==(30,'hot',1234,os.path.join(run,'OUTNEMO_0003/restarts/x_00000030_restart.nc'))
+    assert restarts.lookup(run,4) is None
+    assert restarts.lookup(run,0) is None
+
+def test_record_in_place(tmp_path):
+    run=str(tmp_path)
+    restarts.record(run,2,20,'hot',2000,'b.nc')
+    restarts.record(run,1,10,'hot',1000,'a.nc')
+    restarts.record(run,2,20,'deflated',500,'b.nc')
+    assert os.path.getsize(run+'/'+restarts.IDX)==2*restarts.REC
+    assert restarts.lookup(run,1)[:3]==(10,'hot',1000)
+    assert restarts.lookup(run,2)[:3]==(20,'deflated',500)
+    assert [r[0] for r in restarts.records(run)]==[1,2]
+
+def test_record_path_too_long(tmp_path):
+    with pytest.raises(AssertionError):
+        restarts.record(str(tmp_path),1,10,'hot',1,'x'*restarts.REC)
+
+def test_deflate_round_trip(tmp_path,nc):
+    t=np.ma.masked_invalid(np.where(np.arange(24).reshape(2,3,4)%5==0,np.nan,np.arange(24.).reshape(2,3,4)))
+    f=nc(tmp_path/'r.nc',{'t':None,'y':3,'x':4},{'tn':(('t','y','x'),t),'kt':((),np.float64(30)),
+         'mbkt':(('y','x'),np.arange(12,dtype=np.int32).reshape(3,4))},fmt='NETCDF3_64BIT_OFFSET',attrs={'title':'r'})
+    with netCDF4.Dataset(f) as a:
+        a.set_auto_maskandscale(False)
+        before={v:a.variables[v][...] for v in a.variables}
+    assert not restarts.deflated(f)
+    restarts.deflate(f)
+    assert restarts.deflated(f)
+    assert not os.path.exists(f[:-3]+'.deflate.nc')
+    with netCDF4.Dataset(f) as b:
+        b.set_auto_maskandscale(False)
+        assert b.title=='r'
+        assert b.dimensions['t'].isunlimited()
+        for v,a in before.items():
+            assert b.variables[v].dtype==a.dtype
+            np.testing.assert_array_equal(b.variables[v][...],a)
+
+def mkrun(tmp_path,nc,years):
+    """run folder x, 10 steps a year for 8 years, with the restarts of years"""
+    run=tmp_path/'x'
+    run.mkdir()
+    with open(str(run/'rPARAMS.py'),'w') as handle:
+        handle.write("rP_NDAYS='10'\nrP_YEAR_MAX='8'\n")
+    with open(str(run/'namelist_cfg'),'w') as handle:
+        handle.write('&namdom\n    rn_rdt = 86400.0\n/\n')
+    for y in years:
+        restart(run,nc,y)
+    return str(run)
+
+def restart(run,nc,y):
+    f=os.path.join(str(run),restarts.rstpath('x',y,10))
+    if not os.path.exists(os.path.dirname(f)):
+        os.makedirs(os.path.dirname(f))
+    return nc(f,{'t':None,'y':30,'x':40},{'tn':(('t','y','x'),np.zeros((1,30,40))+y)},fmt='NETCDF3_64BIT_OFFSET')
+
+def states(run):
+    return [(r[0],r[2]) for r in restarts.records(run)]
+
+def test_tidy(tmp_path,nc):
+    run=mkrun(tmp_path,nc,[1,2,3])
+    restarts.tidy(run)
+    assert states(run)==[(1,'deflated'),(2,'hot'),(3,'hot')]
+    assert restarts.deflated(os.path.join(run,restarts.rstpath('x',1,10)))
+    assert not restarts.deflated(os.path.join(run,restarts.rstpath('x',3,10)))
+    assert restarts.lookup(run,1)[2]==os.path.getsize(os.path.join(run,restarts.rstpath('x',1,10)))
+    #year 2's restart went before tidy got to it, 4 and 5 are new
+    os.remove(os.path.join(run,restarts.rstpath('x',2,10)))
+    restart(run,nc,4)
+    restart(run,nc,5)
+    restarts.tidy(run)
+    assert states(run)==[(1,'deflated'),(2,'missing'),(3,'deflated'),(4,'hot'),(5,'hot')]
+    #nothing new, nothing changes
+    restarts.tidy(run)
+    assert states(run)==[(1,'deflated'),(2,'missing'),(3,'deflated'),(4,'hot'),(5,'hot')]
+
+def test_thin(tmp_path,nc):
+    run=mkrun(tmp_path,nc,[1,2,3,4,5,6])
+    restarts.tidy(run)
+    assert states(run)==[(1,'deflated'),(2,'deflated'),(3,'deflated'),(4,'deflated'),(5,'hot'),(6,'hot')]
+    restarts.thin(run,3)
+    #every 3rd year, the last spin up year (8-10) is before the run starts, the newest KEEP are hot
+    assert states(run)==[(1,'deleted'),(2,'deleted'),(3,'deflated'),(4,'deleted'),(5,'hot'),(6,'hot')]
+    assert not os.path.exists(os.path.join(run,restarts.rstpath('x',1,10)))
+    assert restarts.lookup(run,1)[2]==0
+
+def test_find_and_newest(tmp_path,nc):
+    run=mkrun(tmp_path,nc,[])
+    assert restarts.newest(run) is None
+    for y in [1,2,3,4]:
+        restart(run,nc,y)
+    #no index yet, from where the restarts are
+    assert restarts.newest(run)==(4,os.path.join(os.path.abspath(run),restarts.rstpath('x',4,10)))
+    restarts.tidy(run)
+    os.remove(os.path.join(run,restarts.rstpath('x',1,10)))
+    restarts.thin(run,5)
+    assert restarts.find(run,1,'x',10) is None
+    assert restarts.find(run,2,'x',10) is None
+    assert restarts.find(run,4,'x',10)==restarts.lookup(run,4)[3]
+    #year 5 isn't in the index yet
+    restart(run,nc,5)
+    assert restarts.find(run,5,'x',10)==os.path.join(os.path.abspath(run),restarts.rstpath('x',5,10))
+    assert restarts.newest(run)[0]==5
+    os.remove(os.path.join(run,restarts.rstpath('x',5,10)))
+    os.remove(os.path.join(run,restarts.rstpath('x',4,10)))
+    restarts.record(run,4,40,'missing',0,restarts.rstpath('x',4,10))
+    assert restarts.newest(run)[0]==3
@@ -0,0 +1,73 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import f90nml
+import scaleNEMO
+
+HELPERS=os.path.dirname(scaleNEMO.__file__)
+
+def rung(d,tstep,init=30.,nsteps=300):
+    """a rung of the ladder that took init seconds to start and tstep per step after that"""
+    os.makedirs(d)
+    with open(d+'/steps.log','w') as handle:
+        for kt in range(1,nsteps+1,10):
+            handle.write(str(1000+init+kt*tstep)+' '+str(kt)+'\n')
+
+def test_steptime(tmp_path):
+    d=str(tmp_path/'0128')
+    #a slow start (the first steps) isn't counted
+    rung(d,0.5)
+    with open(d+'/steps.log','a') as handle:
+        handle.write('garbage\n')
+    with open(d+'/steps.log','r') as handle:
+        s=handle.read()
+    with open(d+'/steps.log','w') as handle:
+        handle.write('1000 0\n1200 1\n'+s)
+    assert abs(scaleNEMO.steptime(d)-0.5)<1e-9
+
+def test_steptime_from_the_job(tmp_path):
+    d=str(tmp_path/'0256')
+    os.makedirs(d)
+    assert np.isnan(scaleNEMO.steptime(d))
+    for f,v in [('t.start','100'),('t.end','400'),('time.step','       300')]:
+        with open(d+'/'+f,'w') as handle:
+            handle.write(v+'\n')
+    assert scaleNEMO.steptime(d)==1.
+    with open(d+'/steps.log','w') as handle:
+        handle.write('100 1\n')
+    assert scaleNEMO.steptime(d)==1.
+
+def test_rungranks(tmp_path):
+    d=str(tmp_path)
+    assert scaleNEMO.rungranks(d,256)==256
+    with open(d+'/decomp.ranks','w') as handle:
+        handle.write('241 19 13\n')
+    assert scaleNEMO.rungranks(d,256)==241
+
+def test_fit():
+    curve=lambda n:0.02+100./n+0.001*np.log2(n)
+    ranks=[128,256,512,1024]
+    fitted=scaleNEMO.fit(ranks,[curve(n) for n in ranks])
+    assert np.allclose(fitted([128,384,2048]),curve(np.array([128,384,2048])))
+    #two rungs only fit a + b/n
+    fitted=scaleNEMO.fit([100,200],[1.1,0.6])
+    assert np.allclose(fitted(400),0.35)
+
+def test_main(tmp_path):
+    r=str(tmp_path)
+    with open(r+'/rPARAMS.py','w') as handle:
+        handle.write("rP_NDAYS='360'\n")
+    f90nml.write({'namdom':{'rn_rdt':86400.}},r+'/namelist_cfg')
+    os.makedirs(r+'/scaling')
+    with open(r+'/scaling/ladder','w') as handle:
+        handle.write('#cores ranks nodes jpni jpnj\n128 128 1 16 8\n256 256 2 16 16\n512 512 4 32 16\n1024 1024 8 32 32\n')
+    #360 steps a year and a serial part: 1 node makes 3 sypd, 2 nodes 5.6 and 4 nodes more but at a higher cost
+    for cores in [128,256,512]:
+        rung(r+'/scaling/'+str(cores).zfill(4),5.+75.*128/cores)
+    out=subprocess.run([sys.executable,os.path.join(HELPERS,'scaleNEMO.py')],cwd=r,capture_output=True,text=True)
+    assert out.returncode==0,out.stderr
+    assert 'not run/no steps' in out.stdout
+    assert 'cheapest that makes 5.0 sypd: 2 nodes (256 cores)' in out.stdout
+    out=subprocess.run([sys.executable,os.path.join(HELPERS,'scaleNEMO.py'),'100'],cwd=r,capture_output=True,text=True)
+    assert out.returncode==1 and 'none of the node counts' in out.stdout
@@ -0,0 +1,51 @@
+import os
+import netCDF4
+import numpy as np
+import streamNEMO
+
+def output(path,nc,t0,toce):
+    return nc(path,{'time_counter':None,'y':2,'x':3},{'time_counter':(('time_counter',),np.array([t0,t0+1.])),
+              'toce':(('time_counter','y','x'),toce),'nav_lat':(('y','x'),np.zeros((2,3),np.float32))})
+
+def test_foldsum(tmp_path,nc):
+    a=np.ma.masked_array(np.arange(12.).reshape(2,2,3),mask=np.zeros((2,2,3),bool))
+    a.mask[:,1,2]=True
+    s=str(tmp_path/'sum.nc')
+    assert streamNEMO.foldsum(s,output(tmp_path/'y1.nc',nc,0.,a),1)
+    assert streamNEMO.foldsum(s,output(tmp_path/'y2.nc',nc,2.,2*a),2)
+    with netCDF4.Dataset(s) as out:
+        assert out.years=='1 2' and int(out.nrec)==4
+        assert 'nav_lat' not in out.variables
+        t=out.variables['toce'][...]
+        np.testing.assert_allclose(t.filled(np.nan),np.ma.filled(3*a.sum(0),np.nan))
+        assert t.mask[1,2] and t.mask.sum()==1
+
+def test_foldsum_nothing_timed(tmp_path,nc):
+    f=nc(tmp_path/'y1.nc',{'y':2},{'nav_lat':(('y',),np.zeros(2))})
+    assert not streamNEMO.foldsum(str(tmp_path/'sum.nc'),f,1)
+    assert not (tmp_path/'sum.nc').exists()
+
+def test_mean_of_a_point_masked_in_some_records(tmp_path,nc):
+    #(0,0) is masked in the first record of year 1 only, (1,2) is land throughout
+    a=np.ma.masked_array(np.ones((2,2,3)),mask=np.zeros((2,2,3),bool))
+    a.mask[0,0,0]=True
+    a.mask[:,1,2]=True
+    os.makedirs(str(tmp_path/'stream'/'series'))
+    with open(str(tmp_path/'stream'/'series'/'0001.json'),'w') as handle:
+        handle.write('{}')
+    with open(str(tmp_path/'rPARAMS.py'),'w') as handle:
+        handle.write("rP_YEAR_MAX='100'\n")
+    s=str(tmp_path/'stream'/'sum_1m_grid_T.nc')
+    streamNEMO.foldsum(s,output(tmp_path/'y1.nc',nc,0.,a),1)
+    b=a.copy()
+    b.mask[0,0,0]=False
+    streamNEMO.foldsum(s,output(tmp_path/'y2.nc',nc,2.,3*b),2)
+    with netCDF4.Dataset(s) as out:
+        np.testing.assert_array_equal(out.variables['toce'+streamNEMO.NSUF][...],[[3,4,4],[4,4,0]])
+    f=[f for f in streamNEMO.finalize(str(tmp_path)) if '_prodmean_' in f][0]
+    with netCDF4.Dataset(f) as out:
+        m=out.variables['toce'][0]
+        #(1+3+3)/3 where a record is missing, (1+1+3+3)/4 elsewhere
+        np.testing.assert_allclose(m[0,0],7/3.,rtol=1e-6)
+        np.testing.assert_allclose(m[0,1],2.,rtol=1e-6)
+        assert m.mask[1,2] and m.mask.sum()==1
@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import telemetry
+
+#job 7 (2 nodes) packs years 1-2 into a launch then runs year 3 and is done at 500, job 8 (4 nodes) runs year 4
+LOG='''0 7 2 spinup 1 2 pre start
+10 7 2 spinup 1 2 pre end
+10 7 2 spinup 1 2 nemo start
+210 7 2 spinup 1 2 nemo end
+210 7 2 spinup 1 1 post start
+230 7 2 spinup 1 1 post end
+230 7 2 spinup 2 1 post start
+250 7 2 spinup 2 1 post end
+300 7 2 spinup 3 1 pre start
+305 7 2 spinup 3 1 pre end
+305 7 2 spinup 3 1 nemo start
+405 7 2 spinup 3 1 nemo end
+405 7 2 spinup 3 1 post start
+500 7 2 spinup 3 1 post end
+half a line
+1000 8 4 production 4 1 pre start
+1000 8 4 production 4 1 pre end
+1000 8 4 production 4 1 nemo start
+1100 8 4 production 4 1 nemo bogus
+1400 8 4 production 4 1 nemo end
+'''
+
+def run(tmp_path,log=LOG):
+    r=str(tmp_path/'asf_c73_00008')
+    os.makedirs(r)
+    with open(r+'/telemetry.log','w') as handle:
+        handle.write(log)
+    return r
+
+def test_records(tmp_path):
+    r=run(tmp_path)
+    recs=telemetry.records(r)
+    assert len(recs)==18
+    assert recs[0]==(0,'7',2,'spinup',1,2,'pre','start')
+    assert telemetry.records(str(tmp_path/'none'))==[]
+
+def test_years(tmp_path):
+    yrs=telemetry.years(run(tmp_path))
+    assert sorted(yrs)==[1,2,3,4]
+    #a launch of two years shares out its wall clock and steps, a post is its year's own
+    assert (yrs[1]['wall'],yrs[1]['nemo'],yrs[1]['pre'],yrs[1]['post'])==(150.,100.,5.,20.)
+    assert (yrs[2]['wall'],yrs[2]['post'])==(150.,20.)
+    #the last launch of a job runs to the job's last record
+    assert (yrs[3]['wall'],yrs[3]['post'])==(200.,95.)
+    assert (yrs[4]['phase'],yrs[4]['job'],yrs[4]['nodes'],yrs[4]['wall'],yrs[4]['nemo'])==('production','8',4,400.,400.)
+    assert 'post' not in yrs[4]
+
+def test_phases(tmp_path):
+    ph=telemetry.phases(telemetry.years(run(tmp_path)))
+    n,med,sypd,nhy,nh,slow=ph['spinup']
+    assert (n,med,sypd,slow)==(3,150.,576.,[])
+    assert np.isclose(nhy,2*500/3/3600.) and np.isclose(nh,2*500/3600.)
+    assert ph['production'][:2]==(1,400.)
+    #a year 1.5 times the median of its phase is slow
+    ph=telemetry.phases({1:{'phase':'spinup','nodes':1,'wall':100.},2:{'phase':'spinup','nodes':1,'wall':100.},
+                         3:{'phase':'spinup','nodes':1,'wall':151.},4:{'phase':'spinup','nodes':1,'wall':np.nan}})
+    assert ph['spinup'][0]==3 and ph['spinup'][5]==[3]
+
+def test_runme(tmp_path):
+    r=run(tmp_path)
+    with open(str(tmp_path/'runme'),'w') as handle:
+        handle.write('10\n'+r+'/\n')
+    #years 5-10 to go, 5 of them production (from production.start) at 4*400s, 1 spin up at the spin up median
+    with open(r+'/production.start','w') as handle:
+        handle.write('6\n')
+    out=subprocess.run([sys.executable,telemetry.__file__,str(tmp_path/'runme')],capture_output=True,text=True)
+    assert out.returncode==0,out.stderr
+    cost=2*500/3/3600.+5*4*400/3600.
+    assert '6 years to go, about '+str(round(cost))+' node hours' in out.stdout
+    assert out.stdout.strip().endswith('1 run(s): '+str(round(2*500/3600.+4*400/3600.))+' node hours so far, about '+str(round(cost))+' to go')
@@ -0,0 +1,46 @@
+import os
+import stat
+
+def write(path,text):
+    with open(str(path),'w') as handle:
+        handle.write(text)
+    return str(path)
+
+def test_sha1sum(setup,tmp_path):
+    f=write(tmp_path/'a',"hello\n")
+    assert setup.sha1sum(f)=='f572d396fae9206628714fb2ce00f72e94f2258f'
+    #a change is seen (the size changes with it here, so whatever the mtime resolution)
+    write(tmp_path/'a',"hello again\n")
+    assert setup.sha1sum(f)!='f572d396fae9206628714fb2ce00f72e94f2258f'
+
+def test_same_file_stored_once(setup,tmp_path):
+    store=str(tmp_path/'store')+'/'
+    a=write(tmp_path/'a.xml',"<xml/>\n")
+    b=write(tmp_path/'b.xml',"<xml/>\n")
+    for r in ['r1','r2']:
+        os.mkdir(str(tmp_path/r))
+    assert setup.tmplcopy(a,str(tmp_path/'r1'/'a.xml'),store)=='link'
+    assert setup.tmplcopy(b,str(tmp_path/'r2'/'b.xml'),store)=='link'
+    assert os.listdir(store)==[setup.sha1sum(a)]
+    assert os.stat(str(tmp_path/'r1'/'a.xml')).st_ino==os.stat(str(tmp_path/'r2'/'b.xml')).st_ino==os.stat(store+setup.sha1sum(a)).st_ino
+    #so writing through one of the links can't change every run
+    assert not os.stat(store+setup.sha1sum(a)).st_mode & (stat.S_IWUSR|stat.S_IWGRP|stat.S_IWOTH)
+
+def test_mutable_files_are_copies(setup,tmp_path):
+    store=str(tmp_path/'store')+'/'
+    os.mkdir(str(tmp_path/'r1'))
+    n=write(tmp_path/'namelist_cfg',"&namrun\n/\n")
+    assert setup.tmplcopy(n,str(tmp_path/'r1'/'namelist_cfg'),store)=='copy'
+    assert not os.path.exists(store)
+    assert os.stat(str(tmp_path/'r1'/'namelist_cfg')).st_ino!=os.stat(n).st_ino
+
+def test_tmplfolder(setup,tmp_path,capsys):
+    os.mkdir(str(tmp_path/'tmpl'))
+    os.mkdir(str(tmp_path/'tmpl'/'sub'))
+    os.mkdir(str(tmp_path/'run'))
+    write(tmp_path/'tmpl'/'iodef.xml',"<iodef/>\n")
+    write(tmp_path/'tmpl'/'file_def_nemo.xml',"<file_def/>\n")
+    write(tmp_path/'tmpl'/'namelist_ref',"&namrun\n/\n")
+    setup.tmplfolder(str(tmp_path/'tmpl')+'/',str(tmp_path/'run')+'/',str(tmp_path/'store')+'/')
+    assert sorted(os.listdir(str(tmp_path/'run')))==['file_def_nemo.xml','iodef.xml','namelist_ref']
+    assert '1 link, 0 reflink, 2 copy' in capsys.readouterr().out
@@ -0,0 +1,126 @@
+import os
+import subprocess
+import pytest
+
+#stand-ins for what the loop runs, each call goes in calls
+STUBS='''
+SLURM_JOB_ID=42
+python() { echo "python $*" >> $cwd/calls; }
+srun() { echo "srun $*" >> $cwd/calls; }
+sbatch() { echo "sbatch $*" >> $cwd/calls; }
+'''
+
+def script(setup,tmp_path,yend,ypack,**kw):
+    """goNEMO script of just the year loop of wryears, from year 1 in tmp_path"""
+    run=str(tmp_path)
+    f=os.path.join(run,'go.sh')
+    with open(f,'w') as handle:
+        handle.write('#!/bin/bash\n')
+        handle.write('cwd='+run+'\n')
+        handle.write('cd $cwd\n')
+        handle.write("echo 'year=1' > time.year.step\n")
+        handle.write('source time.year.step\n')
+        setup.wryears(handle,run,256,yend,ypack,**kw)
+    subprocess.check_call(['bash','-n',f])
+    with open(f,'r') as handle:
+        return f,handle.read()
+
+def launch(tmp_path,f,pre=''):
+    """run the loop with the stubs, returns the calls it made"""
+    os.makedirs(str(tmp_path/'.packrun'),exist_ok=True)
+    subprocess.check_call(['bash','-c',STUBS+pre+'source '+f],cwd=str(tmp_path))
+    with open(str(tmp_path/'calls'),'r') as handle:
+        return [l.strip() for l in handle]
+
+def year(tmp_path):
+    with open(str(tmp_path/'time.year.step'),'r') as handle:
+        return handle.read().strip()
+
+def test_a_year_a_launch(setup,tmp_path):
+    f,s=script(setup,tmp_path,4,1)
+    assert '    npack=1\n' in s
+    assert 'packNEMO.py' not in s and 'posts' not in s and 'spinup.done' not in s and 'decompNEMO' not in s
+    assert s.index('srun --ntasks=256 ./nemo.exe')<s.index('python postNEMO.py')<s.index('    wait\n')
+    calls=launch(tmp_path,f)
+    assert [c for c in calls if 'nemo.exe' in c]==['srun --ntasks=256 ./nemo.exe']*3
+    assert len([c for c in calls if 'restarts.py tidy' in c])==3
+    assert year(tmp_path)=='year=4'
+
+def test_packed(setup,tmp_path):
+    f,s=script(setup,tmp_path,8,3,stream=True)
+    assert '    if [ $npack -gt 3 ]; then npack=3; fi\n' in s
+    assert s.index('python packNEMO.py stretch $npack')<s.index('./nemo.exe')<s.index('python packNEMO.py year $k')
+    calls=launch(tmp_path,f)
+    #a stretch never goes past yend
+    assert [c for c in calls if 'stretch' in c]==['python packNEMO.py stretch 3','python packNEMO.py stretch 3','python packNEMO.py stretch 1']
+    assert [c for c in calls if 'streamNEMO' in c]==['python streamNEMO.py fold '+str(y) for y in range(1,8)]
+    assert year(tmp_path)=='year=8'
+
+def test_pipelined(setup,tmp_path):
+    f,s=script(setup,tmp_path,6,2,pipeline=True,timing=[2,'production'],decomp=True,equil=True,zarr='/x/s.zarr')
+    assert 'posts() {' in s and 'postwait() {' in s
+    assert 'while [ $year -lt 6 ] && [ ! -f spinup.done ]' in s
+    #ln_timing goes in before packNEMO.py launch copies namelist_cfg, the last launch's posts start after it
+    assert s.index('profileNEMO.py switch $year $npack 2 production')<s.index('packNEMO.py launch $npack $year')<\
+           s.index('    posts\n')<s.index('cd .packrun')<s.index('./nemo.exe')<s.index('python decompNEMO.py check || { cd')<\
+           s.index('    postwait\n')<s.index('python packNEMO.py hand')
+    assert s.rstrip().endswith('postwait\ncd $cwd\nsource time.year.step')
+    calls=launch(tmp_path,f)
+    assert [c for c in calls if 'launch' in c]==['python packNEMO.py launch 2 1','python packNEMO.py launch 2 3','python packNEMO.py launch 1 5']
+    assert sorted([c for c in calls if 'equilNEMO' in c])==['python equilNEMO.py check '+str(y) for y in range(1,6)]
+    assert len([c for c in calls if 'zarrNEMO.py append' in c and c.endswith('/x/s.zarr')])==5
+    assert len([c for c in calls if 'postNEMO.py' in c and '--cpu-bind=map_cpu:127' in c])==5
+    assert year(tmp_path)=='year=6'
+
+def test_pipelined_stops_once_settled(setup,tmp_path):
+    f,s=script(setup,tmp_path,20,2,pipeline=True,equil=True)
+    calls=launch(tmp_path,f,'python() { echo "python $*" >> $cwd/calls; [ "$1 $2" == "packNEMO.py launch" ] && [ $4 -ge 3 ] && touch spinup.done; true; }\n')
+    #the launch from year 3 goes ahead, its posts are done after the loop
+    assert [c for c in calls if 'launch' in c]==['python packNEMO.py launch 2 1','python packNEMO.py launch 2 3']
+    assert len([c for c in calls if 'postNEMO.py' in c])==4
+    assert year(tmp_path)=='year=5'
+
+@pytest.mark.parametrize('ypack,pipeline',[(1,False),(4,False),(4,True)])
+def test_resubmit(setup,tmp_path,ypack,pipeline):
+    f,s=script(setup,tmp_path,10,ypack,pipeline=pipeline,resubmit='/r/goNEMOproduction.sh',phase='spinup')
+    assert 'sbatch --dependency=afterany:$SLURM_JOB_ID /r/goNEMOproduction.sh' in s
+    assert ('if [ $npack -gt $nfit ]; then npack=$nfit; fi' in s)==(ypack>1)
+    assert s.index('tlaunch=`date +%s`')<s.index('python preNEMO.py')
+    assert s.index('>> '+str(tmp_path)+'/time.year.log')>s.index('./nemo.exe')
+    #a year takes 100s and 50s of the job is left: the first launch always goes ahead (one year of it), the next doesn't fit
+    with open(str(tmp_path/'time.year.log'),'w') as handle:
+        handle.write('1 1 100\n')
+    calls=launch(tmp_path,f,'tstart=`date +%s`; twall=150; tspare=100\n')
+    assert [c for c in calls if c.startswith('sbatch')]==['sbatch --dependency=afterany:42 /r/goNEMOproduction.sh']
+    assert len([c for c in calls if 'nemo.exe' in c])==1
+    assert year(tmp_path)=='year=2'
+    if pipeline:
+        #the posts of the launch are done before it resubmits
+        assert calls.index('sbatch --dependency=afterany:42 /r/goNEMOproduction.sh')>\
+               max([i for i,c in enumerate(calls) if 'postNEMO.py' in c])
+
+def test_resubmit_cuts_a_stretch_down(setup,tmp_path):
+    f,s=script(setup,tmp_path,10,4,resubmit='/r/goNEMOproduction.sh')
+    with open(str(tmp_path/'time.year.log'),'w') as handle:
+        handle.write('1 1 100\n')
+    calls=launch(tmp_path,f,'tstart=`date +%s`; twall=350; tspare=100\n')
+    assert [c for c in calls if 'stretch' in c][0]=='python packNEMO.py stretch 2'
+
+def test_resubmit_logs_each_launch(setup,tmp_path):
+    f,s=script(setup,tmp_path,8,3,resubmit='/r/goNEMOproduction.sh')
+    calls=launch(tmp_path,f,'tstart=`date +%s`; twall=86222; tspare=900\n')
+    assert [c for c in calls if c.startswith('sbatch')]==[]
+    #first year, years and seconds per year of every launch
+    with open(str(tmp_path/'time.year.log'),'r') as handle:
+        log=[l.split() for l in handle]
+    assert [l[:2] for l in log]==[['1','3'],['4','3'],['7','1']]
+    assert all([int(l[2])>=0 for l in log])
+
+@pytest.mark.parametrize('slow,resubmits',[(['1 1 10000']+['2 1 100']*5,False),(['2 1 100']*4+['6 1 10000'],True)])
+def test_resubmit_goes_by_the_slowest_of_the_last_5(setup,tmp_path,slow,resubmits):
+    f,s=script(setup,tmp_path,3,1,resubmit='/r/goNEMOproduction.sh')
+    with open(str(tmp_path/'time.year.log'),'w') as handle:
+        handle.write('\n'.join(slow)+'\n')
+    calls=launch(tmp_path,f,'tstart=`date +%s`; twall=5000; tspare=900\n')
+    assert ([c for c in calls if c.startswith('sbatch')]!=[])==resubmits
+    assert year(tmp_path)==('year=2' if resubmits else 'year=3')
@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+zarr=pytest.importorskip('zarr')
+import zarrNEMO
+
+def member(tmp_path,nc,name,years):
+    """run folder name (3 years), with 1m_grid_T outputs of two records for years, toce is the year + the member's number"""
+    r=str(tmp_path/name)
+    os.makedirs(r)
+    with open(r+'/rPARAMS.py','w') as handle:
+        handle.write("rP_YEAR_MAX='3'\n")
+    for y in years:
+        d=r+'/OUTNEMO_'+str(y).zfill(4)
+        os.makedirs(d)
+        toce=np.ma.masked_array(np.zeros((2,3,4,5))+y+int(name[-1])/10.,mask=np.zeros((2,3,4,5),bool))
+        toce.mask[:,:,0,0]=True
+        nc(d+'/'+name+'_1m_'+str(y).zfill(4)+'0101_'+str(y).zfill(4)+'1231_grid_T.nc',{'time_counter':None,'deptht':3,'y':4,'x':5},
+           {'time_counter':(('time_counter',),np.array([15.,45.])+360*(y-1)),'toce':(('time_counter','deptht','y','x'),toce),
+            'sst':(('time_counter','y','x'),np.zeros((2,4,5))-y),'nav_lat':(('y','x'),np.ones((4,5)))})
+        nc(d+'/'+name+'_1y_'+str(y).zfill(4)+'0101_'+str(y).zfill(4)+'1231_grid_U.nc',{'time_counter':None,'y':4,'x':5},
+           {'uos':(('time_counter','y','x'),np.zeros((1,4,5)))})
+    return r
+
+def test_init_append_load(tmp_path,nc):
+    store=str(tmp_path/'s.zarr')
+    a=member(tmp_path,nc,'m1',[1,2])
+    b=member(tmp_path,nc,'m2',[1])
+    assert zarrNEMO.init(store,{'1m_grid_T':['toce']},['m1','m2'])==['m1','m2']
+    #year 2 of m1 brings year 1 in with it
+    zarrNEMO.append(store,2,a)
+    zarrNEMO.append(store,1,b)
+    g=zarr.open_group(store,mode='r')['1m_grid_T']
+    assert list(g.array_keys())==sorted(['done','member','nav_lat','time','toce','year'])
+    assert g['toce'].shape==(2,3,2,3,4,5) and g['toce'].chunks==(1,1,1,3,4,5)
+    assert (g['done'][...]==[[1,1,0],[1,0,0]]).all()
+    ds=zarrNEMO.load(store,'1m_grid_T')
+    assert list(ds.toce.dims)==['member','year','time_counter','deptht','y','x']
+    toce=ds.toce.values
+    assert np.isclose(toce[0,1,:,:,1:,1:],2.1).all() and np.isclose(toce[1,0,:,:,1:,1:],1.2).all()
+    #land (masked in the netCDF) and years not in are NaN
+    assert np.isnan(toce[:,:,:,:,0,0]).all() and np.isnan(toce[1,1:]).all() and np.isnan(toce[0,2]).all()
+    assert (ds.time.values[0,1]==[375.,405.]).all()
+    assert list(ds.member.values)==['m1','m2']
+
+def test_append_again_and_new_members(tmp_path,nc,capsys):
+    store=str(tmp_path/'s.zarr')
+    a=member(tmp_path,nc,'m1',[1])
+    zarrNEMO.init(store,{'1m_grid_T':[]},['m1'])
+    zarrNEMO.append(store,1,a)
+    zarrNEMO.append(store,1,a)
+    assert capsys.readouterr().out.count('m1 year 1 1m_grid_T')==1
+    #[] is all the fields of the file
+    assert sorted(zarr.open_group(store,mode='r')['1m_grid_T'].array_keys())==['done','member','nav_lat','sst','time','toce','year']
+    #a member set up later, the fields stay as they were
+    b=member(tmp_path,nc,'m2',[1])
+    assert zarrNEMO.init(store,{'1y_grid_U':[]},['m1','m2'])==['m2']
+    assert 'keeping those' in capsys.readouterr().out
+    zarrNEMO.append(store,1,b)
+    g=zarr.open_group(store,mode='r')['1m_grid_T']
+    assert g['sst'].shape[0]==2 and list(g['member'][...])==['m1','m2']
+    assert (g['done'][...]==[[1,0,0],[1,0,0]]).all()
+    assert 'm2' in list(zarrNEMO.load(store,'1m_grid_T').member.values)
+    with pytest.raises(AssertionError):
+        zarrNEMO.append(store,1,member(tmp_path,nc,'m3',[1]))
+
+def test_status(tmp_path,nc):
+    store=str(tmp_path/'s.zarr')
+    a=member(tmp_path,nc,'m1',[1,2])
+    zarrNEMO.init(store,{'1m_grid_T':['sst']},['m1','m2'])
+    zarrNEMO.append(store,2,a)
+    out=subprocess.run([sys.executable,zarrNEMO.__file__,'status',store],capture_output=True,text=True)
+    assert out.returncode==0,out.stderr
+    lines=out.stdout.splitlines()
+    assert lines[0].startswith(store+': 2 members')
+    assert lines[2].split()==['m1','2','years','(1-2)'] and lines[3].split()==['m2','0','years']